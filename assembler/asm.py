@@ -1,387 +1,555 @@
-from rich.traceback import install
-install(show_locals=True)
+from array import array
+
+import io
+
+from expr import Expression, Resolver, compile_expression, symbolic, value_of
+from ir import Program
+from lexer import OPERAND, STATEMENT
+from listing import write_listing
+from macros import Macros
+from peephole import format_report, optimise
+from phases import NULL_PROFILER, Profiler
+from opcodes import ENCODE, ENCODE_ILLEGAL, INSTRUCTIONS, INSTRUCTIONS_ILLEGAL, ZEROPAGE_MODE
+from timing import analyse, annotate, format_warnings
+
+# layout entry for lines that emit nothing
+NO_CODE = (None, None, 0)
+
+ZEROPAGE_MODES = set(ZEROPAGE_MODE.values())
+ABSOLUTE_MODE = {zp: mode for mode, zp in ZEROPAGE_MODE.items()}
+
+
+def too_narrow(entry, value, symbols):
+    """
+    True if entry is a zero page encoding and value names a symbol, or is
+    an expression, that doesn't fit in a byte (or isn't defined yet).
+    symbols may also be a Resolver.
+    """
+    if entry[0] not in ZEROPAGE_MODES or not symbolic(value):
+        return False
+    value = symbols(value) if isinstance(symbols, Resolver) else value_of(value, symbols)
+    return value is None or value >= 0x100
+
+
+def check_zeropage(opcode, mode, symbol, value):
+    """
+    Raise ValueError if a symbol's value doesn't fit the zero page mode it
+    was left in, which only happens where there is no absolute form.
+    """
+    if not 0 <= value < 0x100:
+        raise ValueError(f"Invalid addressing mode '{ABSOLUTE_MODE[mode]}' for opcode "
+                         f"{opcode}: {symbol} is ${value:04X}, outside zero page")
+
+
+class NumberedLines:
+    """
+    (line number, text) pairs of lines, numbered from 1, keeping count of
+    the lines read so far for the profiler.
+    """
+
+    def __init__(self, lines):
+        self.lines = lines
+        self.count = 0
+
+    def __iter__(self):
+        for number, text in enumerate(self.lines, 1):
+            self.count = number
+            yield number, text
+
 
 # TODO add ORD and Data Directives
-# TODO write listings file
 # TODO improve error messages
 
 class Assembler:
-    def __init__(self):
-        # Extended instruction set with more addressing modes (not exhaustive)
-        # Only some mnemonics are shown; add more as needed.
-        self.instructions = {
-            'LDA': {
-                'immediate': 0xA9,
-                'zeropage': 0xA5,
-                'zeropage_x': 0xB5,
-                'absolute': 0xAD,
-                'absolute_x': 0xBD,
-                'absolute_y': 0xB9,
-                'indirect_x': 0xA1,
-                'indirect_y': 0xB1
-            },
-            'STA': {
-                'zeropage': 0x85,
-                'zeropage_x': 0x95,
-                'absolute': 0x8D,
-                'absolute_x': 0x9D,
-                'absolute_y': 0x99,
-                'indirect_x': 0x81,
-                'indirect_y': 0x91
-            },
-            'ADC': {
-                'immediate': 0x69,
-                'zeropage': 0x65,
-                'zeropage_x': 0x75,
-                'absolute': 0x6D,
-                'absolute_x': 0x7D,
-                'absolute_y': 0x79,
-                'indirect_x': 0x61,
-                'indirect_y': 0x71
-            },
-            'SBC': {
-                'immediate': 0xE9,
-                'zeropage': 0xE5,
-                'zeropage_x': 0xF5,
-                'absolute': 0xED,
-                'absolute_x': 0xFD,
-                'absolute_y': 0xF9,
-                'indirect_x': 0xE1,
-                'indirect_y': 0xF1
-            },
-            'CMP': {
-                'immediate': 0xC9,
-                'zeropage': 0xC5,
-                'zeropage_x': 0xD5,
-                'absolute': 0xCD,
-                'absolute_x': 0xDD,
-                'absolute_y': 0xD9,
-                'indirect_x': 0xC1,
-                'indirect_y': 0xD1
-            },
-            'JMP': {
-                'absolute': 0x4C,
-                'indirect': 0x6C  # JMP ($xxxx)
-            },
-            'BEQ': {'relative': 0xF0},
-            'BNE': {'relative': 0xD0},
-            'INX': {'implied': 0xE8},
-            'DEX': {'implied': 0xCA}
-        }
+    def __init__(self, illegal=False, predefined=None, optimise=False, profiler=None):
+        # Encoding comes from the shared opcode table: ENCODE maps
+        # (mnemonic, mode) -> (opcode, length, cycles).  illegal=True also
+        # accepts the stable undocumented opcodes.  predefined symbols are
+        # in scope before the first line, e.g. hardware registers.
+        # optimise=True runs the peephole pass (peephole.py) between
+        # parsing and layout; its changes are kept in peephole.
+        # profiler (phases.py) times each phase of assemble().
+        if illegal:
+            self.instructions = INSTRUCTIONS_ILLEGAL
+            self.encode = ENCODE_ILLEGAL
+        else:
+            self.instructions = INSTRUCTIONS
+            self.encode = ENCODE
+        self.predefined = dict(predefined or {})
         self.symbols = {}
-        self.output = []
-        self.line_info = []
+        self.output = bytearray()
+        self.program = Program()
+        self.form_encodings = []
+        self.savings = {}
+        self.line_count = 0
+        self.optimise = optimise
+        self.peephole = []
+        self.profiler = profiler or NULL_PROFILER
+        # parse_line results by line text; kernels repeat lines like
+        # "sta WSYNC" many times over
+        self.parse_cache = {}
 
     def parse_value(self, value_str):
         """
         Convert a string value to integer, handling:
           - Hex notation like $A9 or $FF00
-          - Decimal (if no $)
+          - Binary like %1010
+          - Decimal (if it starts with a digit)
+          - Expressions of those, e.g. SCREEN_H*2 or <table+1 (see expr.py)
+        A symbol name comes back as a string and an expression naming
+        symbols as an Expression, to be resolved when the instruction is
+        encoded; constant expressions are folded here.
         """
-        value_str = value_str.strip()
-        if value_str.startswith("$"):
-            return int(value_str[1:], 16)
-        return int(value_str)
+        return compile_expression(value_str)
 
     def parse_operand(self, operand):
         """
         Parse an operand into (addressing_mode, value).
         We handle the following forms:
           #$xx        => immediate
-          $xx         => zero page or absolute
-          $xx,X       => zero page,X or absolute,X
-          $xx,Y       => zero page,Y or absolute,Y
+          $xx         => absolute (narrowed to zero page when encoding)
+          $xx,X       => absolute,X (or zero page,X)
+          $xx,Y       => absolute,Y (or zero page,Y)
           ($xx,X)     => (indirect,X)
           ($xx),Y     => (indirect),Y
           ($xxxx)     => indirect
-          label       => symbol (later resolved to zero page / absolute)
-          etc.
+        Any of the $xx values may be a label instead, in which case the value
+        is the label's name.  lexer.OPERAND has a group for each form, named
+        after its mode.
         """
-        operand = operand.strip()
+        match = OPERAND.match(operand)
+        if match is not None:
+            mode = match.lastgroup
+            if mode == "accumulator":
+                # e.g. "ASL A"
+                return mode, None
+            return mode, self.parse_value(match.group(mode))
 
-        # Immediate addressing (e.g. "#$10")
-        if operand.startswith("#"):
-            return "immediate", self.parse_value(operand[1:])
-
-        # Check for parentheses => indirect or (indirect_x)/(indirect_y)
-        if operand.startswith("(") and operand.endswith(")"):
-            # e.g. "($10,X)" or "($10),Y" or "($1000)"
-            inner = operand[1:-1].strip()
-
-            # If there's a comma inside the parentheses
-            if "," in inner:
-                # e.g. ($10,X)
-                parts = inner.split(",")
-                base_str = parts[0].strip()   # e.g. "$10"
-                reg_str = parts[1].strip().upper()  # "X" or "Y" presumably
-                if reg_str == "X":
-                    # Indirect,X
-                    return "indirect_x", self.parse_value(base_str)
-                else:
-                    raise ValueError(f"Unsupported register {reg_str} in indirect addressing")
-            else:
-                # e.g. "($10),Y" => note that the operand ends with ")"
-                # Actually means something like "($10),Y" => indirect_y
-                if operand.endswith("),Y"):
-                    # strip the trailing ",Y"
-                    # operand = ($10),Y
-                    # so inside parentheses is "$10"
-                    # Then parse the base.
-                    base_inner = operand[:-3]  # remove ",Y"
-                    base_inner = base_inner[1:-1].strip()  # remove outer parentheses
-                    return "indirect_y", self.parse_value(base_inner)
-                else:
-                    # Plain indirect e.g. "($1000)" for JMP
-                    return "indirect", self.parse_value(inner)
-
-        # If there's a comma but no parentheses => absolute_x, absolute_y, ...
+        operand = operand.strip()
+        if operand.startswith("("):
+            inner = operand[1:-1]
+            if operand.endswith(")") and "," in inner:
+                reg_str = inner.split(",", 1)[1].strip().upper()
+                raise ValueError(f"Unsupported register {reg_str} in indirect addressing")
+            raise ValueError(f"Unbalanced parentheses in operand {operand}")
         if "," in operand:
-            # e.g. "$1234,X" or "$80,Y"
-            parts = operand.split(",")
-            base_str = parts[0].strip()  # e.g. "$1234"
-            reg_str = parts[1].strip().upper()  # e.g. "X" or "Y"
-            base_val = self.parse_value(base_str)
-
-            # Distinguish zero page vs absolute
-            if base_val < 0x100:
-                if reg_str == "X":
-                    return "zeropage_x", base_val
-                elif reg_str == "Y":
-                    return "zeropage_y", base_val
-                else:
-                    raise ValueError(f"Invalid register {reg_str}")
-            else:
-                if reg_str == "X":
-                    return "absolute_x", base_val
-                elif reg_str == "Y":
-                    return "absolute_y", base_val
-                else:
-                    raise ValueError(f"Invalid register {reg_str}")
-
-        # Plain "$xxxx" or "$xx" => might be zero page or absolute
-        if operand.startswith("$"):
-            base_val = self.parse_value(operand)
-            if base_val < 0x100:
-                return "zeropage", base_val
-            else:
-                return "absolute", base_val
-
-        # If it doesn’t match any special prefix => assume symbol
-        return "symbol", operand
-
-    def get_instruction_length(self, opcode, addr_mode):
-        # If we see 'symbol' in the first pass, guess a length:
-        if addr_mode == "symbol":
-            # Branch => 2 bytes
-            if opcode in ["BEQ", "BNE", "BCC", "BCS", "BMI", "BPL", "BVC", "BVS"]:
-                return 2
-            # JMP or JSR => definitely 3
-            if opcode in ["JMP", "JSR"]:
-                return 3
-            # Else guess 3 for safety (typical for absolute).
-            return 3
-        
-        # Normal known modes:
-        if addr_mode == "implied":
-            return 1
-        elif addr_mode in ["immediate", "zeropage", "relative",
-                           "zeropage_x", "zeropage_y", "indirect_x", "indirect_y"]:
-            return 2
-        elif addr_mode in ["absolute", "absolute_x", "absolute_y", "indirect"]:
-            return 3
-
-        raise ValueError(f"Unknown addressing mode: {addr_mode}")
+            reg_str = operand.split(",", 1)[1].strip().upper()
+            raise ValueError(f"Invalid register {reg_str}")
+        raise ValueError(f"Invalid operand {operand}")
 
     def parse_line(self, line):
-        # 1) Remove anything after the first semicolon
-        line = line.split(";", 1)[0].strip()
-        
-        # 2) Skip empty lines
-        if not line:
-            return None
-
-        # 3) Check for label
-        if ":" in line:
-            label, rest = line.split(":", 1)
-            label = label.strip()
-            rest = rest.strip()
-            return {"type": "label", "label": label, "rest": rest}
-
-        # 4) Extract opcode and operand
-        parts = line.split(maxsplit=1)
-        opcode = parts[0].upper()
+        """
+        Parse one source line into (label, opcode, mode, value).
+        Returns None for blank and comment-only lines; a line holding only a
+        label comes back as (label, None, None, None) and an equate as
+        (name, "=", None, value).  lexer.STATEMENT splits the line up.
+        """
+        match = STATEMENT.match(line)
+        if match is None:
+            word = line.split(";", 1)[0].split()[0]
+            raise ValueError(f"Unknown instruction: {word.upper()}")
+        label, name, equals, equ, operand = match.groups()
+
+        # Blank and comment-only lines
+        if name is None:
+            return None if label is None else (label, None, None, None)
 
+        # Equates: "NAME = value" or "NAME EQU value"
+        if equals or equ:
+            return name, "=", None, self.parse_value(operand)
+
+        opcode = name.upper()
         if opcode not in self.instructions:
             raise ValueError(f"Unknown instruction: {opcode}")
 
-        if len(parts) == 1:
+        if not operand:
             # e.g. INX (implied mode)
-            return {
-                "type": "instruction",
-                "opcode": opcode,
-                "mode": "implied",
-                "value": None
-            }
-        else:
-            # e.g. LDA #$05
-            mode, value = self.parse_operand(parts[1])
-            return {
-                "type": "instruction",
-                "opcode": opcode,
-                "mode": mode,
-                "value": value
-            }
-
-    def first_pass(self, lines):
+            return label, opcode, "implied", None
+
+        # e.g. LDA #$05
+        mode, value = self.parse_operand(operand)
+        return label, opcode, mode, value
+
+    def parse_cached(self, line):
+        try:
+            return self.parse_cache[line]
+        except KeyError:
+            parsed = self.parse_cache[line] = self.parse_line(line)
+            return parsed
+
+    def assemble(self, source):
         """
-        First pass: 
-          - Collect symbols (labels) and their corresponding addresses. 
-          - Record each instruction's address in line_info.
+        Assemble source code into machine code (bytes).  source is the text,
+        or an iterable of lines such as an open file, which is read line by
+        line and never held whole.
+
+        Every line is parsed first, with macros and REPT blocks expanded
+        (see macros.py), then addresses are settled by relaxation.  An
+        operand naming a symbol starts out in its smallest encoding, zero
+        page where the instruction has one, and is widened to absolute when
+        a pass finds the symbol's value doesn't fit in a byte.  Widening only
+        grows the code, so the passes stop once nothing changes, with each
+        operand in the smallest encoding that holds its value.  A last pass
+        emits the bytes.  With optimise set the peephole pass rewrites the
+        parsed lines first.
+
+        The parsed lines are kept in program, columns of integers with
+        each distinct line stored once (see ir.py).
+
+        With a profiler each of parse (tokenise and optimise within it),
+        relax and emit is timed and counted.
+
+        savings reports what that bought over taking every forward reference
+        as absolute: operands narrowed, bytes and cycles saved, and passes.
+
+        records then lists the lines' addresses and lengths.
         """
-        current_address = 0
-        self.line_info = []
+        encode = self.encode
+        symbols = self.symbols = dict(self.predefined)
+        profiler = self.profiler
+
+        with profiler.phase("parse") as phase:
+            if isinstance(source, str):
+                source = io.StringIO(source)
+            if self.optimise:
+                # the optimiser's report quotes the lines it changed
+                source_lines = [line.rstrip("\r\n") for line in source]
+                lines = NumberedLines(source_lines)
+            else:
+                # read line by line rather than holding a list of every line
+                lines = NumberedLines(source)
+            expanded = Macros(profiler.timed("tokenise", self.parse_cached)).expand(lines)
+            if self.optimise:
+                parsed_lines = [(number, *parsed) for number, parsed in expanded if parsed is not None]
+                with profiler.phase("optimise") as inner:
+                    parsed_lines, self.peephole = optimise(parsed_lines, source_lines, symbols, encode)
+                    inner.count(instructions=len(parsed_lines))
+                expanded = ((line[0], line[1:]) for line in parsed_lines)
+
+            program = self.program = Program()
+            encodings = self.form_encodings = []
+            defined = set(symbols)
+            for number, parsed in expanded:
+                if parsed is None:
+                    continue
+                label, opcode, mode, value = parsed
+                if label is not None:
+                    defined.add(label)
+                if isinstance(value, str):
+                    forward = value not in defined
+                elif isinstance(value, Expression):
+                    forward = not defined.issuperset(value.names)
+                else:
+                    forward = False
+                _, new = program.append(number, parsed, forward)
+                if new:
+                    encodings.append(None if opcode is None or opcode == "="
+                                     else self.encodings(opcode, mode, value))
+            program.finish()
+            # the program's forms hold each distinct line now; the line text
+            # keys of the cache would only add to the peak
+            self.parse_cache.clear()
+            self.line_count = lines.count
+            phase.count(lines=lines.count, records=len(program),
+                        forms=len(program.forms))
+        forms = program.forms
+        form_ids = program.form_ids
+        wide = program.wide
+
+        # ----- Relaxation -----
+        with profiler.phase("relax") as phase:
+            # only lines whose zero page form rests on a symbol can be widened
+            narrowable = [entry is not None and entry[0][0] in ZEROPAGE_MODES and symbolic(form[3])
+                          for form, entry in zip(forms, encodings)]
+            candidates = array("I", (index for index, form_id in enumerate(form_ids)
+                                     if narrowable[form_id]))
+            # expressions are evaluated once per layout, however many lines
+            # share them
+            resolve = Resolver(symbols)
+            passes = 0
+            while True:
+                passes += 1
+                self.lay_out(program)
+                resolve.new_version()
+                grown = False
+                for index in candidates:
+                    form_id = form_ids[index]
+                    if not wide[index] and too_narrow(encodings[form_id][0], forms[form_id][3], resolve):
+                        wide[index] = 1
+                        grown = True
+                if not grown:
+                    break
+            phase.count(passes=passes, candidates=len(candidates))
+
+        # ----- Emit -----
+        with profiler.phase("emit") as phase:
+            output = bytearray()
+            forward = program.forward
+            narrowed = saved_bytes = saved_cycles = 0
+            instructions = 0
+
+            for index, form_id in enumerate(form_ids):
+                entry = encodings[form_id]
+                if entry is None:
+                    continue
+                _, opcode, _, value = forms[form_id]
+                mode, op, length = entry[wide[index]]
+                address = len(output)
+                instructions += 1
+
+                symbol = None
+                if symbolic(value):
+                    symbol = value
+                    value = resolve(symbol)
+                    if value is None:
+                        raise ValueError(f"Undefined symbol: {symbol}")
+                    if mode in ZEROPAGE_MODES:
+                        check_zeropage(opcode, mode, symbol, value)
+                        absolute = encode.get((opcode, ABSOLUTE_MODE[mode]))
+                        if forward[index] and absolute is not None:
+                            narrowed += 1
+                            saved_bytes += absolute[1] - length
+                            saved_cycles += absolute[2] - encode[opcode, mode][2]
+
+                if mode == "relative":
+                    value = self.branch_offset(address, symbol, value)
+
+                if length == 1:
+                    output.append(op)
+                elif length == 2:
+                    output += bytes((op, value & 0xFF))
+                else:
+                    output += bytes((op, value & 0xFF, (value >> 8) & 0xFF))
+            phase.count(instructions=instructions, bytes=len(output))
 
-        for line in lines:
-            parsed = self.parse_line(line)
-            if not parsed:
-                self.line_info.append({"parsed": None, "address": None})
-                continue
+        self.savings = {"narrowed": narrowed, "bytes": saved_bytes,
+                        "cycles": saved_cycles, "passes": passes}
+        self.output = output
+        return bytes(output)
 
-            if parsed["type"] == "label":
-                # Mark label => current address
-                self.symbols[parsed["label"]] = current_address
-
-                # Possibly parse an instruction on the same line
-                if parsed["rest"]:
-                    instr = self.parse_line(parsed["rest"])
-                    if instr and instr["type"] == "instruction":
-                        self.line_info.append({"parsed": instr, "address": current_address})
-                        current_address += self.get_instruction_length(
-                            instr["opcode"], instr["mode"]
-                        )
-                    else:
-                        self.line_info.append({"parsed": None, "address": None})
-                else:
-                    self.line_info.append({"parsed": None, "address": None})
+    @property
+    def records(self):
+        """
+        (line number, address, length, label) for each line that emits
+        bytes or defines a label or equate, for the listing.  Made on the
+        fly from the columns of the last program assembled; a line that
+        expands to several instructions (a macro call or a REPT block) has
+        a record for each of them.
+        """
+        program = self.program
+        forms = program.forms
+        encodings = self.form_encodings
+        symbols = self.symbols
+        wide = program.wide
+        addresses = program.addresses
+        for index, (number, form_id) in enumerate(zip(program.numbers, program.form_ids)):
+            label, opcode, _, _ = forms[form_id]
+            entry = encodings[form_id]
+            if opcode == "=":
+                yield number, symbols.get(label, 0), 0, label
+            elif entry is None:
+                yield number, addresses[index], 0, label
+            else:
+                yield number, addresses[index], entry[wide[index]][2], label
 
-            elif parsed["type"] == "instruction":
-                self.line_info.append({"parsed": parsed, "address": current_address})
-                current_address += self.get_instruction_length(
-                    parsed["opcode"], parsed["mode"]
-                )
+    def timing_report(self):
+        """
+        Cycle counts and scanline spans of the last program assembled, see
+        timing.analyse().  Instructions are taken in address order with
+        their operands resolved, a branch's being its target.
+        """
+        program = self.program
+        forms = program.forms
+        encodings = self.form_encodings
+        symbols = self.symbols
+        wide = program.wide
+        addresses = program.addresses
+        instructions = []
+        for index, (number, form_id) in enumerate(zip(program.numbers, program.form_ids)):
+            entry = encodings[form_id]
+            if entry is None:
+                continue
+            _, opcode, _, value = forms[form_id]
+            mode, op, _ = entry[wide[index]]
+            instructions.append((number, addresses[index], op, opcode, mode,
+                                 self.encode[opcode, mode][2], value_of(value, symbols)))
+        return analyse(instructions)
 
-    def assemble(self, source):
-        """Assemble source code into machine code (bytes)."""
-        lines = source.splitlines()
-        
-        # ----- First Pass -----
-        self.first_pass(lines)
-
-        # ----- Second Pass -----
-        self.output = []
-        for i, line_data in enumerate(self.line_info):
-            parsed = line_data["parsed"]
-            line_address = line_data["address"]
-
-            if not parsed or parsed["type"] != "instruction":
+    def encodings(self, opcode, mode, value):
+        """
+        (narrow, wide) encodings of an instruction, each (mode, opcode byte,
+        length).  They differ only when the operand names a symbol: narrow
+        assumes its value will fit in a byte, wide that it won't.  STX zp,Y
+        and STY zp,X have no absolute form, so their wide encoding is the
+        narrow one, and emitting it checks that the value fits after all.
+        """
+        if not symbolic(value):
+            entry = self.select_mode(opcode, mode, value)
+            return entry, entry
+        narrow = self.select_mode(opcode, mode, 0)
+        try:
+            wide = self.select_mode(opcode, mode, 0x100)
+        except ValueError:
+            wide = narrow
+        return narrow, wide
+
+    def lay_out(self, program):
+        """
+        One relaxation pass: fill in program.addresses and the addresses of
+        labels and equates, taking the wide encoding for the lines flagged
+        in program.wide and the narrow one everywhere else.
+        """
+        symbols = self.symbols
+        forms = program.forms
+        encodings = self.form_encodings
+        wide = program.wide
+        addresses = program.addresses
+        address = 0
+        for index, form_id in enumerate(program.form_ids):
+            addresses[index] = address
+            label, opcode, _, value = forms[form_id]
+            if opcode == "=":
+                resolved = value_of(value, symbols)
+                if resolved is not None:
+                    symbols[label] = resolved
                 continue
+            if label is not None:
+                symbols[label] = address
+            entry = encodings[form_id]
+            if entry is not None:
+                address += entry[wide[index]][2]
 
-            opcode = parsed["opcode"]
-            mode = parsed["mode"]
-            value = parsed["value"]
-
-            # Symbol resolution
-            if mode == "symbol":
-                if value not in self.symbols:
-                    raise ValueError(f"Undefined symbol: {value}")
-                symbol_address = self.symbols[value]
-
-                # Some instructions must remain 'absolute' or 'zeropage' 
-                # or become 'relative' if it's a branch. But let's keep it simple:
-                # If it's a branch instruction, mode is already 'relative'.
-                # Otherwise, check if symbol fits in zero page or not:
-                if opcode == "JMP":
-                    # JMP absolute or indirect
-                    # We'll assume absolute if the user wrote "JMP symbol"
-                    mode = "absolute"  
-                    value = symbol_address
-                else:
-                    if symbol_address < 0x100:
-                        mode = "zeropage"
-                        value = symbol_address
-                    else:
-                        mode = "absolute"
-                        value = symbol_address
-
-            # If the instruction’s mode is 'relative' => branch offset
-            if mode == "relative":
-                # value is presumably a label. Ensure it's defined:
-                if value not in self.symbols:
-                    raise ValueError(f"Undefined symbol for branch: {value}")
-                branch_target = self.symbols[value]
-                offset = branch_target - (line_address + 2)  # next PC after opcode+offset
-                if not (-128 <= offset <= 127):
-                    raise ValueError(
-                        f"Branch out of range at ${line_address:04X} to '{value}' (${branch_target:04X})"
-                    )
-                offset &= 0xFF
-                value = offset
-
-            # Validate addressing mode in the instruction dictionary
-            if mode not in self.instructions[opcode]:
-                raise ValueError(f"Invalid addressing mode '{mode}' for opcode {opcode}")
-
-            # Emit the opcode
-            self.output.append(self.instructions[opcode][mode])
-
-            # Emit operand bytes based on mode
-            if mode in [
-                "immediate", "zeropage", "zeropage_x", "zeropage_y",
-                "relative", "indirect_x", "indirect_y"
-            ]:
-                self.output.append(value & 0xFF)
-            elif mode in ["absolute", "absolute_x", "absolute_y", "indirect"]:
-                self.output.append(value & 0xFF)
-                self.output.append((value >> 8) & 0xFF)
-            # "implied" => no extra bytes
-
-        return bytes(self.output)
+    def select_mode(self, opcode, mode, value):
+        """
+        Settle the addressing mode of a parsed instruction from the operand's
+        value.  Returns (mode, opcode byte, length).
+        """
+        encode = self.encode
+
+        if mode == "implied":
+            if (opcode, "implied") not in encode:
+                # "ASL" on its own means "ASL A"
+                mode = "accumulator"
+        elif mode == "absolute" and (opcode, "relative") in encode:
+            mode = "relative"
+        elif mode in ZEROPAGE_MODE:
+            # anything that fits in a byte uses the zero page form when
+            # there is one
+            zp_mode = ZEROPAGE_MODE[mode]
+            if value is not None and value < 0x100 and (opcode, zp_mode) in encode:
+                mode = zp_mode
+
+        # One table lookup gives the opcode and how many operand bytes follow
+        entry = encode.get((opcode, mode))
+        if entry is None:
+            raise ValueError(f"Invalid addressing mode '{mode}' for opcode {opcode}")
+        return mode, entry[0], entry[1]
+
+    def branch_offset(self, address, symbol, target):
+        offset = target - (address + 2)  # next PC after opcode+offset
+        if not (-128 <= offset <= 127):
+            raise ValueError(
+                f"Branch out of range at ${address:04X} to '{symbol}' (${target:04X})"
+            )
+        return offset & 0xFF
 
 
 def main():
-    import sys
+    import argparse
+    import json
     import os
-    
-    if len(sys.argv) != 2:
-        print("Usage: python assembler.py <input_file>")
-        sys.exit(1)
-        
-    input_file = sys.argv[1]
-    output_file = os.path.splitext(input_file)[0] + '.bin'
-    
+    import sys
+
+    parser = argparse.ArgumentParser(description="6502 assembler")
+    parser.add_argument("input_file")
+    parser.add_argument("-l", "--list", action="store_true",
+                        help="also print the listing on the console")
+    parser.add_argument("-O", "--optimise", action="store_true",
+                        help="run the peephole optimiser and report what it saved")
+    parser.add_argument("--timing", action="store_true",
+                        help="print the source with cycle counts and write <file>.timing.json")
+    parser.add_argument("--profile", nargs="?", const="", metavar="JSON",
+                        help="time each phase and print a table to stderr, or write "
+                             "JSON to the file given (- for stdout)")
+    args = parser.parse_args()
+
+    input_file = args.input_file
+    stem = os.path.splitext(input_file)[0]
+    output_file = stem + ".bin"
+    listing_file = stem + ".lst"
+    profiler = NULL_PROFILER if args.profile is None else Profiler(memory=True)
+
+    # the source is streamed from the file as it is parsed, and read again
+    # for the listing rather than kept
+    assembler = Assembler(optimise=args.optimise, profiler=profiler)
     try:
-        with open(input_file, 'r') as f:
-            source_code = f.read()
+        with open(input_file, "r") as f, profiler.phase("assemble"):
+            binary = assembler.assemble(f)
     except FileNotFoundError:
         print(f"Error: File '{input_file}' not found")
         sys.exit(1)
     except IOError as e:
         print(f"Error reading file: {e}")
         sys.exit(1)
-        
-    assembler = Assembler()
-    binary = assembler.assemble(source_code)
-    
-    # Print assembly listing
-    print("Assembly listing:")
-    for i, byte in enumerate(binary):
-        print(f"{i:04X}: {byte:02X}")
-        
+
+    def source_lines():
+        with open(input_file, "r") as f:
+            for line in f:
+                yield line.rstrip("\r\n")
+
+    with profiler.phase("timing") as phase:
+        report = assembler.timing_report()
+        phase.count(instructions=len(report["lines"]))
+    for message in format_warnings(report, os.path.basename(input_file)):
+        print(message, file=sys.stderr)
+
+    # Listing: source line, address, bytes, cycles and the running
+    # scanline total, and label, then the symbols defined by the program
+    # (not the predefined ones).  --timing prints the source with cycle
+    # counts as well, as 02/asm.py does.
+    with profiler.phase("listing") as phase:
+        symbols = {name: value for name, value in assembler.symbols.items()
+                   if name not in assembler.predefined}
+        with open(listing_file, "wb") as f:
+            write_listing(f, source_lines(), assembler.records, binary, symbols, timing=report)
+        if args.list:
+            write_listing(sys.stdout.buffer, source_lines(), assembler.records, binary, symbols,
+                          timing=report)
+            sys.stdout.flush()
+        if args.timing:
+            for line in annotate(source_lines(), report):
+                print(line)
+            with open(stem + ".timing.json", "w") as f:
+                json.dump(report, f, indent=1)
+        phase.count(lines=assembler.line_count)
+
     # Write binary output
-    with open(output_file, 'wb') as f:
-        f.write(binary)
-    print(f"\nBinary written to {output_file}")
-        
+    with profiler.phase("image") as phase:
+        with open(output_file, "wb") as f:
+            f.write(binary)
+        phase.count(bytes=len(binary))
+    print(f"Binary written to {output_file}, listing to {listing_file}")
+    savings = assembler.savings
+    print(f"Relaxation: {savings['narrowed']} forward references narrowed to zero page, "
+          f"saving {savings['bytes']} bytes and {savings['cycles']} cycles "
+          f"({savings['passes']} passes)")
+    if args.optimise:
+        for line in format_report(assembler.peephole):
+            print(line)
+
+    if args.profile == "":
+        for line in profiler.format():
+            print(line, file=sys.stderr)
+    elif args.profile == "-":
+        json.dump(profiler.report(), sys.stdout, indent=1)
+        print()
+    elif args.profile is not None:
+        with open(args.profile, "w") as f:
+            json.dump(profiler.report(), f, indent=1)
+
 
 if __name__ == "__main__":
+    from rich.traceback import install
+    install(show_locals=True)
+
     main()
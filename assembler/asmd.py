@@ -0,0 +1,359 @@
+"""
+Assembler daemon.
+
+Keeps the state of each source file's last build in a long running
+process so a rebuild costs only the assembly, not interpreter startup.
+asm sources (assembler/asm.py) get an IncrementalAssembler, so a rebuild
+costs only the lines that changed, unless they use macros or REPT
+blocks or are built with -O, which take a full Assembler build; 02 sources (02/asm.py, -f 02) are
+assembled in full by a Session, banked ones through its bank linker,
+with the include cache kept warm between builds.  Watched files are
+polled and their .bin rewritten whenever they, or a header they include,
+are saved.
+
+    python asmd.py serve                       start the server
+    python asmd.py build file.asm [-f 02] [-O] [-l]  build once, print errors (or listing)
+    python asmd.py watch file.asm [-f 02] [-O]       rebuild file.asm whenever it changes
+    python asmd.py unwatch file.asm
+    python asmd.py stop
+
+Client and server talk over a Unix socket, one JSON object per line each way.
+"""
+import argparse
+import json
+import os
+import socket
+import socketserver
+import sys
+import threading
+import time
+
+from asm import Assembler
+from frontends import load_asm02
+from incremental import IncrementalAssembler
+from listing import hex_dump_lines, listing_lines
+from macros import uses_expansion
+
+FRONTENDS = ("asm", "02")
+
+
+def default_socket_path():
+    runtime_dir = os.environ.get("XDG_RUNTIME_DIR")
+    if runtime_dir:
+        return os.path.join(runtime_dir, "asmd.sock")
+    return f"/tmp/asmd-{os.getuid()}.sock"
+
+
+def format_listing(project):
+    """
+    The listing of the last build, as the command line prints it: asm.py
+    -l's listing, cycle columns included, for asm, 02/asm.py --dump's hex
+    dump for 02.
+    """
+    if project.frontend == "02":
+        return "".join(hex_dump_lines(project.image))
+    if project.full is not None:
+        assembler = project.full
+        predefined = assembler.predefined
+        source_lines = project.source.splitlines()
+    else:
+        assembler = project.assembler
+        predefined = assembler.assembler.predefined
+        source_lines = [line.text for line in assembler.lines]
+    symbols = {name: value for name, value in assembler.symbols.items()
+               if name not in predefined}
+    return "".join(listing_lines(source_lines, assembler.records, project.image, symbols,
+                                 timing=assembler.timing_report()))
+
+
+def build_02(source, directory):
+    """
+    Assemble an 02/asm.py source.  Returns the image and the paths of the
+    headers it included.
+    """
+    asm02 = load_asm02()
+    header, banks = asm02.split_banks(source)
+    if banks:
+        sessions = dict(asm02.assemble_bank((number, header + lines, None, [directory]))
+                        for number, lines in sorted(banks.items()))
+        image = asm02.link_banks(sessions)
+    else:
+        session = asm02.Session(include_dirs=[directory])
+        sessions = {0: session}
+        image = session.assemble(source)
+    includes = [str(path) for session in sessions.values() for path in session.includes]
+    return bytes(image), list(dict.fromkeys(includes))
+
+
+def changed_ranges(old, new):
+    """(start, end) byte ranges where new differs from old, as update() gives."""
+    ranges = []
+    for index in range(max(len(old), len(new))):
+        if index < len(old) and index < len(new) and old[index] == new[index]:
+            continue
+        if ranges and ranges[-1][1] == index:
+            ranges[-1][1] = index + 1
+        else:
+            ranges.append([index, index + 1])
+    return [tuple(r) for r in ranges]
+
+
+class Project:
+    """
+    One source file, its assembler state and the last build result.
+    inputs holds the mtime of every file the last build read, the source
+    and its headers, which is what the watcher polls.  full is the
+    Assembler of the last build when it was a full one, for a source with
+    macros or REPT blocks or with optimise; source is its text.
+    """
+
+    def __init__(self, path, frontend="asm", optimise=False):
+        self.path = path
+        self.frontend = frontend
+        self.optimise = optimise
+        self.output_path = os.path.splitext(path)[0] + ".bin"
+        self.assembler = IncrementalAssembler() if frontend == "asm" else None
+        self.full = None
+        self.source = None
+        self.inputs = {}
+        self.image = None
+        self.error = None
+        self.lock = threading.Lock()
+
+    def build(self):
+        with self.lock:
+            start = time.perf_counter()
+            try:
+                # taken before reading, so a save during the build is noticed
+                self.inputs[self.path] = os.stat(self.path).st_mtime_ns
+                with open(self.path, "r") as f:
+                    source = f.read()
+                includes = []
+                if self.frontend == "02":
+                    image, includes = build_02(source, os.path.dirname(self.path))
+                    changed = changed_ranges(self.image or b"", image)
+                elif self.optimise or uses_expansion(source.splitlines()):
+                    # IncrementalAssembler takes lines one at a time
+                    self.full = Assembler(optimise=self.optimise)
+                    self.source = source
+                    image = self.full.assemble(source)
+                    changed = changed_ranges(self.image or b"", image)
+                    # its state no longer matches the image
+                    self.assembler = IncrementalAssembler()
+                else:
+                    image, changed = self.assembler.update(source)
+                    self.full = self.source = None
+            except (OSError, ValueError) as e:
+                self.error = str(e)
+                return {"ok": False, "path": self.path, "errors": [self.error]}
+            except Exception as e:
+                # a bad source can raise more than ValueError, e.g. an
+                # AssertionError or a struct.error
+                self.error = f"{type(e).__name__}: {e}" if str(e) else type(e).__name__
+                return {"ok": False, "path": self.path, "errors": [self.error]}
+
+            # a failed build keeps the last good build's headers in inputs,
+            # so fixing one of them triggers a rebuild
+            self.inputs = {self.path: self.inputs[self.path]}
+            for path in includes:
+                try:
+                    self.inputs[path] = os.stat(path).st_mtime_ns
+                except OSError:
+                    pass
+
+            self.error = None
+            if image != self.image:
+                with open(self.output_path, "wb") as f:
+                    f.write(image)
+                self.image = image
+
+            return {
+                "ok": True,
+                "path": self.path,
+                "output": self.output_path,
+                "size": len(image),
+                "changed": changed,
+                "includes": includes,
+                "ms": round((time.perf_counter() - start) * 1000, 3),
+            }
+
+    def stale(self):
+        for path, mtime in self.inputs.items():
+            try:
+                if os.stat(path).st_mtime_ns != mtime:
+                    return True
+            except OSError:
+                # mid-save, or gone; the next poll will tell
+                pass
+        return False
+
+
+class Daemon:
+    def __init__(self, interval=0.1):
+        self.interval = interval
+        self.projects = {}
+        self.watched = set()
+        self.lock = threading.Lock()
+        self.stopping = threading.Event()
+
+    def project(self, path, frontend="asm", optimise=False):
+        path = os.path.abspath(path)
+        if frontend not in FRONTENDS:
+            raise ValueError(f"unknown front end {frontend!r}")
+        with self.lock:
+            project = self.projects.get(path)
+            if project is None or (project.frontend, project.optimise) != (frontend, optimise):
+                project = self.projects[path] = Project(path, frontend, optimise)
+        return project
+
+    def handle(self, request):
+        cmd = request.get("cmd")
+        if cmd == "build":
+            project = self.project(request["path"], request.get("frontend", "asm"),
+                                   request.get("optimise", False))
+            result = project.build()
+            if result["ok"] and request.get("listing"):
+                result["listing"] = format_listing(project)
+            return result
+        if cmd == "watch":
+            project = self.project(request["path"], request.get("frontend", "asm"),
+                                   request.get("optimise", False))
+            with self.lock:
+                self.watched.add(project.path)
+            return project.build()
+        if cmd == "unwatch":
+            with self.lock:
+                self.watched.discard(os.path.abspath(request["path"]))
+            return {"ok": True}
+        if cmd == "stop":
+            self.stopping.set()
+            return {"ok": True}
+        return {"ok": False, "errors": [f"unknown command {cmd!r}"]}
+
+    def watch_loop(self):
+        # Polling stat() on a handful of files is cheap enough that we don't
+        # need inotify for this.
+        while not self.stopping.wait(self.interval):
+            with self.lock:
+                projects = [self.projects[path] for path in self.watched]
+            for project in projects:
+                if project.stale():
+                    result = project.build()
+                    if result["ok"]:
+                        print(f"built {project.output_path} ({result['ms']} ms)", flush=True)
+                    else:
+                        print(f"{project.path}: {result['errors'][0]}", flush=True)
+
+
+class RequestHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        for line in self.rfile:
+            try:
+                request = json.loads(line)
+            except ValueError as e:
+                reply = {"ok": False, "errors": [f"bad request: {e}"]}
+            else:
+                try:
+                    reply = self.server.daemon.handle(request)
+                except KeyError as e:
+                    reply = {"ok": False, "errors": [f"bad request: missing {e}"]}
+                except Exception as e:
+                    # always answer, so the client isn't left with no reply
+                    reply = {"ok": False, "errors": [f"{type(e).__name__}: {e}"]}
+            self.wfile.write(json.dumps(reply).encode() + b"\n")
+            self.wfile.flush()
+            if self.server.daemon.stopping.is_set():
+                threading.Thread(target=self.server.shutdown, daemon=True).start()
+                return
+
+
+class Server(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+def serve(socket_path, interval):
+    if os.path.exists(socket_path):
+        os.unlink(socket_path)
+
+    daemon = Daemon(interval)
+    watcher = threading.Thread(target=daemon.watch_loop, daemon=True)
+    watcher.start()
+
+    with Server(socket_path, RequestHandler) as server:
+        server.daemon = daemon
+        print(f"asmd listening on {socket_path}", flush=True)
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            daemon.stopping.set()
+            os.unlink(socket_path)
+
+
+def request(socket_path, message):
+    """Send one request and return the reply; EOFError if none came."""
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.connect(socket_path)
+        sock.sendall(json.dumps(message).encode() + b"\n")
+        with sock.makefile("rb") as f:
+            line = f.readline()
+    if not line:
+        raise EOFError("asmd closed the connection without replying")
+    return json.loads(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Assembler daemon")
+    parser.add_argument("--socket", default=default_socket_path())
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    serve_parser = sub.add_parser("serve")
+    serve_parser.add_argument("--interval", type=float, default=0.1,
+                              help="seconds between polls of watched files")
+    build_parser = sub.add_parser("build")
+    build_parser.add_argument("path")
+    build_parser.add_argument("-l", "--listing", action="store_true")
+    watch_parser = sub.add_parser("watch")
+    watch_parser.add_argument("path")
+    for frontend_parser in (build_parser, watch_parser):
+        frontend_parser.add_argument("-f", "--frontend", choices=FRONTENDS, default="asm")
+        frontend_parser.add_argument("-O", "--optimise", action="store_true",
+                                     help="run the peephole optimiser (asm only)")
+    sub.add_parser("unwatch").add_argument("path")
+    sub.add_parser("stop")
+    args = parser.parse_args()
+
+    if args.cmd == "serve":
+        serve(args.socket, args.interval)
+        return
+
+    message = {"cmd": args.cmd}
+    if args.cmd in ("build", "watch", "unwatch"):
+        message["path"] = os.path.abspath(args.path)
+    if args.cmd in ("build", "watch"):
+        message["frontend"] = args.frontend
+        message["optimise"] = args.optimise
+    if args.cmd == "build":
+        message["listing"] = args.listing
+
+    try:
+        reply = request(args.socket, message)
+    except EOFError as e:
+        print(f"Error: {e}")
+        sys.exit(2)
+    except OSError as e:
+        print(f"Error: can't reach asmd at {args.socket}: {e}")
+        sys.exit(2)
+
+    if not reply["ok"]:
+        for error in reply.get("errors", []):
+            print(f"Error: {error}")
+        sys.exit(1)
+    if "listing" in reply:
+        print(reply["listing"], end="")
+    if "output" in reply:
+        print(f"Binary written to {reply['output']} ({reply['ms']} ms)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,152 @@
+"""
+Assemble many sources at once over a process pool.
+
+    python batch.py [-f asm|02] [-j N] [-D NAME=VALUE ...] [--preload vcs.h]
+                    [--cache-dir DIR] 'levels/**/*.asm' ...
+
+Arguments are files or glob patterns.  Each source is written to a .bin next
+to it, as the single file front ends do.  Symbols given with -D are parsed
+once and handed to each worker when it starts, not shipped with every file.
+Headers named with --preload are parsed once, here, and their cache entries
+seed every worker's include cache, so an include "vcs.h" in each source is
+only a stat() in the worker.  --cache-dir also keeps parsed headers on disk
+for the next build.  Prints the time each file took and exits non-zero if
+any file failed.
+"""
+import argparse
+import glob
+import os
+import sys
+import time
+
+from concurrent.futures import ProcessPoolExecutor
+
+from frontends import FRONTENDS, load_asm02
+
+import include
+
+# set in each worker by init_worker
+worker_build = None
+worker_symbols = None
+worker_cache = None
+
+
+def init_worker(frontend, symbols, include_cache):
+    global worker_build, worker_symbols, worker_cache
+    worker_build = FRONTENDS[frontend]
+    worker_symbols = symbols
+    # handed to the front end with each file; the front ends took their
+    # default_cache when they were imported
+    worker_cache = include_cache
+    if frontend == '02':
+        # import it now so the first file's timing doesn't include it
+        load_asm02()
+
+
+def build_file(path):
+    """Assemble one file in a worker.  Returns (path, error, size, seconds)."""
+    start = time.perf_counter()
+    try:
+        with open(path, 'r', encoding='utf8') as f:
+            source = f.read()
+        image = worker_build(source, worker_symbols, path, worker_cache)
+        with open(os.path.splitext(path)[0] + '.bin', 'wb') as f:
+            f.write(image)
+    except Exception as e:
+        return path, f'{type(e).__name__}: {e}', 0, time.perf_counter() - start
+    return path, None, len(image), time.perf_counter() - start
+
+
+def expand_paths(patterns):
+    paths = []
+    seen = set()
+    for pattern in patterns:
+        matches = sorted(glob.glob(pattern, recursive=True)) or [pattern]
+        for path in matches:
+            if path not in seen:
+                seen.add(path)
+                paths.append(path)
+    return paths
+
+
+def parse_defines(defines):
+    """
+    {name: value} from NAME=VALUE strings, VALUE being $hex or a Python
+    integer literal and 1 if left out.  Raises ValueError for a bad one.
+    """
+    symbols = {}
+    for define in defines:
+        name, _, value = define.partition('=')
+        name = name.strip()
+        value = value.strip() or '1'
+        if not name:
+            raise ValueError(f'-D {define}: missing name')
+        try:
+            symbols[name] = int(value[1:], 16) if value[0] == '$' else int(value, 0)
+        except ValueError:
+            raise ValueError(f'-D {define}: {value!r} is not a number') from None
+    return symbols
+
+
+def preload_headers(headers, cache_dir):
+    """
+    An IncludeCache with the headers, and those they include, parsed.  It
+    is pickled to each worker whole, nested includes and all.
+    """
+    cache = include.IncludeCache(cache_dir)
+    for header in headers:
+        cache.load(header)
+    return cache
+
+
+def run(paths, frontend, symbols, jobs, include_cache=None):
+    results = []
+    initargs = (frontend, symbols, include_cache or include.IncludeCache())
+    with ProcessPoolExecutor(max_workers=jobs, initializer=init_worker,
+                             initargs=initargs) as pool:
+        # small chunks keep the workers busy when file sizes vary a lot
+        chunksize = max(1, len(paths) // (jobs * 8))
+        for result in pool.map(build_file, paths, chunksize=chunksize):
+            results.append(result)
+            path, error, size, seconds = result
+            if error:
+                print(f'FAIL {seconds * 1000:9.2f} ms  {path}: {error}')
+            else:
+                print(f'ok   {seconds * 1000:9.2f} ms  {path} ({size} bytes)')
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Assemble many files in parallel')
+    parser.add_argument('patterns', nargs='+', help='.asm files or glob patterns')
+    parser.add_argument('-f', '--frontend', choices=sorted(FRONTENDS), default='asm')
+    parser.add_argument('-j', '--jobs', type=int, default=os.cpu_count() or 1)
+    parser.add_argument('-D', '--define', action='append', default=[],
+                        metavar='NAME=VALUE', help='predefined symbol')
+    parser.add_argument('--preload', action='append', default=[], metavar='HEADER',
+                        help='header to parse once for every worker')
+    parser.add_argument('--cache-dir', help='keep parsed headers here between builds')
+    args = parser.parse_args()
+
+    paths = expand_paths(args.patterns)
+    try:
+        symbols = parse_defines(args.define)
+    except ValueError as e:
+        parser.error(str(e))
+    jobs = max(1, min(args.jobs, len(paths)))
+
+    start = time.perf_counter()
+    include_cache = preload_headers(args.preload, args.cache_dir)
+    results = run(paths, args.frontend, symbols, jobs, include_cache)
+    wall = time.perf_counter() - start
+
+    failed = sum(1 for _, error, _, _ in results if error)
+    busy = sum(seconds for _, _, _, seconds in results)
+    print(f'\n{len(results) - failed} ok, {failed} failed, {jobs} workers, '
+          f'{wall:.2f}s wall, {busy:.2f}s assembling '
+          f'({busy / wall if wall else 0:.1f}x parallel)')
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
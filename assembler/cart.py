@@ -0,0 +1,243 @@
+"""
+Atari 2600 cartridge layout.
+
+The 6507 only has 13 address lines and the cartridge answers whenever A12
+is set, so a 4K ROM appears at $1000-$1FFF and at every mirror of it up to
+$F000-$FFFF.  Bigger games switch 4K banks in and out of that window: the
+standard Atari schemes swap banks when the CPU touches a "hotspot" address
+near the top of the window.
+"""
+
+BANK_SIZE = 0x1000
+
+# scheme name -> (image size, address of the first hotspot, number of banks).
+# Touching hotspot + n selects bank n.
+BANK_SCHEMES = {
+    '2K': (0x0800, None, 1),
+    '4K': (0x1000, None, 1),
+    'F8': (0x2000, 0x1FF8, 2),
+    'F6': (0x4000, 0x1FF6, 4),
+    'F4': (0x8000, 0x1FF4, 8),
+}
+
+SCHEMES_BY_SIZE = {size: name for name, (size, _, _) in BANK_SCHEMES.items()}
+
+# Absolute mode opcodes games use to touch a hotspot, reads and writes alike
+HOTSPOT_OPCODES = frozenset({
+    0xAD, 0xAE, 0xAC,   # LDA LDX LDY abs
+    0x8D, 0x8E, 0x8C,   # STA STX STY abs
+    0x2C, 0xCD, 0x0C,   # BIT CMP NOP abs
+})
+
+
+def hotspots(scheme):
+    """The hotspot addresses of a scheme, in bank order."""
+    _, first, banks = BANK_SCHEMES[scheme]
+    if first is None:
+        return []
+    return [first + n for n in range(banks)]
+
+
+def count_hotspot_accesses(data, scheme):
+    """
+    Count absolute-mode instructions in data that touch one of the scheme's
+    hotspots, through any of the cartridge mirrors.  This is a byte search,
+    not a disassembly, so it can overcount by matching inside data tables,
+    but a real bank switched game is never at zero.
+    """
+    total = 0
+    for hotspot in hotspots(scheme):
+        low = hotspot & 0xFF
+        for high in range((hotspot >> 8) & 0x1F, 0x100, 0x20):
+            pattern = bytes((low, high))
+            start = data.find(pattern, 1)
+            while start != -1:
+                if data[start - 1] in HOTSPOT_OPCODES:
+                    total += 1
+                start = data.find(pattern, start + 1)
+    return total
+
+
+def detect_bank_scheme(data):
+    """
+    Guess the bank switching scheme of a ROM image from its size, checking
+    that a bank switched image really does touch its hotspots.  Returns
+    (scheme, hotspot accesses); scheme is None for sizes that don't match a
+    known scheme or bank switched images that never touch a hotspot.
+    """
+    scheme = SCHEMES_BY_SIZE.get(len(data))
+    if scheme is None:
+        return None, 0
+    if BANK_SCHEMES[scheme][1] is None:
+        return scheme, 0
+    hits = count_hotspot_accesses(bytes(data), scheme)
+    return (scheme if hits else None), hits
+
+
+def scheme_for_banks(count):
+    """The smallest scheme with at least count banks."""
+    for name, (_, _, banks) in BANK_SCHEMES.items():
+        if banks >= count and (count > 1 or name == '4K'):
+            return name
+    raise ValueError(f'{count} banks is more than any scheme has')
+
+
+def window_address(address):
+    """An address in cartridge space, as seen in the $F000-$FFFF window."""
+    return 0xF000 | (address & 0x0FFF)
+
+
+# STA abs touches a hotspot without changing A, X, Y or the flags
+STA_ABSOLUTE = 0x8D
+JMP_ABSOLUTE = 0x4C
+JMP_INDIRECT = 0x6C
+JSR = 0x20
+RTS = 0x60
+
+
+def trampoline(hotspot, target, return_hotspot=None):
+    """
+    Bytes of a bank switching stub.  Every bank holds the same stub at the
+    same address, so after the STA to hotspot switches banks the CPU goes
+    on with the next instruction of the copy in the new bank:
+
+        sta hotspot         ; switch to the target's bank
+        jmp target
+
+    or, given return_hotspot, for a JSR from another bank:
+
+        sta hotspot
+        jsr target
+        sta return_hotspot  ; back to the caller's bank
+        rts
+    """
+    stub = bytearray((STA_ABSOLUTE, hotspot & 0xFF, hotspot >> 8))
+    if return_hotspot is None:
+        stub += bytes((JMP_ABSOLUTE, target & 0xFF, target >> 8))
+    else:
+        stub += bytes((JSR, target & 0xFF, target >> 8,
+                       STA_ABSOLUTE, return_hotspot & 0xFF, return_hotspot >> 8, RTS))
+    return bytes(stub)
+
+
+def reset_trampoline(hotspot, vector=0xFFFC):
+    """
+    Bytes of the stub a bank without a reset vector of its own starts
+    through, in the same place in every bank as trampoline()'s:
+
+        sta hotspot         ; switch to the bank that has one
+        jmp ($FFFC)         ; and start where it says
+    """
+    return bytes((STA_ABSOLUTE, hotspot & 0xFF, hotspot >> 8,
+                  JMP_INDIRECT, vector & 0xFF, vector >> 8))
+
+
+def banks(data):
+    """
+    Split an image into (bank number, start offset, end offset) windows,
+    each of which maps to $F000-$FFFF when selected.  Images of 4K or less
+    (or of an odd size) are a single window; a 2K image appears twice in
+    the 4K space.
+    """
+    size = len(data)
+    if size <= BANK_SIZE or size % BANK_SIZE:
+        return [(0, 0, size)]
+    return [(n, start, start + BANK_SIZE) for n, start in enumerate(range(0, size, BANK_SIZE))]
+
+
+def bank_base(start, end):
+    """CPU address of the first byte of a bank window."""
+    return 0x10000 - min(end - start, BANK_SIZE)
+
+
+class Segment:
+    """Bytes written from one ORG on, at consecutive addresses."""
+
+    __slots__ = ('start', 'data')
+
+    def __init__(self, start):
+        self.start = start
+        self.data = bytearray()
+
+    @property
+    def end(self):
+        return self.start + len(self.data)
+
+
+class Image:
+    """
+    A program as the segments actually written, rather than a buffer
+    covering the whole address space.  emit() appends at an address,
+    starting a new segment unless it carries on where one ends; patch()
+    overwrites bytes already emitted, for fixups.  rom() lays the segments
+    out in the cartridge window.
+    """
+
+    def __init__(self):
+        self.segments = []
+        self.current = None
+
+    def emit(self, address, data):
+        segment = self.current
+        if segment is None or segment.end != address:
+            segment = next((s for s in self.segments if s.end == address), None)
+            if segment is None:
+                segment = Segment(address)
+                self.segments.append(segment)
+            self.current = segment
+        segment.data += data
+
+    def find(self, address, length=1):
+        for segment in self.segments:
+            if segment.start <= address and address + length <= segment.end:
+                return segment
+        return None
+
+    def patch(self, address, data):
+        segment = self.find(address, len(data))
+        if segment is None:
+            raise ValueError(f'${address:04X} is outside everything emitted')
+        offset = address - segment.start
+        segment.data[offset:offset + len(data)] = data
+
+    def read(self, address, length):
+        segment = self.find(address, length)
+        if segment is None:
+            return b''
+        offset = address - segment.start
+        return bytes(segment.data[offset:offset + length])
+
+    def rom(self, size=BANK_SIZE, fill=0):
+        """
+        The cartridge image: each segment goes to its address within the
+        size-byte window, so $F000, $1000 and the other mirrors all land at
+        offset 0.  Raises ValueError for a segment outside cartridge space
+        (A12 clear), one running off the end of the window, or two that
+        overlap once mirrored.
+        """
+        rom = bytearray([fill]) * size
+        placed = []
+        for segment in self.segments:
+            if not segment.data:
+                continue
+            if not segment.start & 0x1000:
+                raise ValueError(f'segment at ${segment.start:04X} is outside cartridge space')
+            offset = segment.start & (size - 1)
+            end = offset + len(segment.data)
+            if end > size:
+                raise ValueError(
+                    f'segment at ${segment.start:04X} runs ${end - size:X} bytes past '
+                    f'the end of the {size // 1024}K cartridge'
+                )
+            placed.append((offset, end, segment))
+
+        placed.sort(key=lambda entry: entry[0])
+        for (offset, end, segment), (next_offset, _, next_segment) in zip(placed, placed[1:]):
+            if next_offset < end:
+                raise ValueError(
+                    f'segments at ${segment.start:04X} and ${next_segment.start:04X} '
+                    f'overlap at ROM offset ${next_offset:03X}'
+                )
+        for offset, end, segment in placed:
+            rom[offset:end] = segment.data
+        return rom
@@ -0,0 +1,506 @@
+"""
+A cycle counting 6502 (6507) interpreter for running assembled 2600 ROMs.
+
+    cpu = CPU()
+    cpu.load_rom(Assembler().assemble(source))
+    cpu.reset()
+    cpu.run(cycles=76 * 262)
+
+Each opcode gets its own handler, generated from the opcode tables and
+dispatched through a 256 entry list, so an instruction is one fetch, one
+list index and one call with no decoding.  The registers live in closure
+cells shared by the handlers rather than as attributes, which is what makes
+the handlers cheap; CPU exposes them as properties.
+
+Memory is a flat bytearray of the 6507's 8K address space.  The 2600's
+partial address decoding is resolved through MIRROR, which maps every
+13-bit address to the cell that answers it:
+
+    $0000-$000F  TIA read registers (inputs, collisions)
+    $0080-$00FF  RIOT RAM, also seen at $0180-$01FF as the stack
+    $0100-$011F  RIOT ports and timer (stand-in cells, read via riot_read)
+    $1000-$1FFF  cartridge, at $F000-$FFFF through the top address bits
+
+Writes to the TIA go to the tia array and the tia_write hook instead of
+memory.  A write to WSYNC stalls the CPU to the start of the next scanline.
+"""
+import re
+
+from opcodes import DECODE, PAGE_PENALTY
+
+CYCLES_PER_LINE = 76
+
+WSYNC = 0x02
+
+# TIA read registers that aren't zero at power on: the fire buttons read
+# high while not pressed
+TIA_READ_DEFAULTS = {0x0C: 0x80, 0x0D: 0x80}
+
+RIOT_BASE = 0x100
+RIOT_INTERVALS = {0x14: 1, 0x15: 8, 0x16: 64, 0x17: 1024}
+
+
+def build_mirror():
+    """The memory cell behind each of the 8K addresses."""
+    mirror = []
+    for address in range(0x2000):
+        if address & 0x1000:
+            mirror.append(address)                      # cartridge
+        elif not address & 0x80:
+            mirror.append(address & 0x0F)               # TIA
+        elif not address & 0x200:
+            mirror.append(0x80 | (address & 0x7F))      # RAM
+        else:
+            mirror.append(RIOT_BASE | (address & 0x1F))  # RIOT I/O
+    return mirror
+
+
+MIRROR = build_mirror()
+
+
+class Jammed(Exception):
+    """The CPU hit one of the opcodes that lock up a real 6502."""
+
+
+# Registers and flags, as closure cells.  nf holds a value whose bit 7 is N
+# and zf a value that is zero when Z is set, so loads just assign both.
+STATE = ('a', 'x', 'y', 'sp', 'pc', 'nf', 'zf', 'cf', 'vf', 'df', 'irq_disable', 'cycles')
+
+# Everything but the opcode handlers.  Handlers and helpers declare the
+# state they touch nonlocal.
+CORE_PRELUDE = '''\
+def make_core(cpu, mem, mirror, tia, Jammed):
+    a = x = y = pc = nf = cf = vf = df = cycles = 0
+    sp = 0xfd
+    zf = 1
+    irq_disable = 1
+
+    def read(address):
+        cell = mirror[address & 0x1fff]
+        if cell >> 8 == 1:
+            return cpu.riot_read(cell, cycles)
+        return mem[cell]
+
+    def write(address, value):
+        nonlocal cycles
+        address &= 0x1fff
+        if address & 0x1000:
+            return                  # ROM
+        if not address & 0x80:
+            register = address & 0x3f
+            tia[register] = value
+            if register == WSYNC:
+                cycles += -cycles % CYCLES_PER_LINE
+            if cpu.tia_write is not None:
+                cpu.tia_write(register, value, cycles)
+        elif not address & 0x200:
+            mem[0x80 | (address & 0x7f)] = value
+        else:
+            cpu.riot_write(address & 0x1f, value, cycles)
+
+    def push(value):
+        nonlocal sp
+        write(0x100 | sp, value)
+        sp = (sp - 1) & 0xff
+
+    def pull():
+        nonlocal sp
+        sp = (sp + 1) & 0xff
+        return read(0x100 | sp)
+
+    def status():
+        return ((nf & 0x80) | (bool(vf) << 6) | 0x20 | (df << 3)
+                | (irq_disable << 2) | ((not zf) << 1) | bool(cf))
+
+    def set_status(p):
+        nonlocal nf, vf, df, irq_disable, zf, cf
+        nf = p & 0x80
+        vf = (p >> 6) & 1
+        df = (p >> 3) & 1
+        irq_disable = (p >> 2) & 1
+        zf = not p & 0x02
+        cf = p & 1
+
+    def adc(m):
+        nonlocal a, nf, zf, cf, vf
+        result = a + m + cf
+        if df:
+            lo = (a & 0x0f) + (m & 0x0f) + cf
+            if lo > 9:
+                lo += 6
+            hi = (a >> 4) + (m >> 4) + (lo > 0x0f)
+            zf = result & 0xff
+            nf = hi << 4
+            vf = ((hi << 4) ^ a) & 0x80 and not (a ^ m) & 0x80
+            if hi > 9:
+                hi += 6
+            cf = int(hi > 0x0f)
+            a = ((hi << 4) | (lo & 0x0f)) & 0xff
+            return
+        vf = ~(a ^ m) & (a ^ result) & 0x80
+        cf = result >> 8
+        a = nf = zf = result & 0xff
+
+    def sbc(m):
+        nonlocal a, nf, zf, cf, vf
+        if not df:
+            adc(m ^ 0xff)
+            return
+        borrow = 1 - cf
+        result = a - m - borrow
+        lo = (a & 0x0f) - (m & 0x0f) - borrow
+        hi = (a >> 4) - (m >> 4)
+        if lo < 0:
+            lo -= 6
+            hi -= 1
+        if hi < 0:
+            hi -= 6
+        vf = (a ^ m) & (a ^ result) & 0x80
+        cf = int(result >= 0)
+        nf = zf = result & 0xff
+        a = ((hi << 4) | (lo & 0x0f)) & 0xff
+
+    def jam():
+        raise Jammed(f'jammed at ${pc:04x}')
+
+    def run(cycle_limit, count):
+        n = 0
+        try:
+            if cycle_limit is None:
+                for n in range(count):
+                    handlers[mem[pc & 0x1fff]]()
+                n = count
+            else:
+                while n != count and cycles < cycle_limit:
+                    handlers[mem[pc & 0x1fff]]()
+                    n += 1
+        except Jammed:
+            cpu.jammed = True
+        return n
+'''
+
+
+# Handler source, generated per opcode.  The addressing mode sets addr (or
+# m for immediate), the operation reads m / writes r through it.
+
+def fetch(n):
+    return f'mem[(pc + {n}) & 0x1fff]'
+
+
+MODE_ADDRESS = {
+    'zeropage': f'addr = {fetch(1)}',
+    'zeropage_x': f'addr = ({fetch(1)} + x) & 0xff',
+    'zeropage_y': f'addr = ({fetch(1)} + y) & 0xff',
+    'absolute': f'addr = {fetch(1)} | {fetch(2)} << 8',
+    'absolute_x': f'base = {fetch(1)} | {fetch(2)} << 8\naddr = (base + x) & 0xffff',
+    'absolute_y': f'base = {fetch(1)} | {fetch(2)} << 8\naddr = (base + y) & 0xffff',
+    'indirect_x': (f'zp = ({fetch(1)} + x) & 0xff\n'
+                   'addr = mem[mirror[zp]] | mem[mirror[(zp + 1) & 0xff]] << 8'),
+    'indirect_y': (f'zp = {fetch(1)}\n'
+                   'base = mem[mirror[zp]] | mem[mirror[(zp + 1) & 0xff]] << 8\n'
+                   'addr = (base + y) & 0xffff'),
+    'indirect': (f'ptr = {fetch(1)} | {fetch(2)} << 8\n'
+                 # the 6502 doesn't carry into the high byte of the pointer
+                 'addr = read(ptr) | read((ptr & 0xff00) | ((ptr + 1) & 0xff)) << 8'),
+}
+
+ZEROPAGE_MODES = {'zeropage', 'zeropage_x', 'zeropage_y'}
+
+READ_OPS = {
+    'LDA': 'a = nf = zf = m',
+    'LDX': 'x = nf = zf = m',
+    'LDY': 'y = nf = zf = m',
+    'LAX': 'a = x = nf = zf = m',
+    'AND': 'a = nf = zf = a & m',
+    'ORA': 'a = nf = zf = a | m',
+    'EOR': 'a = nf = zf = a ^ m',
+    'ADC': 'adc(m)',
+    'SBC': 'sbc(m)',
+    'CMP': 'r = a - m\ncf = r >= 0\nnf = zf = r & 0xff',
+    'CPX': 'r = x - m\ncf = r >= 0\nnf = zf = r & 0xff',
+    'CPY': 'r = y - m\ncf = r >= 0\nnf = zf = r & 0xff',
+    'BIT': 'nf = m\nvf = m & 0x40\nzf = a & m',
+    'NOP': 'pass',
+    'ANC': 'a = nf = zf = a & m\ncf = a >> 7',
+    'ALR': 'r = a & m\ncf = r & 1\na = nf = zf = r >> 1',
+    'ARR': ('r = ((a & m) >> 1) | (cf << 7)\na = nf = zf = r\n'
+            'cf = (r >> 6) & 1\nvf = ((r >> 6) ^ (r >> 5)) & 1'),
+    'SBX': 'r = (a & x) - m\ncf = r >= 0\nx = nf = zf = r & 0xff',
+}
+
+STORE_OPS = {
+    'STA': 'a',
+    'STX': 'x',
+    'STY': 'y',
+    'SAX': 'a & x',
+}
+
+# read-modify-write: m is the old value, r the new one
+RMW_OPS = {
+    'ASL': 'cf = m >> 7\nr = (m << 1) & 0xff',
+    'LSR': 'cf = m & 1\nr = m >> 1',
+    'ROL': 'r = ((m << 1) | cf) & 0xff\ncf = m >> 7',
+    'ROR': 'r = (m >> 1) | (cf << 7)\ncf = m & 1',
+    'INC': 'r = (m + 1) & 0xff',
+    'DEC': 'r = (m - 1) & 0xff',
+}
+
+# undocumented read-modify-writes that feed the new value into a read op
+RMW_COMBOS = {
+    'SLO': ('ASL', 'ORA'),
+    'RLA': ('ROL', 'AND'),
+    'SRE': ('LSR', 'EOR'),
+    'RRA': ('ROR', 'ADC'),
+    'DCP': ('DEC', 'CMP'),
+    'ISC': ('INC', 'SBC'),
+}
+
+# pc has already been stepped past the opcode
+IMPLIED_OPS = {
+    'TAX': 'x = nf = zf = a',
+    'TAY': 'y = nf = zf = a',
+    'TXA': 'a = nf = zf = x',
+    'TYA': 'a = nf = zf = y',
+    'TSX': 'x = nf = zf = sp',
+    'TXS': 'sp = x',
+    'INX': 'x = nf = zf = (x + 1) & 0xff',
+    'DEX': 'x = nf = zf = (x - 1) & 0xff',
+    'INY': 'y = nf = zf = (y + 1) & 0xff',
+    'DEY': 'y = nf = zf = (y - 1) & 0xff',
+    'CLC': 'cf = 0',
+    'SEC': 'cf = 1',
+    'CLI': 'irq_disable = 0',
+    'SEI': 'irq_disable = 1',
+    'CLV': 'vf = 0',
+    'CLD': 'df = 0',
+    'SED': 'df = 1',
+    'NOP': 'pass',
+    'PHA': 'push(a)',
+    'PHP': 'push(status() | 0x10)',
+    'PLA': 'a = nf = zf = pull()',
+    'PLP': 'set_status(pull())',
+    'RTS': 'lo = pull()\npc = ((pull() << 8) | lo) + 1',
+    'RTI': 'set_status(pull())\nlo = pull()\npc = (pull() << 8) | lo',
+    'BRK': ('push((pc + 1) >> 8)\npush((pc + 1) & 0xff)\npush(status() | 0x10)\n'
+            'irq_disable = 1\npc = read(0xfffe) | read(0xffff) << 8'),
+}
+
+BRANCH_CONDITIONS = {
+    'BPL': 'not nf & 0x80',
+    'BMI': 'nf & 0x80',
+    'BVC': 'not vf',
+    'BVS': 'vf',
+    'BCC': 'not cf',
+    'BCS': 'cf',
+    'BNE': 'zf',
+    'BEQ': 'not zf',
+}
+
+
+def handler_body(opcode, mnemonic, mode, length):
+    """Source lines of the handler for one opcode, cycle count aside."""
+    if mode == 'relative':
+        return [
+            'pc += 2',
+            f'if {BRANCH_CONDITIONS[mnemonic]}:',
+            '    rel = mem[(pc - 1) & 0x1fff]',
+            '    target = (pc + (rel - 256 if rel > 127 else rel)) & 0xffff',
+            '    cycles += 2 if (target ^ pc) & 0x100 else 1',
+            '    pc = target',
+        ]
+
+    if mode in ('implied', 'accumulator') and mnemonic in IMPLIED_OPS:
+        return ['pc += 1', *IMPLIED_OPS[mnemonic].split('\n')]
+
+    if mode == 'accumulator':
+        return ['pc += 1', 'm = a', *RMW_OPS[mnemonic].split('\n'), 'a = nf = zf = r']
+
+    lines = []
+    if mode == 'immediate':
+        lines.append(f'm = {fetch(1)}')
+    else:
+        lines.extend(MODE_ADDRESS[mode].split('\n'))
+    lines.append(f'pc += {length}')
+
+    if opcode in PAGE_PENALTY:
+        lines.append('if (base ^ addr) & 0x100:')
+        lines.append('    cycles += 1')
+
+    if mnemonic == 'JMP':
+        return lines + ['pc = addr']
+    if mnemonic == 'JSR':
+        return lines + ['push((pc - 1) >> 8)', 'push((pc - 1) & 0xff)', 'pc = addr']
+
+    if mode in ZEROPAGE_MODES:
+        load = 'm = mem[mirror[addr]]'
+        store = 'if addr & 0x80:\n    mem[addr] = r\nelse:\n    write(addr, r)'
+    else:
+        load = 'm = read(addr)'
+        store = 'write(addr, r)'
+
+    if mnemonic in STORE_OPS:
+        lines.append(f'r = {STORE_OPS[mnemonic]}')
+        lines.extend(store.split('\n'))
+    elif mnemonic in RMW_OPS:
+        lines.append(load)
+        lines.extend(RMW_OPS[mnemonic].split('\n'))
+        lines.extend(store.split('\n'))
+        lines.append('nf = zf = r')
+    elif mnemonic in RMW_COMBOS:
+        rmw, op = RMW_COMBOS[mnemonic]
+        lines.append(load)
+        lines.extend(RMW_OPS[rmw].split('\n'))
+        lines.extend(store.split('\n'))
+        lines.append('m = r')
+        lines.extend(READ_OPS[op].split('\n'))
+    else:
+        if mode != 'immediate':
+            lines.append(load)
+        lines.extend(READ_OPS[mnemonic].split('\n'))
+    return lines
+
+
+def build_core_source():
+    """
+    Source of make_core(cpu, mem, mirror, tia, Jammed), which returns the
+    run loop, register accessors and memory and status helpers, all
+    closures over one CPU's state.
+    """
+    out = [CORE_PRELUDE]
+    names = []
+    for opcode, entry in enumerate(DECODE):
+        name = f'op_{opcode:02x}'
+        names.append(name)
+        out.append(f'    def {name}():')
+        if entry is None:
+            out.append('        jam()')
+            continue
+        mnemonic, mode, length, cycles = entry
+        body = [f'cycles += {cycles}', *handler_body(opcode, mnemonic, mode, length)]
+        used = set(re.findall(r'\b[a-z_]+\b', '\n'.join(body)))
+        state = [name for name in STATE if name in used]
+        out.append(f'        nonlocal {", ".join(state)}')
+        for line in body:
+            out.append('        ' + line)
+
+    out.append(f'    handlers = [{", ".join(names)}]')
+    out.append('')
+    out.append('    def get_register(name):')
+    out.append(f'        return {{{", ".join(f"{s!r}: {s}" for s in STATE)}}}[name]')
+    out.append('')
+    out.append('    def set_register(name, value):')
+    out.append(f'        nonlocal {", ".join(STATE)}')
+    for n, s in enumerate(STATE):
+        out.append(f'        {"if" if n == 0 else "elif"} name == {s!r}:')
+        out.append(f'            {s} = value')
+    out.append('')
+    out.append('    return run, get_register, set_register, read, write, status, set_status')
+    return '\n'.join(out) + '\n'
+
+
+namespace = {'WSYNC': WSYNC, 'CYCLES_PER_LINE': CYCLES_PER_LINE}
+exec(compile(build_core_source(), '<cpu6502 core>', 'exec'), namespace)
+make_core = namespace['make_core']
+
+
+def register(name):
+    return property(lambda self: self.get_register(name),
+                    lambda self, value: self.set_register(name, value))
+
+
+class CPU:
+    """
+    6507 registers, memory and the hardware around it that the CPU sees.
+
+    tia_write, if set, is called as tia_write(register, value, cycles)
+    after every TIA write, e.g. to draw the frame.
+    """
+
+    a = register('a')
+    x = register('x')
+    y = register('y')
+    sp = register('sp')
+    pc = register('pc')
+    cycles = register('cycles')
+
+    def __init__(self):
+        self.mem = bytearray(0x2000)
+        for address, value in TIA_READ_DEFAULTS.items():
+            self.mem[address] = value
+        self.tia = bytearray(0x40)
+        self.tia_write = None
+        self.swcha = 0xFF
+        self.swchb = 0x0B
+        self.timer_start = 0
+        self.timer_value = 0
+        self.timer_interval = 1024
+        self.instructions = 0
+        self.jammed = False
+        (self.core_run, self.get_register, self.set_register, self.read, self.write,
+         self.status, self.set_status) = make_core(self, self.mem, MIRROR, self.tia, Jammed)
+
+    def load_rom(self, image):
+        """
+        Put a ROM image in the cartridge slot.  Takes the bytes from
+        Assembler.assemble() or 02/asm.py: a 2K image is mirrored to fill
+        the 4K window, and of anything bigger than 4K the last 4K, where the
+        vectors are, is used.
+        """
+        image = bytes(image)
+        if len(image) > 0x1000:
+            image = image[-0x1000:]
+        if len(image) <= 0x800:
+            image = image.ljust(0x800, b'\0') * 2
+        self.mem[0x1000:0x2000] = image.ljust(0x1000, b'\0')
+
+    def reset(self):
+        self.set_register('sp', 0xFD)
+        self.set_register('irq_disable', 1)
+        self.jammed = False
+        self.pc = self.read(0xFFFC) | self.read(0xFFFD) << 8
+
+    def riot_read(self, cell, cycles):
+        register = cell & 0x1F
+        if register & 0x04:
+            elapsed = cycles - self.timer_start
+            ticks = elapsed // self.timer_interval
+            underflowed = ticks > self.timer_value
+            if register & 0x01:
+                return 0x80 if underflowed else 0x00    # TIMINT
+            if not underflowed:
+                return self.timer_value - ticks
+            # past zero the timer counts down once a cycle
+            return (0xFF - (elapsed - (self.timer_value + 1) * self.timer_interval)) & 0xFF
+        if register & 0x02:
+            return self.swchb if not register & 0x01 else 0
+        return self.swcha if not register & 0x01 else 0
+
+    def riot_write(self, register, value, cycles):
+        interval = RIOT_INTERVALS.get(register)
+        if interval is not None:
+            self.timer_start = cycles
+            self.timer_value = value
+            self.timer_interval = interval
+
+    def step(self):
+        """Execute one instruction."""
+        return self.run(instructions=1)
+
+    def run(self, cycles=None, instructions=None):
+        """
+        Run until cycles more cycles or instructions more instructions have
+        gone by (whichever comes first), or the CPU jams.  Returns the number
+        of instructions executed.
+        """
+        count = instructions if instructions is not None else -1
+        if cycles is not None:
+            cycle_limit = self.cycles + cycles
+        elif instructions is not None:
+            cycle_limit = None      # the faster loop that only counts
+        else:
+            cycle_limit = float('inf')
+        if self.jammed:
+            return 0
+        n = self.core_run(cycle_limit, count)
+        self.instructions += n
+        return n
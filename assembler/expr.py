@@ -0,0 +1,292 @@
+"""
+Operand expressions, compiled once and evaluated late.
+
+    compile_expression('$ff')            -> 255
+    compile_expression('table')          -> 'table'
+    compile_expression('SCREEN_H*2')     -> Expression
+    compile_expression('%0101 << 4')     -> 80
+    compile_expression('<table+1')       -> Expression
+
+Numbers are $hex, %binary or decimal.  Operators, loosest first:
+
+    < >         low or high byte of the whole expression, as a prefix
+    |  ^  &     bitwise or, xor, and
+    << >>       shifts
+    + -         add, subtract
+    * /         multiply, divide (integer)
+    - ~         negate, complement (prefix)
+
+with [ ] for grouping, as in dasm; round brackets mean indirect
+addressing in an operand.
+
+A constant expression folds to its int and a bare name stays a string,
+which is what the assemblers took before expressions, so only compound
+expressions that name symbols come back as Expression.  That holds a
+closure built from the parse tree, constant parts already folded, and
+the names it needs.  evaluate() runs the closure against a symbol table
+when the symbols are known, at layout or fixup time; compilation is
+cached by text, so a table-driven source that writes "table+1" a
+thousand times parses it once.  The cache keeps the most recently used
+COMPILED_CACHE_SIZE texts, so a long-lived process such as asmd doesn't
+grow without bound.  Resolver memoises values for one
+version of a symbol table.
+"""
+from functools import lru_cache
+
+import operator
+
+from lexer import scan
+
+# lexer token kinds that may appear in an expression besides numbers and
+# names; each is its own kind
+OPERATORS = {'<<', '>>', '+', '-', '*', '/', '&', '|', '^', '~', '<', '>', '[', ']'}
+
+# binary operators by binding power
+BINARY = {
+    '|': (1, operator.or_),
+    '^': (2, operator.xor),
+    '&': (3, operator.and_),
+    '<<': (4, operator.lshift),
+    '>>': (4, operator.rshift),
+    '+': (5, operator.add),
+    '-': (5, operator.sub),
+    '*': (6, operator.mul),
+    '/': (6, operator.floordiv),
+}
+
+BYTE_PREFIX = {
+    '<': lambda value: value & 0xFF,
+    '>': lambda value: (value >> 8) & 0xFF,
+}
+
+UNARY = {
+    '-': operator.neg,
+    '~': operator.invert,
+}
+
+
+class Expression:
+    """
+    A compiled expression that names symbols.  Equal, and hashed alike,
+    when the text is, so parsed lines holding one can still be shared.
+    """
+
+    __slots__ = ('text', 'names', 'function')
+
+    def __init__(self, text, names, function):
+        self.text = text
+        self.names = names
+        self.function = function
+
+    def __eq__(self, other):
+        return isinstance(other, Expression) and other.text == self.text
+
+    def __hash__(self):
+        return hash(self.text)
+
+    def __repr__(self):
+        return f'Expression({self.text!r})'
+
+    def __str__(self):
+        return self.text
+
+    def evaluate(self, symbols):
+        """The value against symbols, or None while a name is undefined."""
+        try:
+            return self.function(symbols)
+        except KeyError:
+            return None
+        except ZeroDivisionError:
+            raise ValueError(f'Division by zero in expression {self.text!r}') from None
+
+
+def parse_number(text):
+    if text[0] == '$':
+        return int(text[1:], 16)
+    if text[0] == '%':
+        return int(text[1:], 2)
+    return int(text)
+
+
+def tokenise(text):
+    """(kind, text) pairs, kind being number, name or operator."""
+    tokens = []
+    for kind, value, _, column in scan(text):
+        if kind == 'number' or kind == 'name':
+            tokens.append((kind, value))
+        elif kind in OPERATORS:
+            tokens.append(('operator', value))
+        else:
+            raise ValueError(f'Invalid expression {text!r} at {text[column:].strip()!r}')
+    return tokens
+
+
+class Parser:
+    """
+    Precedence climbing over the tokens.  Each node is an int, when it is
+    constant, or a function of the symbol table.
+    """
+
+    def __init__(self, text, tokens, fold_case):
+        self.text = text
+        self.fold_case = fold_case
+        self.tokens = tokens
+        self.position = 0
+        self.names = []
+
+    def peek(self):
+        if self.position < len(self.tokens):
+            return self.tokens[self.position]
+        return None, None
+
+    def take(self):
+        token = self.peek()
+        self.position += 1
+        return token
+
+    def error(self, message):
+        return ValueError(f'{message} in expression {self.text!r}')
+
+    def parse(self):
+        kind, text = self.peek()
+        prefix = BYTE_PREFIX.get(text) if kind == 'operator' else None
+        if prefix is not None:
+            self.take()
+        node = self.binary(0)
+        if self.position != len(self.tokens):
+            raise self.error(f'Unexpected {self.peek()[1]!r}')
+        if prefix is not None:
+            node = apply(prefix, node)
+        return node
+
+    def binary(self, power):
+        left = self.unary()
+        while True:
+            kind, text = self.peek()
+            if kind != 'operator' or text not in BINARY:
+                return left
+            binding, function = BINARY[text]
+            if binding <= power:
+                return left
+            self.take()
+            right = self.binary(binding)
+            if function is operator.floordiv and right == 0:
+                raise self.error('Division by zero')
+            left = combine(function, left, right)
+
+    def unary(self):
+        kind, text = self.take()
+        if kind == 'number':
+            return parse_number(text)
+        if kind == 'name':
+            if self.fold_case:
+                text = text.lower()
+            self.names.append(text)
+            return operator.itemgetter(text)
+        if kind == 'operator' and text in UNARY:
+            return apply(UNARY[text], self.unary())
+        if text == '[':
+            node = self.binary(0)
+            if self.take()[1] != ']':
+                raise self.error('Missing ]')
+            return node
+        raise self.error('Unexpected end' if kind is None else f'Unexpected {text!r}')
+
+
+def apply(function, node):
+    if isinstance(node, int):
+        return function(node)
+    return lambda symbols: function(node(symbols))
+
+
+def combine(function, left, right):
+    """A binary node, folded when both sides are constant."""
+    if isinstance(left, int):
+        if isinstance(right, int):
+            return function(left, right)
+        return lambda symbols: function(left, right(symbols))
+    if isinstance(right, int):
+        return lambda symbols: function(left(symbols), right)
+    return lambda symbols: function(left(symbols), right(symbols))
+
+
+# distinct operand texts kept compiled; a big source has a few thousand
+COMPILED_CACHE_SIZE = 16384
+
+
+def compile_expression(text, fold_case=False):
+    """
+    An operand as an int, a symbol name (str) or an Expression.  fold_case
+    lower cases the names, for 02/asm.py, whose labels are case
+    insensitive.  Raises ValueError for a malformed expression.
+    """
+    return _compile(text, fold_case)
+
+
+@lru_cache(maxsize=COMPILED_CACHE_SIZE)
+def _compile(text, fold_case):
+    stripped = text.strip()
+    tokens = tokenise(stripped)
+    kind = tokens[0][0] if len(tokens) == 1 else None
+    if kind == 'number':
+        result = parse_number(stripped)
+    elif kind == 'name':
+        result = stripped.lower() if fold_case else stripped
+    else:
+        parser = Parser(stripped, tokens, fold_case)
+        node = parser.parse()
+        if isinstance(node, int):
+            result = node
+        else:
+            result = Expression(stripped, tuple(dict.fromkeys(parser.names)), node)
+    return result
+
+
+def symbolic(value):
+    """True for a value that waits on symbols: a name or an Expression."""
+    return isinstance(value, (str, Expression))
+
+
+def names(value):
+    """The symbol names value depends on."""
+    if isinstance(value, str):
+        return (value,)
+    if isinstance(value, Expression):
+        return value.names
+    return ()
+
+
+def value_of(value, symbols):
+    """value resolved against symbols; None if a name is undefined."""
+    if isinstance(value, str):
+        return symbols.get(value)
+    if isinstance(value, Expression):
+        return value.evaluate(symbols)
+    return value
+
+
+class Resolver:
+    """
+    value_of() for one symbol table, with Expression values memoised until
+    new_version() says the table has changed.
+    """
+
+    def __init__(self, symbols):
+        self.symbols = symbols
+        self.version = 0
+        self.memo = {}
+
+    def new_version(self):
+        self.version += 1
+        self.memo.clear()
+
+    def __call__(self, value):
+        if isinstance(value, str):
+            return self.symbols.get(value)
+        if isinstance(value, Expression):
+            try:
+                return self.memo[value]
+            except KeyError:
+                result = self.memo[value] = value.evaluate(self.symbols)
+                return result
+        return value
@@ -0,0 +1,52 @@
+"""
+The two assembler front ends behind one calling convention, for tools that
+drive either of them (batch builds, benchmarks).
+
+    build = FRONTENDS['asm']
+    image = build(source_text, symbols, path, include_cache)
+
+path is the source's file name, used to find its include files, and
+include_cache the include.IncludeCache to read them through, the
+process's default_cache if None.
+
+'asm' is Assembler in this directory.  '02' is the dasm-flavoured Session
+in programming-games-for-atari-2600/02/asm.py.  Both modules are called
+asm, so the 02 one is loaded from its path under the name asm02.
+"""
+from pathlib import Path
+
+import importlib.util
+import sys
+
+from asm import Assembler
+
+ROOT = Path(__file__).resolve().parents[1]
+ASM02_PATH = ROOT / 'programming-games-for-atari-2600' / '02' / 'asm.py'
+
+
+def load_asm02():
+    module = sys.modules.get('asm02')
+    if module is None:
+        spec = importlib.util.spec_from_file_location('asm02', ASM02_PATH)
+        module = importlib.util.module_from_spec(spec)
+        sys.modules['asm02'] = module
+        spec.loader.exec_module(module)
+    return module
+
+
+def build_asm(source, symbols=None, path=None, include_cache=None):
+    return Assembler(predefined=symbols).assemble(source)
+
+
+def build_asm02(source, symbols=None, path=None, include_cache=None):
+    asm02 = load_asm02()
+    include_dirs = [Path(path).parent] if path else []
+    session = asm02.Session(labels=symbols, include_dirs=include_dirs,
+                            include_cache=include_cache)
+    return bytes(session.assemble(source))
+
+
+FRONTENDS = {
+    'asm': build_asm,
+    '02': build_asm02,
+}
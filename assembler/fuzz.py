@@ -0,0 +1,340 @@
+"""
+Differential fuzzer for the two assemblers and the disassembler.
+
+    python fuzz.py [-j N] [--seconds 60 | --programs N] [--size 200] [--seed 0]
+    python fuzz.py --replay SEED
+
+Each program is a random stream of documented instructions, with labels
+and branches between them in reach of each other.  Operands are kept
+canonical, so a program has one encoding: an absolute mode with a zero
+page form gets an operand of $100 or more, since either assembler would
+narrow a smaller one.  Zero page operands with an even value are written
+as symbols, z80 for $80 and so on: Assembler gets them as equates, half
+before the code and half after it, and Session as predefined labels.
+Its bytes are worked out straight from opcodes.ENCODE and then checked
+against:
+
+  asm        Assembler.assemble() of the program
+  02         02/asm.py's Session.assemble() of it, at org $f000
+  asm-trip   the expected bytes through disa2600.decode() at address 0,
+             reassembled by Assembler
+  02-trip    the same at $f000, reassembled by Session
+
+Programs run in batches over a process pool, each program from its own
+seed.  A failing program is shrunk, instructions dropped while the same
+check still fails, and printed as a minimal reproducer with both sets of
+bytes; --replay SEED runs a single program again.  Exits non-zero if any
+program failed.
+"""
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+import argparse
+import importlib.util
+import os
+import random
+import sys
+import time
+
+from asm import Assembler
+from frontends import ROOT, load_asm02
+from opcodes import ENCODE, ZEROPAGE_MODE
+
+DISA_PATH = ROOT / 'programming-games-for-atari-2600' / '02' / 'disa2600.py'
+
+# assembler syntax of each mode's operand
+FORMATS = {
+    'implied': '',
+    'accumulator': ' a',
+    'immediate': ' #${:02x}',
+    'zeropage': ' ${:02x}',
+    'zeropage_x': ' ${:02x},x',
+    'zeropage_y': ' ${:02x},y',
+    'indirect_x': ' (${:02x},x)',
+    'indirect_y': ' (${:02x}),y',
+    'absolute': ' ${:04x}',
+    'absolute_x': ' ${:04x},x',
+    'absolute_y': ' ${:04x},y',
+    'indirect': ' (${:04x})',
+}
+
+KEYS = sorted(ENCODE)
+
+# modes whose operand is a byte address, written as a symbol when even
+SYMBOLIC_MODES = {'zeropage', 'zeropage_x', 'zeropage_y', 'indirect_x', 'indirect_y'}
+
+# org of the 02 programs; Assembler always starts at 0
+BASE_02 = 0xF000
+
+
+def load_disa():
+    module = sys.modules.get('disa2600')
+    if module is None:
+        spec = importlib.util.spec_from_file_location('disa2600', DISA_PATH)
+        module = importlib.util.module_from_spec(spec)
+        sys.modules['disa2600'] = module
+        spec.loader.exec_module(module)
+    return module
+
+
+def operand(rng, mnemonic, mode):
+    if mode in ('implied', 'accumulator'):
+        return None
+    length = ENCODE[mnemonic, mode][1]
+    if length == 2:
+        return rng.randrange(0x100)
+    if mode in ZEROPAGE_MODE and (mnemonic, ZEROPAGE_MODE[mode]) in ENCODE:
+        return rng.randrange(0x100, 0x10000)
+    return rng.randrange(0x10000)
+
+
+def addresses(program):
+    """Address of each instruction from 0, and of the end."""
+    address = 0
+    found = []
+    for mnemonic, mode, _ in program:
+        found.append(address)
+        address += ENCODE[mnemonic, mode][1]
+    found.append(address)
+    return found
+
+
+def in_reach(program):
+    """Whether every branch can reach its target."""
+    found = addresses(program)
+    return all(-128 <= found[value] - (found[index] + 2) <= 127
+               for index, (_, mode, value) in enumerate(program) if mode == 'relative')
+
+
+def generate(seed, size):
+    """
+    A random program: a list of (mnemonic, mode, value), value being the
+    index of the target instruction for a branch (len(program) for the
+    end) and the operand otherwise.
+    """
+    rng = random.Random(seed)
+    program = []
+    for _ in range(size):
+        mnemonic, mode = rng.choice(KEYS)
+        program.append((mnemonic, mode, operand(rng, mnemonic, mode)))
+    found = addresses(program)
+    for index, (mnemonic, mode, _) in enumerate(program):
+        if mode == 'relative':
+            origin = found[index] + 2
+            # instructions are at most 3 bytes, so reach is within 128 of them
+            reach = [target for target in range(max(0, index - 128), min(size, index + 128) + 1)
+                     if -128 <= found[target] - origin <= 127]
+            program[index] = (mnemonic, mode, rng.choice(reach))
+    return program
+
+
+def is_symbolic(mode, value):
+    return mode in SYMBOLIC_MODES and value % 2 == 0
+
+
+def symbols(program):
+    """{name: value} of the symbols the program's operands are written as."""
+    return {f'z{value:02x}': value for _, mode, value in program if is_symbolic(mode, value)}
+
+
+def render(program):
+    """The program as source, a label on each branch target."""
+    targets = {value for _, mode, value in program if mode == 'relative'}
+    lines = []
+    for index, (mnemonic, mode, value) in enumerate(program):
+        if index in targets:
+            lines.append(f'l{index}:')
+        if mode == 'relative':
+            lines.append(f'    {mnemonic.lower()} l{value}')
+        elif is_symbolic(mode, value):
+            operand = FORMATS[mode].replace('${:02x}', f'z{value:02x}')
+            lines.append(f'    {mnemonic.lower()}' + operand)
+        else:
+            lines.append(f'    {mnemonic.lower()}' + FORMATS[mode].format(value))
+    if len(program) in targets:
+        lines.append(f'l{len(program)}:')
+    return '\n'.join(lines) + '\n'
+
+
+def encode(program):
+    """The bytes of the program, from the opcode table alone."""
+    found = addresses(program)
+    output = bytearray()
+    for index, (mnemonic, mode, value) in enumerate(program):
+        opcode, length, _ = ENCODE[mnemonic, mode]
+        if mode == 'relative':
+            value = found[value] - (found[index] + 2)
+        output.append(opcode)
+        if length >= 2:
+            output.append(value & 0xFF)
+        if length == 3:
+            output.append(value >> 8)
+    return bytes(output)
+
+
+def equates(symbols, forward):
+    return ''.join(f'{name} = ${value:02x}\n' for name, value in symbols.items()
+                   if (value % 4 == 2) == forward)
+
+
+def assemble_asm(source, size, symbols={}):
+    # those after the code are forward references, narrowed by relaxation
+    source = equates(symbols, False) + source + equates(symbols, True)
+    return Assembler(predefined={}).assemble(source)
+
+
+def assemble_02(source, size, symbols={}):
+    session = load_asm02().Session(labels=dict(symbols))
+    return bytes(session.assemble(f'    org ${BASE_02:04x}\n' + source)[:size])
+
+
+def disassemble(data, base):
+    return ''.join(f'    {text}\n' for _, _, text in load_disa().decode(data, base=base))
+
+
+CHECKS = {
+    'asm': lambda source, expected, symbols: assemble_asm(source, len(expected), symbols),
+    '02': lambda source, expected, symbols: assemble_02(source, len(expected), symbols),
+    'asm-trip': lambda source, expected, symbols: assemble_asm(disassemble(expected, 0), len(expected)),
+    '02-trip': lambda source, expected, symbols: assemble_02(disassemble(expected, BASE_02), len(expected)),
+}
+
+
+def run_check(name, program):
+    """None if the check passes, else what it produced: bytes or an error."""
+    expected = encode(program)
+    try:
+        got = CHECKS[name](render(program), expected, symbols(program))
+    except Exception as e:
+        return f'{type(e).__name__}: {e}'
+    return None if got == expected else got
+
+
+def check(program):
+    """(check name, result) for the first check that fails, or None."""
+    for name in CHECKS:
+        result = run_check(name, program)
+        if result is not None:
+            return name, result
+    return None
+
+
+def remove(program, start, stop):
+    """
+    The program without instructions start to stop, branches to them now
+    going to the instruction after; None if a branch is left out of reach.
+    """
+    removed = stop - start
+    shrunk = []
+    for mnemonic, mode, value in program[:start] + program[stop:]:
+        if mode == 'relative':
+            if value >= stop:
+                value -= removed
+            elif value > start:
+                value = start
+        shrunk.append((mnemonic, mode, value))
+    return shrunk if in_reach(shrunk) else None
+
+
+def shrink(program, name):
+    """Drop ever smaller runs of instructions while check name still fails."""
+    chunk = len(program) // 2
+    while chunk >= 1:
+        index = 0
+        while index < len(program):
+            candidate = remove(program, index, index + chunk)
+            if candidate is not None and run_check(name, candidate) is not None:
+                program = candidate
+            else:
+                index += chunk
+        chunk //= 2
+    return program
+
+
+def fuzz_batch(seeds, size):
+    """
+    Run the programs of a batch of seeds in a worker.  Returns the number
+    of instructions checked and (seed, check, shrunk program) per failure.
+    """
+    instructions = 0
+    failures = []
+    for seed in seeds:
+        program = generate(seed, size)
+        instructions += len(program)
+        failed = check(program)
+        if failed is not None:
+            failures.append((seed, failed[0], shrink(program, failed[0])))
+    return instructions, failures
+
+
+def report(seed, name, program):
+    expected = encode(program)
+    got = run_check(name, program)
+    lines = [f'FAIL seed {seed}: {name}, {len(program)} instructions after shrinking']
+    lines += [f'  {name} = ${value:02x}' for name, value in symbols(program).items()]
+    lines += ['  ' + line for line in render(program).splitlines()]
+    lines.append(f'  expected {expected.hex(" ")}')
+    lines.append(f'  got      {got.hex(" ") if isinstance(got, bytes) else got}')
+    return lines
+
+
+def main():
+    parser = argparse.ArgumentParser(description='differential fuzzer for the assemblers')
+    parser.add_argument('-j', '--jobs', type=int, default=os.cpu_count() or 1)
+    parser.add_argument('--seconds', type=float, default=60, help='how long to run')
+    parser.add_argument('--programs', type=int, help='run this many programs instead')
+    parser.add_argument('--size', type=int, default=200, help='instructions per program')
+    parser.add_argument('--batch', type=int, default=50, help='programs per worker task')
+    parser.add_argument('--seed', type=int, default=0, help='seed of the first program')
+    parser.add_argument('--replay', type=int, metavar='SEED', help='run one program and shrink it')
+    args = parser.parse_args()
+
+    if args.replay is not None:
+        _, failures = fuzz_batch([args.replay], args.size)
+        for seed, name, program in failures:
+            print('\n'.join(report(seed, name, program)))
+        if not failures:
+            print(f'seed {args.replay}: ok')
+        sys.exit(1 if failures else 0)
+
+    limit = args.programs
+    deadline = None if limit is not None else time.perf_counter() + args.seconds
+    next_seed = args.seed
+    programs = instructions = failed = 0
+    start = time.perf_counter()
+
+    def submit(pool):
+        nonlocal next_seed
+        count = args.batch if limit is None else min(args.batch, args.seed + limit - next_seed)
+        seeds = range(next_seed, next_seed + count)
+        next_seed += count
+        return pool.submit(fuzz_batch, seeds, args.size), count
+
+    with ProcessPoolExecutor(max_workers=args.jobs) as pool:
+        pending = {}
+        while True:
+            # keep two batches queued per worker while there is work left
+            while len(pending) < 2 * args.jobs and (
+                    deadline is None and next_seed < args.seed + limit
+                    or deadline is not None and time.perf_counter() < deadline):
+                future, count = submit(pool)
+                pending[future] = count
+            if not pending:
+                break
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                programs += pending.pop(future)
+                checked, failures = future.result()
+                instructions += checked
+                for seed, name, program in failures:
+                    failed += 1
+                    print('\n'.join(report(seed, name, program)))
+            elapsed = time.perf_counter() - start
+            print(f'{programs:,d} programs, {instructions:,d} instructions, '
+                  f'{instructions / elapsed * 60:,.0f}/min, {failed} failed', end='\r')
+
+    print()
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,243 @@
+"""
+Header files and the cache that keeps them from being parsed over and over.
+
+A header is a dasm style file of definitions, vcs.h being the usual one:
+
+    TIA_BASE_ADDRESS = 0
+    COLUBK  equ $09
+            SEG.U TIA_REGISTERS_WRITE
+            ORG TIA_BASE_ADDRESS
+    VSYNC   ds 1
+            IFNCONST NO_RIOT ... ENDIF
+
+parse_header() turns one into a {name: value} dict.  IncludeCache.load()
+remembers the result per file, keyed by path and mtime, with the content
+hash as a fallback so touching a file doesn't force a reparse.  Given a
+cache_dir it also keeps the parsed symbols on disk by content hash, which
+lets separate processes share one parse.  A header's entry also records
+the headers it includes, and is parsed again when any of them changes;
+files() lists them all, for tools that watch a build's inputs.  Only
+headers without nested includes go to the disk cache, whose key is the
+one file's content.
+"""
+from pathlib import Path
+
+import hashlib
+import json
+import os
+import threading
+
+from expr import compile_expression, names, value_of
+
+
+def evaluate(text, symbols):
+    """
+    The value of a header expression, e.g. "TIA_BASE_ADDRESS + $10",
+    compiled by expr.py as an operand is.  Names are case insensitive.
+    """
+    expression = compile_expression(text, fold_case=True)
+    value = value_of(expression, symbols)
+    if value is None:
+        undefined = next(name for name in names(expression) if name not in symbols)
+        raise ValueError(f'undefined symbol {undefined!r} in header')
+    return value
+
+
+# recognised even when they start in the first column
+DIRECTIVES = {
+    'ifconst', 'ifnconst', 'else', 'endif', 'eif', 'org', 'rorg', 'seg', 'seg.u',
+    'processor', 'echo', 'mac', 'macro', 'endm', 'endmac', 'include', 'ds', 'ds.b',
+}
+
+
+def parse_header(text, include=None):
+    """
+    Parse header text into {lowercased name: value}.  include, if given, is
+    called with the file name of a nested include directive and returns
+    that header's symbols.
+    """
+    symbols = {}
+    pc = 0
+    skipping = []      # one entry per open IF, True while its body is skipped
+    in_macro = False
+
+    for line_num, line in enumerate(text.splitlines(), 1):
+        line = line.split(';', 1)[0]
+        if not line.strip():
+            continue
+
+        words = line.replace('=', ' = ').split(None, 2)
+        has_label = not line[0].isspace() and words[0].lower() not in DIRECTIVES
+        if has_label:
+            name, directive, rest = (words + ['', ''])[:3]
+        else:
+            name = None
+            directive = words[0]
+            rest = ' '.join(words[1:])
+        directive = directive.lower()
+        rest = rest.strip()
+
+        if in_macro:
+            in_macro = directive not in ('endm', 'endmac')
+            continue
+
+        # conditionals nest even while skipping
+        if directive in ('ifconst', 'ifnconst'):
+            defined = rest.split()[0].lower() in symbols
+            skip = defined if directive == 'ifnconst' else not defined
+            skipping.append(skip or (bool(skipping) and skipping[-1]))
+            continue
+        if directive == 'else':
+            outer = len(skipping) > 1 and skipping[-2]
+            skipping[-1] = outer or not skipping[-1]
+            continue
+        if directive in ('endif', 'eif'):
+            skipping.pop()
+            continue
+        if skipping and skipping[-1]:
+            continue
+
+        if directive in ('=', 'equ', 'set'):
+            symbols[name.lower()] = evaluate(rest, symbols)
+        elif directive in ('ds', 'ds.b'):
+            if name:
+                symbols[name.lower()] = pc
+            pc += evaluate(rest, symbols) if rest else 1
+        elif directive in ('org', 'rorg'):
+            pc = evaluate(rest.split(',')[0], symbols)
+        elif directive in ('seg', 'seg.u', 'processor', 'echo', ''):
+            if name and not directive:
+                symbols[name.lower()] = pc
+        elif directive in ('mac', 'macro'):
+            in_macro = True
+        elif directive == 'include':
+            if include is None:
+                raise ValueError(f'line {line_num}: nested include not supported here')
+            symbols.update(include(rest.strip('"\'')))
+        else:
+            raise ValueError(f'line {line_num}: unsupported header line {line.strip()!r}')
+
+    return symbols
+
+
+class IncludeCache:
+    """
+    Parsed headers, keyed by resolved path.  Each entry is
+    (mtime_ns, size, sha1 of the content, symbols), and nested holds the
+    paths each header includes.  Safe to share between threads, and can be
+    pickled, entries and nested together, to seed another process's cache.
+    """
+
+    def __init__(self, cache_dir=None):
+        self.cache_dir = Path(cache_dir) if cache_dir else None
+        self.entries = {}
+        self.nested = {}
+        self.lock = threading.RLock()
+        self.parses = 0
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state['lock']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.lock = threading.RLock()
+
+    def resolve(self, name, search_dirs=()):
+        for directory in search_dirs:
+            path = Path(directory) / name
+            if path.exists():
+                return path.resolve()
+        path = Path(name)
+        if path.exists():
+            return path.resolve()
+        raise FileNotFoundError(f'include file {name!r} not found')
+
+    def load(self, name, search_dirs=()):
+        """Symbols defined by the header name, parsing it only if it changed."""
+        path = self.resolve(name, search_dirs)
+        key = str(path)
+        stat = os.stat(path)
+
+        with self.lock:
+            entry = self.entries.get(key)
+            unchanged = self.nested_unchanged(key)
+            if entry and entry[:2] == (stat.st_mtime_ns, stat.st_size) and unchanged:
+                return entry[3]
+
+            data = path.read_bytes()
+            digest = hashlib.sha1(data).hexdigest()
+            if entry and entry[2] == digest and unchanged:
+                symbols = entry[3]
+            else:
+                symbols = self.load_from_disk(digest)
+                if symbols is None:
+                    nested_dirs = [path.parent, *search_dirs]
+                    nested = []
+
+                    def include(name):
+                        nested.append(str(self.resolve(name, nested_dirs)))
+                        return self.load(name, nested_dirs)
+
+                    symbols = parse_header(data.decode('utf8'), include)
+                    self.parses += 1
+                    self.nested[key] = tuple(nested)
+                    if not nested:
+                        self.save_to_disk(digest, symbols)
+                else:
+                    self.nested[key] = ()
+
+            self.entries[key] = (stat.st_mtime_ns, stat.st_size, digest, symbols)
+            return symbols
+
+    def nested_unchanged(self, key):
+        """Whether the headers key includes, and theirs, are as parsed."""
+        for nested in self.nested.get(key, ()):
+            entry = self.entries.get(nested)
+            try:
+                stat = os.stat(nested)
+            except OSError:
+                return False
+            if entry is None or entry[:2] != (stat.st_mtime_ns, stat.st_size):
+                return False
+            if not self.nested_unchanged(nested):
+                return False
+        return True
+
+    def files(self, name, search_dirs=()):
+        """
+        Paths of the header name and every header it includes, nested ones
+        too, as of its last load().
+        """
+        found = []
+        pending = [str(self.resolve(name, search_dirs))]
+        while pending:
+            key = pending.pop()
+            if key not in found:
+                found.append(key)
+                pending.extend(self.nested.get(key, ()))
+        return [Path(key) for key in found]
+
+    def load_from_disk(self, digest):
+        if self.cache_dir is None:
+            return None
+        try:
+            with open(self.cache_dir / f'{digest}.json', 'r') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def save_to_disk(self, digest, symbols):
+        if self.cache_dir is None:
+            return
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        # write then rename so a parallel reader never sees half a file
+        tmp = self.cache_dir / f'{digest}.{os.getpid()}.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(symbols, f)
+        os.replace(tmp, self.cache_dir / f'{digest}.json')
+
+
+# shared by every assembly in the process unless one brings its own
+default_cache = IncludeCache()
@@ -0,0 +1,255 @@
+from asm import NO_CODE, ZEROPAGE_MODES, Assembler, check_zeropage, too_narrow
+from expr import names, symbolic, value_of
+from macros import uses_expansion
+from timing import analyse
+
+
+class Line:
+    """One source line and what it assembled to last time."""
+    __slots__ = ("text", "label", "opcode", "mode", "value", "encodings",
+                 "address", "data", "final_mode", "op", "length")
+
+    def __init__(self, text, parsed, encodings):
+        self.text = text
+        if parsed is None:
+            parsed = (None, None, None, None)
+        self.label, self.opcode, self.mode, self.value = parsed
+        self.encodings = encodings
+        self.address = None
+        self.data = b""
+        self.final_mode = None
+        self.op = None
+        self.length = 0
+
+    @property
+    def symbols(self):
+        """The names the operand depends on."""
+        return names(self.value)
+
+
+class IncrementalAssembler:
+    """
+    Reassemble a source after edits without redoing the whole file.
+
+    Parsed lines are cached by their text, so a line that is unchanged (or
+    merely moved) is never parsed again.  Each line keeps the bytes it
+    encoded to, and refs records which lines use which symbols.  An update
+    re-encodes the lines that changed, plus the lines that depend on a label
+    whose address moved, branches that moved relative to their target and
+    lines relaxation gave a different encoding.
+
+    The result is byte for byte what Assembler.assemble gives for the same
+    source without optimise.  Lines are taken one at a time, so a source
+    with macros or REPT blocks raises ValueError; asmd falls back to a
+    full Assembler build for those, and for -O.
+
+        inc = IncrementalAssembler()
+        image, changed = inc.update(source)
+        image, changed = inc.update(edited_source)
+
+    changed is a list of (start, end) byte ranges in the new image.  When the
+    image got shorter the last range runs from its new end to its old end.
+    """
+
+    def __init__(self, assembler=None):
+        self.assembler = assembler or Assembler()
+        self.parse_cache = {}
+        self.lines = []
+        self.refs = {}
+        self.symbols = {}
+        self.image = b""
+
+    def parse(self, text):
+        try:
+            parsed, encodings = self.parse_cache[text]
+        except KeyError:
+            assembler = self.assembler
+            parsed = assembler.parse_line(text)
+            encodings = None
+            if parsed is not None and parsed[1] is not None and parsed[1] != "=":
+                encodings = assembler.encodings(parsed[1], parsed[2], parsed[3])
+            self.parse_cache[text] = parsed, encodings
+        return Line(text, parsed, encodings)
+
+    def update(self, source):
+        """Assemble the new source text, returning (image, changed ranges)."""
+        try:
+            return self._update(source.splitlines())
+        except Exception:
+            # a failed update can leave lines half re-laid out, so the next
+            # update starts from scratch
+            self.lines = []
+            self.refs = {}
+            self.symbols = {}
+            self.image = b""
+            raise
+
+    def _update(self, texts):
+        old = self.lines
+        n_old, n_new = len(old), len(texts)
+
+        # Everything outside the edited window is reused as is
+        limit = min(n_old, n_new)
+        prefix = 0
+        while prefix < limit and old[prefix].text == texts[prefix]:
+            prefix += 1
+        suffix = 0
+        while (suffix < limit - prefix
+               and old[n_old - 1 - suffix].text == texts[n_new - 1 - suffix]):
+            suffix += 1
+
+        removed = old[prefix:n_old - suffix]
+        if uses_expansion(texts[prefix:n_new - suffix]):
+            raise ValueError("IncrementalAssembler doesn't expand MAC or REPT blocks")
+        fresh = [self.parse(text) for text in texts[prefix:n_new - suffix]]
+        lines = old[:prefix] + fresh + old[n_old - suffix:]
+
+        refs = self.refs
+        for line in removed:
+            for symbol in line.symbols:
+                refs[symbol].discard(line)
+        for line in fresh:
+            for symbol in line.symbols:
+                refs.setdefault(symbol, set()).add(line)
+
+        dirty = set(line for line in fresh if line.opcode is not None)
+        addresses, symbols = self.layout(lines, dirty)
+        self.encode(lines, dirty, addresses, symbols)
+
+        changed = self.changed_ranges(lines, dirty, addresses)
+        for line, address in zip(lines, addresses):
+            line.address = address
+
+        self.lines = lines
+        self.symbols = symbols
+        self.assembler.symbols = symbols
+        self.image = b"".join(line.data for line in lines)
+        return self.image, changed
+
+    @property
+    def records(self):
+        """
+        (line number, address, length, label) for each line of the last
+        update that emits bytes or defines a label or equate, as
+        Assembler.records gives them, for listing.listing_lines().
+        """
+        symbols = self.symbols
+        for number, line in enumerate(self.lines, 1):
+            if line.opcode == "=":
+                yield number, symbols.get(line.label, 0), 0, line.label
+            elif line.opcode is not None or line.label is not None:
+                yield number, line.address, line.length, line.label
+
+    def timing_report(self):
+        """Cycle counts and scanline spans of the last update, as Assembler.timing_report()."""
+        symbols = self.symbols
+        encode = self.assembler.encode
+        instructions = [
+            (number, line.address, line.op, line.opcode, line.final_mode,
+             encode[line.opcode, line.final_mode][2], value_of(line.value, symbols))
+            for number, line in enumerate(self.lines, 1) if line.length
+        ]
+        return analyse(instructions)
+
+    def layout(self, lines, dirty):
+        """
+        Work out every line's address and encoding and the symbol table,
+        relaxing the whole file as Assembler.assemble does: symbolic operands
+        start narrow and are widened until every value fits.  Both encodings
+        of a line were worked out when it was parsed, so a pass is only a
+        walk over the lines.  Lines whose encoding changed, lines using a
+        symbol whose value changed and branches that moved relative to their
+        target join the dirty set.
+        """
+        predefined = self.assembler.predefined
+        wide = set()
+        while True:
+            symbols = dict(predefined)
+            addresses = []
+            entries = []
+            address = 0
+            for line in lines:
+                addresses.append(address)
+                if line.opcode == "=":
+                    value = line.value
+                    resolved = value_of(value, symbols)
+                    if resolved is not None:
+                        symbols[line.label] = resolved
+                    entries.append(NO_CODE)
+                    continue
+                if line.label is not None:
+                    symbols[line.label] = address
+                if line.encodings is None:
+                    entries.append(NO_CODE)
+                    continue
+                entry = line.encodings[line in wide]
+                entries.append(entry)
+                address += entry[2]
+
+            grown = [line for line, entry in zip(lines, entries)
+                     if line not in wide and too_narrow(entry, line.value, symbols)]
+            if not grown:
+                break
+            wide.update(grown)
+
+        for line, entry in zip(lines, entries):
+            if (line.final_mode, line.op, line.length) != entry:
+                line.final_mode, line.op, line.length = entry
+                dirty.add(line)
+
+        old_symbols = self.symbols
+        for name in symbols.keys() | old_symbols.keys():
+            if symbols.get(name) != old_symbols.get(name):
+                dirty.update(self.refs.get(name, ()))
+        for line, address in zip(lines, addresses):
+            if line.final_mode == "relative" and line.address != address:
+                dirty.add(line)
+        return addresses, symbols
+
+    def encode(self, lines, dirty, addresses, symbols):
+        branch_offset = self.assembler.branch_offset
+        for line, address in zip(lines, addresses):
+            if line not in dirty or not line.length:
+                continue
+
+            value = line.value
+            symbol = None
+            if symbolic(value):
+                symbol = value
+                value = value_of(symbol, symbols)
+                if value is None:
+                    raise ValueError(f"Undefined symbol: {symbol}")
+                if line.final_mode in ZEROPAGE_MODES:
+                    check_zeropage(line.opcode, line.final_mode, symbol, value)
+            if line.final_mode == "relative":
+                value = branch_offset(address, symbol, value)
+
+            length = line.length
+            if length == 1:
+                line.data = bytes((line.op,))
+            elif length == 2:
+                line.data = bytes((line.op, value & 0xFF))
+            else:
+                line.data = bytes((line.op, value & 0xFF, (value >> 8) & 0xFF))
+
+    def changed_ranges(self, lines, dirty, addresses):
+        # line.address and self.image still describe the previous build here
+        old_image = self.image
+        ranges = []
+        end = 0
+        for line, address in zip(lines, addresses):
+            length = line.length
+            if not length:
+                continue
+            end = address + length
+            if line.address == address and (
+                line not in dirty or old_image[address:end] == line.data
+            ):
+                continue
+            if ranges and ranges[-1][1] == address:
+                ranges[-1][1] = end
+            else:
+                ranges.append([address, end])
+        if end < len(old_image):
+            ranges.append([end, len(old_image)])
+        return [tuple(r) for r in ranges]
@@ -0,0 +1,62 @@
+"""
+The Assembler's intermediate representation: the parsed program as
+columns of machine integers rather than a list of per-line records.
+
+Most lines of a kernel are repeats ("sta WSYNC", "dex", "bne loop"), so
+each distinct parsed line, a form, is stored once.  A line is then its
+source line number and form id, two entries in arrays; relaxation's
+widened flag is a byte and layout fills in a 4-byte address.  Blank and
+comment lines aren't stored at all.  That is 13 bytes a line plus the
+forms, against a few hundred for a list of tuples of Python objects.
+"""
+from array import array
+
+
+class Program:
+    """
+    Columns, one entry per line that holds anything:
+
+        numbers    source line number
+        form_ids   index into forms
+        wide       1 where relaxation widened the operand to absolute
+        forward    1 where the operand names a symbol defined further on
+        addresses  the line's address, filled in by layout
+
+    forms holds each distinct parsed line once, as (label, opcode, mode,
+    value) the way Assembler.parse_line returns it.
+    """
+
+    __slots__ = ('numbers', 'form_ids', 'wide', 'forward', 'addresses', 'forms', 'form_index')
+
+    def __init__(self):
+        self.numbers = array('I')
+        self.form_ids = array('I')
+        self.wide = bytearray()
+        self.forward = bytearray()
+        self.addresses = array('I')
+        self.forms = []
+        self.form_index = {}
+
+    def __len__(self):
+        return len(self.numbers)
+
+    def append(self, number, parsed, forward=False):
+        """Add a line.  Returns its form id and whether the form is new."""
+        form_id = self.form_index.get(parsed)
+        new = form_id is None
+        if new:
+            form_id = self.form_index[parsed] = len(self.forms)
+            self.forms.append(parsed)
+        self.numbers.append(number)
+        self.form_ids.append(form_id)
+        self.forward.append(forward)
+        return form_id, new
+
+    def finish(self):
+        """
+        Size the columns filled in later, once every line is in, and drop
+        the index of forms, which only append needs.
+        """
+        self.form_index = None
+        self.wide = bytearray(len(self))
+        self.addresses = array('I', bytes(4 * len(self)))
@@ -0,0 +1,121 @@
+"""
+The lexer shared by the assemblers: one precompiled master pattern, run
+with finditer over each line, turns source text into typed tokens.
+
+    with open('ball.asm') as f:
+        for token in tokenise(f):
+            ...
+
+tokenise() reads lazily from any iterable of lines, a file object
+included, so a source is never held in memory as a whole.  scan() lexes
+a single line.
+
+Token kinds:
+
+  name      mnemonics, labels, registers and directives: sta, WSYNC, .word
+  number    $ff (hex), %1010 (binary) or 123 (decimal)
+  string    "vcs.h" or 'vcs.h', quotes included
+  comment   from ; to the end of the line, ; included
+  newline   the end of a line, from tokenise() only
+  error     any character nothing else matches
+
+and each operator or punctuation character is its own kind:
+# ( ) , : = + - * / < > ! & | ^ ~ [ ] and the shifts << and >>.  Spaces are
+skipped; every token keeps its line and column.  expr.py compiles
+operand expressions from scan()'s tokens.
+
+Parsers that know the shape of a line can skip the token stream and use
+one match of a whole-line pattern instead, several times faster in Python
+than walking tokens.  words() is the split on spaces and commas 02/asm.py
+works with; STATEMENT takes an Assembler line apart into label, mnemonic
+and operand, and OPERAND an operand into its addressing mode and value.
+The two front ends stay on these rather than tokenise(): built on typed
+tokens, 02/asm.py ran about 20% slower end to end (116k against 137k
+lines/s on 100k generated lines) and Assembler.parse_line about four
+times slower, for the same output.  Both still read their source a line
+at a time from the open file.
+"""
+from collections import namedtuple
+
+import re
+
+Token = namedtuple('Token', 'kind text line column')
+
+# one group per kind, in the order of KINDS; leading space is swallowed by
+# each match rather than matched on its own
+MASTER = re.compile(r'''[ \t\r\n]*(?:
+    (;.*)                             # comment
+  | (\$[0-9A-Fa-f]+|%[01]+|\d+)        # number
+  | ([A-Za-z_.][\w.]*)                 # name
+  | ("[^"]*"|'[^']*')                 # string
+  | (<<|>>|[#(),:=+\-*/<>!&|^~\[\]])  # operators and punctuation, their own kinds
+  | (\S)                              # error
+)''', re.VERBOSE)
+
+KINDS = (None, 'comment', 'number', 'name', 'string', None, 'error')
+
+# words for splitting on spaces and commas, quoted strings kept whole,
+# or a comment
+WORDS = re.compile(r'''(?:"[^"]*"|'[^']*'|[^\s,;"'])+|;.*''')
+
+NAME = r'[A-Za-z_.][\w.]*'
+
+# a whole Assembler line: an optional label, then a mnemonic (or the name
+# of an equate) and its operand, then an optional comment.  Runs of spaces
+# are matched greedily, so nothing backtracks on a well formed line.
+STATEMENT = re.compile(rf'''[ \t]*
+    (?:(?P<label>{NAME})[ \t]*:)?[ \t]*
+    (?:(?P<name>{NAME})
+       (?:[ \t]*(?P<equals>=)|[ \t]+(?P<equ>(?i:equ))(?=\s))?
+       [ \t]*(?P<operand>[^;\s]+(?:[ \t]+[^;\s]+)*)?)?
+    [ \t]*(?:;.*)?$''', re.VERBOSE)
+
+# an operand, one group per addressing mode, named after it
+VALUE = r'[^\s,()#;]+(?:[ \t]+[^\s,()#;]+)*'
+OPERAND = re.compile(rf'''[ \t]*(?:
+    (?P<accumulator>[Aa])
+  | \#[ \t]*(?P<immediate>[^;]+?)
+  | \([ \t]*(?P<indirect_x>{VALUE})[ \t]*,[ \t]*[Xx][ \t]*\)
+  | \([ \t]*(?P<indirect_y>{VALUE})[ \t]*\)[ \t]*,[ \t]*[Yy]
+  | \([ \t]*(?P<indirect>{VALUE})[ \t]*\)
+  | (?P<absolute_x>{VALUE})[ \t]*,[ \t]*[Xx]
+  | (?P<absolute_y>{VALUE})[ \t]*,[ \t]*[Yy]
+  | (?P<absolute>{VALUE})
+)[ \t]*$''', re.VERBOSE)
+
+_new = tuple.__new__
+
+
+def scan(text, line=0):
+    """The tokens of one line of source, as a list."""
+    tokens = []
+    append = tokens.append
+    kinds = KINDS
+    for match in MASTER.finditer(text):
+        index = match.lastindex
+        value = match.group(index)
+        # Token(...) through tuple.__new__ skips the namedtuple's Python
+        # level __new__, which is most of the cost of a token
+        append(_new(Token, (kinds[index] or value, value, line, match.end() - len(value))))
+    return tokens
+
+
+def tokenise(lines):
+    """
+    Yield the tokens of an iterable of lines, numbered from 1, with a
+    newline token after each line.
+    """
+    for number, text in enumerate(lines, 1):
+        yield from scan(text, number)
+        yield Token('newline', '', number, len(text))
+
+
+def words(text):
+    """
+    Split a line on spaces and commas, as 02/asm.py reads it.  Returns
+    (words, comment), comment being the text after the ; or None.
+    """
+    found = WORDS.findall(text)
+    if found and found[-1][0] == ';':
+        return found[:-1], found[-1][1:].strip()
+    return found, None
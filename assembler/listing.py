@@ -0,0 +1,130 @@
+"""
+Listing files and hex dumps, written in one streaming pass.
+
+Output goes to a binary stream in chunks of a few thousand lines, so a 64K
+image costs a handful of write calls instead of one print per byte.  Runs
+of zero bytes are found with a regular expression over the whole image
+rather than by testing each byte in Python.
+"""
+from timing import format_cycles
+
+import re
+
+HEX = [f'{b:02X}' for b in range(256)]
+
+# bytes shown on a listing line; longer data continues on following lines
+BYTES_PER_LINE = 3
+
+NONZERO = re.compile(rb'[^\x00]+')
+
+
+def nonzero_lines(data, width=16):
+    """Indexes of the width-byte lines of data holding any non-zero byte."""
+    lines = []
+    last = -1
+    for match in NONZERO.finditer(data):
+        first = max(match.start() // width, last + 1)
+        last = (match.end() - 1) // width
+        lines.extend(range(first, last + 1))
+    return lines
+
+
+def write_chunks(out, lines, chunk_lines=4096):
+    """Write an iterable of text lines to the binary stream out."""
+    chunk = []
+    for line in lines:
+        chunk.append(line)
+        if len(chunk) >= chunk_lines:
+            out.write(''.join(chunk).encode())
+            chunk.clear()
+    if chunk:
+        out.write(''.join(chunk).encode())
+
+
+def hex_dump_lines(data, width=16, skip_zeros=True):
+    """
+    Hex dump lines with offset, hex and ASCII columns.  With skip_zeros
+    each run of all-zero lines is shown as a single '*'.
+    """
+    data = bytes(data)
+    table = [f'{b:02x}' for b in range(256)]
+    printable = bytes(b if 32 <= b <= 126 else ord('.') for b in range(256))
+    if skip_zeros:
+        rows = nonzero_lines(data, width)
+    else:
+        rows = range((len(data) + width - 1) // width)
+
+    expected = 0
+    for row in rows:
+        if row != expected:
+            yield '*\n'
+        expected = row + 1
+        offset = row * width
+        chunk = data[offset:offset + width]
+        hex_values = ' '.join([table[b] for b in chunk])
+        ascii_values = chunk.translate(printable).decode('ascii')
+        yield f'{offset:08x}  {hex_values:<{width * 3 - 1}}  |{ascii_values}|\n'
+    if skip_zeros and expected * width < len(data):
+        yield '*\n'
+
+
+def listing_lines(source_lines, records, image, symbols=None, base=0, timing=None):
+    """
+    Listing text for an assembly.  records has one entry per source line
+    that produced output or defined a label, (line number, address, length,
+    label), in line order with possibly several for one line; image holds
+    the assembled bytes with image[0] at address base.  A symbol table
+    follows when symbols is given.
+
+    timing, a timing.analyse() report, adds two columns: each
+    instruction's cycles and the running total of its scanline span, and
+    a marker line after a span that may run over budget.
+    """
+    hex_table = HEX
+    records = iter(records)
+    record = next(records, None)
+
+    cycles = {}
+    over = set()
+    blank = ''
+    if timing is not None:
+        for entry in timing['lines']:
+            cycles[entry['address']] = (f'{format_cycles(entry["min"], entry["max"]):>5} '
+                                        f'{format_cycles(entry["span_min"], entry["span_max"]):>7}  ')
+        over = {span['last_address'] for span in timing['spans'] if span['warn']}
+        blank = f'{"":5} {"":7}  '
+        marker = f'{"":5}  {"":4}  {"":8}  {blank}; ^ over {timing["budget"]} cycles\n'
+
+    for number, text in enumerate(source_lines, 1):
+        if record is None or record[0] != number:
+            yield f'{number:5d}  {"":4}  {"":8}  {blank}{"":12}  {text}\n'
+            continue
+
+        first = True
+        # a macro call or REPT block has one record per line it expanded to
+        while record is not None and record[0] == number:
+            _, address, length, label = record
+            record = next(records, None)
+            offset = address - base
+            data = image[offset:offset + length]
+            shown = ' '.join([hex_table[b] for b in data[:BYTES_PER_LINE]])
+            timed = cycles.get(address, blank) if length else blank
+            if first:
+                yield f'{number:5d}  {address:04X}  {shown:<8}  {timed}{label or "":<12}  {text}\n'
+                first = False
+            elif length:
+                yield f'{"":5}  {address:04X}  {shown:<8}' + (f'  {timed}' if timed else '') + '\n'
+            for more in range(BYTES_PER_LINE, length, BYTES_PER_LINE):
+                shown = ' '.join([hex_table[b] for b in data[more:more + BYTES_PER_LINE]])
+                yield f'{"":5}  {address + more:04X}  {shown:<8}\n'
+            if length and address in over:
+                yield marker
+
+    if symbols:
+        yield '\nSymbols:\n'
+        for name in sorted(symbols):
+            yield f'  {name:<24} ${symbols[name]:04X}\n'
+
+
+def write_listing(out, source_lines, records, image, symbols=None, base=0, timing=None):
+    write_chunks(out, listing_lines(source_lines, records, image, symbols, base, timing))
@@ -0,0 +1,166 @@
+"""
+MAC/ENDM macros and REPT/REPEND blocks, written as in dasm.
+
+        MAC sleep
+        REPT {1}
+        nop
+        REPEND
+        ENDM
+
+        sleep 23
+
+Arguments are separated by commas and replace {1}, {2}, ... in the body.
+MACRO and REPEAT are accepted as well as MAC and REPT.
+
+Expansion sits between reading lines and encoding them.  expand() is a
+generator of (line number, parsed line) pairs, parsed by whatever parse
+function the assembler hands over.  Each distinct macro call (name and
+arguments) and each REPT body is parsed once; every later copy is replayed
+from the cache, so a kernel unrolled a thousand times costs one parse per
+distinct line.  Lines coming out of an expansion carry the number of the
+line that called the macro or opened the REPT.
+
+Copies are identical, labels included, so a label in a body is only
+allowed where it is defined once: in a REPT of one, or in a macro called
+once.  Anything more is an error rather than a duplicate label.
+"""
+import re
+
+DEFINE = {'mac', 'macro'}
+END_DEFINE = 'endm'
+REPEAT = {'rept', 'repeat'}
+END_REPEAT = 'repend'
+
+PARAMETER = re.compile(r'\{(\d+)\}')
+
+# a label definition at the start of a line, in either assembler
+LABEL = re.compile(r'[ \t]*([A-Za-z_.][\w.]*)[ \t]*:')
+
+
+def split_directive(text):
+    """The first word of a line, lower case, and the rest without comment."""
+    words = text.split(';', 1)[0].split(None, 1)
+    if not words:
+        return '', ''
+    return words[0].lower(), words[1].strip() if len(words) > 1 else ''
+
+
+def uses_expansion(lines):
+    """Whether any of the lines defines a macro or opens a REPT block."""
+    opens = DEFINE | REPEAT
+    return any(split_directive(text)[0] in opens for text in lines)
+
+
+def body_labels(body):
+    """The labels defined by the lines of a body, nested blocks included."""
+    labels = []
+    for text in body:
+        match = LABEL.match(text.split(';', 1)[0])
+        if match is not None:
+            labels.append(match.group(1))
+    return labels
+
+
+def parse_count(text, number):
+    text = text.strip()
+    try:
+        if text.startswith('$'):
+            return int(text[1:], 16)
+        return int(text)
+    except ValueError:
+        raise ValueError(f'line {number}: REPT needs a number, not {text!r}') from None
+
+
+class Macros:
+    """
+    Macro definitions and expansion caches for one assembly.  parse turns
+    a line of text into what the assembler works on; it must not keep
+    state, as its results are shared between copies.
+    """
+
+    def __init__(self, parse):
+        self.parse = parse
+        self.definitions = {}
+        # macro name -> labels its body defines, for those that define any
+        self.labels = {}
+        self.called = set()
+        # (name, arguments) -> parsed lines
+        self.expansions = {}
+        # REPT body text -> parsed lines
+        self.blocks = {}
+
+    def expand(self, lines):
+        """
+        lines is an iterable of (line number, text).  Yields (line number,
+        parsed) for everything but the directives themselves.
+        """
+        lines = iter(lines)
+        parse = self.parse
+        definitions = self.definitions
+        for number, text in lines:
+            word, rest = split_directive(text)
+            if word in definitions:
+                if word in self.labels:
+                    if word in self.called:
+                        raise ValueError(f'line {number}: macro {word} defines label '
+                                         f'{self.labels[word][0]}, so it can only be called once')
+                    self.called.add(word)
+                for parsed in self.call(word, rest):
+                    yield number, parsed
+            elif word in REPEAT:
+                count = parse_count(rest, number)
+                body = tuple(self.collect(lines, number, REPEAT, END_REPEAT))
+                if count > 1:
+                    labels = body_labels(body)
+                    if labels:
+                        raise ValueError(f'line {number}: label {labels[0]} in a REPT body would '
+                                         f'be defined {count} times')
+                parsed_body = self.blocks.get(body)
+                if parsed_body is None:
+                    parsed_body = self.blocks[body] = self.parse_body(body)
+                for _ in range(count):
+                    for parsed in parsed_body:
+                        yield number, parsed
+            elif word in DEFINE:
+                if not rest:
+                    raise ValueError(f'line {number}: MAC needs a name')
+                name = rest.split()[0].lower()
+                definitions[name] = tuple(self.collect(lines, number, DEFINE, END_DEFINE))
+                labels = body_labels(definitions[name])
+                if labels:
+                    self.labels[name] = labels
+                else:
+                    self.labels.pop(name, None)
+            elif word in (END_DEFINE, END_REPEAT):
+                raise ValueError(f'line {number}: {word.upper()} without a matching start')
+            else:
+                yield number, parse(text)
+
+    def call(self, name, rest):
+        arguments = tuple(argument.strip() for argument in rest.split(',')) if rest else ()
+        key = (name, arguments)
+        parsed_body = self.expansions.get(key)
+        if parsed_body is None:
+            def substitute(match):
+                index = int(match.group(1)) - 1
+                return arguments[index] if index < len(arguments) else ''
+            body = [PARAMETER.sub(substitute, text) for text in self.definitions[name]]
+            parsed_body = self.expansions[key] = self.parse_body(body)
+        return parsed_body
+
+    def parse_body(self, body):
+        return tuple(parsed for _, parsed in self.expand(enumerate(body, 1)))
+
+    def collect(self, lines, number, opens, close):
+        """Body lines up to the matching close, allowing nested blocks."""
+        depth = 0
+        for _, text in lines:
+            word, _ = split_directive(text)
+            if word in opens:
+                depth += 1
+            elif word == close:
+                if not depth:
+                    return
+                depth -= 1
+            yield text
+        raise ValueError(f'line {number}: no {close.upper()} before the end of the file')
@@ -0,0 +1,221 @@
+# 6502 opcode tables shared by the assemblers and the disassembler.
+#
+# Each mnemonic maps an addressing mode to (opcode, base cycles).  The
+# instruction length follows from the addressing mode.  Everything the
+# assemblers need at encode time is flattened into ENCODE so a lookup is a
+# single dict probe on (mnemonic, mode).
+
+MODE_LENGTH = {
+    'implied': 1,
+    'accumulator': 1,
+    'immediate': 2,
+    'zeropage': 2,
+    'zeropage_x': 2,
+    'zeropage_y': 2,
+    'relative': 2,
+    'indirect_x': 2,
+    'indirect_y': 2,
+    'absolute': 3,
+    'absolute_x': 3,
+    'absolute_y': 3,
+    'indirect': 3,
+}
+
+# zero page form of each absolute mode, used when an operand fits in a byte
+ZEROPAGE_MODE = {
+    'absolute': 'zeropage',
+    'absolute_x': 'zeropage_x',
+    'absolute_y': 'zeropage_y',
+}
+
+DOCUMENTED = {
+    'ADC': {'immediate': (0x69, 2), 'zeropage': (0x65, 3), 'zeropage_x': (0x75, 4),
+            'absolute': (0x6D, 4), 'absolute_x': (0x7D, 4), 'absolute_y': (0x79, 4),
+            'indirect_x': (0x61, 6), 'indirect_y': (0x71, 5)},
+    'AND': {'immediate': (0x29, 2), 'zeropage': (0x25, 3), 'zeropage_x': (0x35, 4),
+            'absolute': (0x2D, 4), 'absolute_x': (0x3D, 4), 'absolute_y': (0x39, 4),
+            'indirect_x': (0x21, 6), 'indirect_y': (0x31, 5)},
+    'ASL': {'accumulator': (0x0A, 2), 'zeropage': (0x06, 5), 'zeropage_x': (0x16, 6),
+            'absolute': (0x0E, 6), 'absolute_x': (0x1E, 7)},
+    'BCC': {'relative': (0x90, 2)},
+    'BCS': {'relative': (0xB0, 2)},
+    'BEQ': {'relative': (0xF0, 2)},
+    'BIT': {'zeropage': (0x24, 3), 'absolute': (0x2C, 4)},
+    'BMI': {'relative': (0x30, 2)},
+    'BNE': {'relative': (0xD0, 2)},
+    'BPL': {'relative': (0x10, 2)},
+    'BRK': {'implied': (0x00, 7)},
+    'BVC': {'relative': (0x50, 2)},
+    'BVS': {'relative': (0x70, 2)},
+    'CLC': {'implied': (0x18, 2)},
+    'CLD': {'implied': (0xD8, 2)},
+    'CLI': {'implied': (0x58, 2)},
+    'CLV': {'implied': (0xB8, 2)},
+    'CMP': {'immediate': (0xC9, 2), 'zeropage': (0xC5, 3), 'zeropage_x': (0xD5, 4),
+            'absolute': (0xCD, 4), 'absolute_x': (0xDD, 4), 'absolute_y': (0xD9, 4),
+            'indirect_x': (0xC1, 6), 'indirect_y': (0xD1, 5)},
+    'CPX': {'immediate': (0xE0, 2), 'zeropage': (0xE4, 3), 'absolute': (0xEC, 4)},
+    'CPY': {'immediate': (0xC0, 2), 'zeropage': (0xC4, 3), 'absolute': (0xCC, 4)},
+    'DEC': {'zeropage': (0xC6, 5), 'zeropage_x': (0xD6, 6),
+            'absolute': (0xCE, 6), 'absolute_x': (0xDE, 7)},
+    'DEX': {'implied': (0xCA, 2)},
+    'DEY': {'implied': (0x88, 2)},
+    'EOR': {'immediate': (0x49, 2), 'zeropage': (0x45, 3), 'zeropage_x': (0x55, 4),
+            'absolute': (0x4D, 4), 'absolute_x': (0x5D, 4), 'absolute_y': (0x59, 4),
+            'indirect_x': (0x41, 6), 'indirect_y': (0x51, 5)},
+    'INC': {'zeropage': (0xE6, 5), 'zeropage_x': (0xF6, 6),
+            'absolute': (0xEE, 6), 'absolute_x': (0xFE, 7)},
+    'INX': {'implied': (0xE8, 2)},
+    'INY': {'implied': (0xC8, 2)},
+    'JMP': {'absolute': (0x4C, 3), 'indirect': (0x6C, 5)},
+    'JSR': {'absolute': (0x20, 6)},
+    'LDA': {'immediate': (0xA9, 2), 'zeropage': (0xA5, 3), 'zeropage_x': (0xB5, 4),
+            'absolute': (0xAD, 4), 'absolute_x': (0xBD, 4), 'absolute_y': (0xB9, 4),
+            'indirect_x': (0xA1, 6), 'indirect_y': (0xB1, 5)},
+    'LDX': {'immediate': (0xA2, 2), 'zeropage': (0xA6, 3), 'zeropage_y': (0xB6, 4),
+            'absolute': (0xAE, 4), 'absolute_y': (0xBE, 4)},
+    'LDY': {'immediate': (0xA0, 2), 'zeropage': (0xA4, 3), 'zeropage_x': (0xB4, 4),
+            'absolute': (0xAC, 4), 'absolute_x': (0xBC, 4)},
+    'LSR': {'accumulator': (0x4A, 2), 'zeropage': (0x46, 5), 'zeropage_x': (0x56, 6),
+            'absolute': (0x4E, 6), 'absolute_x': (0x5E, 7)},
+    'NOP': {'implied': (0xEA, 2)},
+    'ORA': {'immediate': (0x09, 2), 'zeropage': (0x05, 3), 'zeropage_x': (0x15, 4),
+            'absolute': (0x0D, 4), 'absolute_x': (0x1D, 4), 'absolute_y': (0x19, 4),
+            'indirect_x': (0x01, 6), 'indirect_y': (0x11, 5)},
+    'PHA': {'implied': (0x48, 3)},
+    'PHP': {'implied': (0x08, 3)},
+    'PLA': {'implied': (0x68, 4)},
+    'PLP': {'implied': (0x28, 4)},
+    'ROL': {'accumulator': (0x2A, 2), 'zeropage': (0x26, 5), 'zeropage_x': (0x36, 6),
+            'absolute': (0x2E, 6), 'absolute_x': (0x3E, 7)},
+    'ROR': {'accumulator': (0x6A, 2), 'zeropage': (0x66, 5), 'zeropage_x': (0x76, 6),
+            'absolute': (0x6E, 6), 'absolute_x': (0x7E, 7)},
+    'RTI': {'implied': (0x40, 6)},
+    'RTS': {'implied': (0x60, 6)},
+    'SBC': {'immediate': (0xE9, 2), 'zeropage': (0xE5, 3), 'zeropage_x': (0xF5, 4),
+            'absolute': (0xED, 4), 'absolute_x': (0xFD, 4), 'absolute_y': (0xF9, 4),
+            'indirect_x': (0xE1, 6), 'indirect_y': (0xF1, 5)},
+    'SEC': {'implied': (0x38, 2)},
+    'SED': {'implied': (0xF8, 2)},
+    'SEI': {'implied': (0x78, 2)},
+    'STA': {'zeropage': (0x85, 3), 'zeropage_x': (0x95, 4),
+            'absolute': (0x8D, 4), 'absolute_x': (0x9D, 5), 'absolute_y': (0x99, 5),
+            'indirect_x': (0x81, 6), 'indirect_y': (0x91, 6)},
+    'STX': {'zeropage': (0x86, 3), 'zeropage_y': (0x96, 4), 'absolute': (0x8E, 4)},
+    'STY': {'zeropage': (0x84, 3), 'zeropage_x': (0x94, 4), 'absolute': (0x8C, 4)},
+    'TAX': {'implied': (0xAA, 2)},
+    'TAY': {'implied': (0xA8, 2)},
+    'TSX': {'implied': (0xBA, 2)},
+    'TXA': {'implied': (0x8A, 2)},
+    'TXS': {'implied': (0x9A, 2)},
+    'TYA': {'implied': (0x98, 2)},
+}
+
+# The "stable" undocumented opcodes: they behave the same on every NMOS 6502
+# and 2600 code uses a few of them (mostly NOP zp as a 3 cycle delay).
+ILLEGAL = {
+    'SLO': {'zeropage': (0x07, 5), 'zeropage_x': (0x17, 6), 'absolute': (0x0F, 6),
+            'absolute_x': (0x1F, 7), 'absolute_y': (0x1B, 7),
+            'indirect_x': (0x03, 8), 'indirect_y': (0x13, 8)},
+    'RLA': {'zeropage': (0x27, 5), 'zeropage_x': (0x37, 6), 'absolute': (0x2F, 6),
+            'absolute_x': (0x3F, 7), 'absolute_y': (0x3B, 7),
+            'indirect_x': (0x23, 8), 'indirect_y': (0x33, 8)},
+    'SRE': {'zeropage': (0x47, 5), 'zeropage_x': (0x57, 6), 'absolute': (0x4F, 6),
+            'absolute_x': (0x5F, 7), 'absolute_y': (0x5B, 7),
+            'indirect_x': (0x43, 8), 'indirect_y': (0x53, 8)},
+    'RRA': {'zeropage': (0x67, 5), 'zeropage_x': (0x77, 6), 'absolute': (0x6F, 6),
+            'absolute_x': (0x7F, 7), 'absolute_y': (0x7B, 7),
+            'indirect_x': (0x63, 8), 'indirect_y': (0x73, 8)},
+    'SAX': {'zeropage': (0x87, 3), 'zeropage_y': (0x97, 4), 'absolute': (0x8F, 4),
+            'indirect_x': (0x83, 6)},
+    'LAX': {'zeropage': (0xA7, 3), 'zeropage_y': (0xB7, 4), 'absolute': (0xAF, 4),
+            'absolute_y': (0xBF, 4), 'indirect_x': (0xA3, 6), 'indirect_y': (0xB3, 5)},
+    'DCP': {'zeropage': (0xC7, 5), 'zeropage_x': (0xD7, 6), 'absolute': (0xCF, 6),
+            'absolute_x': (0xDF, 7), 'absolute_y': (0xDB, 7),
+            'indirect_x': (0xC3, 8), 'indirect_y': (0xD3, 8)},
+    'ISC': {'zeropage': (0xE7, 5), 'zeropage_x': (0xF7, 6), 'absolute': (0xEF, 6),
+            'absolute_x': (0xFF, 7), 'absolute_y': (0xFB, 7),
+            'indirect_x': (0xE3, 8), 'indirect_y': (0xF3, 8)},
+    'ANC': {'immediate': (0x0B, 2)},
+    'ALR': {'immediate': (0x4B, 2)},
+    'ARR': {'immediate': (0x6B, 2)},
+    'SBX': {'immediate': (0xCB, 2)},
+    'NOP': {'immediate': (0x80, 2), 'zeropage': (0x04, 3), 'zeropage_x': (0x14, 4),
+            'absolute': (0x0C, 4), 'absolute_x': (0x1C, 4)},
+}
+
+# Duplicate encodings that only matter when decoding
+ILLEGAL_ALIASES = {
+    0x1A: ('NOP', 'implied', 2), 0x3A: ('NOP', 'implied', 2),
+    0x5A: ('NOP', 'implied', 2), 0x7A: ('NOP', 'implied', 2),
+    0xDA: ('NOP', 'implied', 2), 0xFA: ('NOP', 'implied', 2),
+    0x82: ('NOP', 'immediate', 2), 0x89: ('NOP', 'immediate', 2),
+    0xC2: ('NOP', 'immediate', 2), 0xE2: ('NOP', 'immediate', 2),
+    0x44: ('NOP', 'zeropage', 3), 0x64: ('NOP', 'zeropage', 3),
+    0x34: ('NOP', 'zeropage_x', 4), 0x54: ('NOP', 'zeropage_x', 4),
+    0x74: ('NOP', 'zeropage_x', 4), 0xD4: ('NOP', 'zeropage_x', 4),
+    0xF4: ('NOP', 'zeropage_x', 4),
+    0x3C: ('NOP', 'absolute_x', 4), 0x5C: ('NOP', 'absolute_x', 4),
+    0x7C: ('NOP', 'absolute_x', 4), 0xDC: ('NOP', 'absolute_x', 4),
+    0xFC: ('NOP', 'absolute_x', 4),
+    0x2B: ('ANC', 'immediate', 2),
+    0xEB: ('SBC', 'immediate', 2),
+}
+
+# Opcodes that take one extra cycle when the indexed address crosses a page.
+# Branches are handled separately: +1 when taken, +2 when taken across a page.
+PAGE_PENALTY = frozenset({
+    0x7D, 0x79, 0x71,  # ADC
+    0x3D, 0x39, 0x31,  # AND
+    0xDD, 0xD9, 0xD1,  # CMP
+    0x5D, 0x59, 0x51,  # EOR
+    0xBD, 0xB9, 0xB1,  # LDA
+    0xBE,              # LDX
+    0xBC,              # LDY
+    0x1D, 0x19, 0x11,  # ORA
+    0xFD, 0xF9, 0xF1,  # SBC
+    0xBF, 0xB3,        # LAX
+    0x1C, 0x3C, 0x5C, 0x7C, 0xDC, 0xFC,  # NOP abs,x
+})
+
+BRANCHES = frozenset(m for m, modes in DOCUMENTED.items() if 'relative' in modes)
+
+
+def build_encode_table(*tables):
+    """
+    Flatten mnemonic tables into {(mnemonic, mode): (opcode, length, cycles)}.
+    Later tables only add modes, they never replace a documented encoding.
+    """
+    encode = {}
+    for table in tables:
+        for mnemonic, modes in table.items():
+            for mode, (opcode, cycles) in modes.items():
+                encode.setdefault((mnemonic, mode), (opcode, MODE_LENGTH[mode], cycles))
+    return encode
+
+
+def build_decode_table(encode):
+    """
+    256 entry list indexed by opcode, each entry (mnemonic, mode, length, cycles)
+    or None for the opcodes that jam the CPU or are too unstable to use.
+    """
+    decode = [None] * 256
+    for (mnemonic, mode), (opcode, length, cycles) in encode.items():
+        decode[opcode] = (mnemonic, mode, length, cycles)
+    for opcode, (mnemonic, mode, cycles) in ILLEGAL_ALIASES.items():
+        decode[opcode] = (mnemonic, mode, MODE_LENGTH[mode], cycles)
+    return decode
+
+
+ENCODE = build_encode_table(DOCUMENTED)
+ENCODE_ILLEGAL = build_encode_table(DOCUMENTED, ILLEGAL)
+DECODE = build_decode_table(ENCODE_ILLEGAL)
+
+# mnemonic -> {mode: opcode}, the shape Assembler.instructions always had
+INSTRUCTIONS = {}
+INSTRUCTIONS_ILLEGAL = {}
+for (_mnemonic, _mode), (_opcode, _, _) in ENCODE_ILLEGAL.items():
+    if (_mnemonic, _mode) in ENCODE:
+        INSTRUCTIONS.setdefault(_mnemonic, {})[_mode] = _opcode
+    INSTRUCTIONS_ILLEGAL.setdefault(_mnemonic, {})[_mode] = _opcode
+del _mnemonic, _mode, _opcode
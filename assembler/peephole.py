@@ -0,0 +1,257 @@
+"""
+Peephole optimiser for Assembler, run on the parsed lines before they are
+laid out and encoded.
+
+It follows the values of A, X and Y through straight-line code and makes
+three kinds of change:
+
+  redundant loads   LDA/LDX/LDY #n when the register already holds n
+  transfers         LDA #n when X or Y holds n becomes TXA/TYA, LDX/LDY #n
+                    when A holds n becomes TAX/TAY: one byte shorter
+  dead stores       a store to zero page RAM ($80-$FF) overwritten by
+                    another store before anything can read it
+
+A load also sets N and Z, so it is only dropped when the flags already
+match or nothing reads them before they are set again.  Knowledge is
+thrown away at labels, since other code can jump there, and after JSR,
+JMP and returns.
+
+Beam timing matters more than cycles in a kernel, so timed code is left
+exactly as written: every run of code from a WSYNC write to the next
+WSYNC write or jump, where the beam position is known, any instruction
+with a "; @timed" comment, and everything from a "; @timed" comment on a
+line of its own to a later "; @untimed".  Code leading up to the first
+WSYNC only makes that WSYNC wait longer when it gets faster.
+"""
+from expr import value_of
+from opcodes import BRANCHES
+from timing import FLOW_ENDS, is_wsync
+
+LOADS = {'LDA': 'A', 'LDX': 'X', 'LDY': 'Y'}
+STORES = {'STA': 'A', 'STX': 'X', 'STY': 'Y'}
+TRANSFERS = {'TAX': ('A', 'X'), 'TAY': ('A', 'Y'), 'TXA': ('X', 'A'), 'TYA': ('Y', 'A')}
+STEPS = {'INX': ('X', 1), 'DEX': ('X', -1), 'INY': ('Y', 1), 'DEY': ('Y', -1)}
+
+# a register that can stand in for an immediate load: (target, source) ->
+# the transfer instruction
+TRANSFER_FOR = {(dst, src): name for name, (src, dst) in TRANSFERS.items()}
+
+# instructions that set N and Z from a fresh result without reading them
+SETS_NZ = {'LDA', 'LDX', 'LDY', 'TAX', 'TAY', 'TXA', 'TYA', 'TSX', 'PLA', 'INX', 'INY',
+           'DEX', 'DEY', 'ADC', 'SBC', 'AND', 'ORA', 'EOR', 'CMP', 'CPX', 'CPY', 'BIT',
+           'INC', 'DEC', 'ASL', 'LSR', 'ROL', 'ROR'}
+
+# instructions that leave A, X and Y alone; the first group also leaves N
+# and Z alone
+KEEPS_NZ = {'CLC', 'SEC', 'CLD', 'SED', 'CLI', 'SEI', 'CLV', 'NOP', 'PHA', 'PHP'}
+KEEPS_REGISTERS = KEEPS_NZ | {'CMP', 'CPX', 'CPY', 'BIT', 'INC', 'DEC'}
+
+# the stack lives in the same 128 bytes of RAM as everything else
+STACK = {'PHA', 'PHP', 'PLA', 'PLP', 'JSR', 'RTS', 'RTI', 'BRK'}
+
+RAM = range(0x80, 0x100)
+
+
+def pragma(text):
+    """'timed', 'untimed' or None for the comment on a source line."""
+    _, _, comment = text.partition(';')
+    words = comment.split()
+    if '@timed' in words:
+        return 'timed'
+    if '@untimed' in words:
+        return 'untimed'
+    return None
+
+
+def resolve_equates(lines, symbols):
+    """Symbols known before layout: predefined ones plus equates."""
+    symbols = dict(symbols)
+    for _, label, opcode, _, value in lines:
+        if opcode == '=':
+            value = value_of(value, symbols)
+            if value is not None:
+                symbols[label] = value
+    return symbols
+
+
+def timed_lines(lines, source_lines, symbols):
+    """Indexes into lines of the instructions that must not change."""
+    timed = set()
+    region = False
+    span = []
+    aligned = False
+    previous = 0
+    for index, (number, _, opcode, mode, value) in enumerate(lines):
+        # comment-only lines never make it into lines, so look at the
+        # source lines in between for region markers
+        for text in source_lines[previous:number - 1]:
+            marker = pragma(text)
+            if marker is not None:
+                region = marker == 'timed'
+        previous = number
+        if opcode is None or opcode == '=':
+            continue
+        if region or pragma(source_lines[number - 1]) == 'timed':
+            timed.add(index)
+
+        span.append(index)
+        operand = value_of(value, symbols)
+        if is_wsync(opcode, mode, operand):
+            if aligned:
+                timed.update(span)
+            span = []
+            aligned = True
+        elif opcode in FLOW_ENDS:
+            if aligned:
+                timed.update(span)
+            span = []
+            aligned = False
+    if aligned:
+        timed.update(span)
+    return timed
+
+
+def flags_dead(lines, index):
+    """
+    True if N and Z as left by lines[index] are set again before anything
+    can read them.
+    """
+    for number, label, opcode, mode, value in lines[index + 1:]:
+        if label is not None:
+            return False
+        if opcode is None or opcode == '=':
+            continue
+        if opcode in SETS_NZ:
+            return True
+        if opcode in BRANCHES or opcode in STACK or opcode in FLOW_ENDS:
+            return False
+    return False
+
+
+def optimise(lines, source_lines, symbols, encode):
+    """
+    lines is a list of parsed (line number, label, opcode, mode, value) as
+    Assembler.assemble() sees them; symbols the predefined symbols and
+    encode its (mnemonic, mode) table.  Returns the new lines and a report,
+    one entry per change: (line number, block label, what, bytes saved,
+    cycles saved).  A removed line that carries a label is kept as a bare
+    label.
+    """
+    symbols = resolve_equates(lines, symbols)
+    timed = timed_lines(lines, source_lines, symbols)
+    lines = list(lines)
+    removed = set()
+    report = []
+    block = None
+
+    def cost(opcode, mode, value):
+        if mode == 'absolute' and value in RAM:
+            mode = 'zeropage'
+        _, length, cycles = encode[opcode, mode]
+        return length, cycles
+
+    def drop(index, what):
+        number, label, opcode, mode, value = lines[index]
+        length, cycles = cost(opcode, mode, value_of(value, symbols))
+        report.append((number, block, what, length, cycles))
+        removed.add(index)
+        lines[index] = (number, label, None, None, None)
+
+    registers = {'A': None, 'X': None, 'Y': None}
+    nz = None
+    stores = {}
+
+    for index, (number, label, opcode, mode, value) in enumerate(lines):
+        if label is not None and opcode != '=':
+            block = label
+            registers = dict.fromkeys(registers)
+            nz = None
+            stores = {}
+        if opcode is None or opcode == '=':
+            continue
+
+        operand = value_of(value, symbols)
+        fixed = index in timed
+
+        if opcode in LOADS and mode == 'immediate' and operand is not None:
+            register = LOADS[opcode]
+            if fixed:
+                pass
+            elif registers[register] == operand and (nz == operand or flags_dead(lines, index)):
+                drop(index, f'{opcode} #${operand:02X}: {register} already holds it')
+                continue
+            else:
+                for source in ('X', 'Y', 'A'):
+                    name = TRANSFER_FOR.get((register, source))
+                    if name is not None and registers[source] == operand:
+                        report.append((number, block, f'{opcode} #${operand:02X} -> {name}',
+                                       1, 0))
+                        lines[index] = (number, label, name, 'implied', None)
+                        break
+            registers[register] = nz = operand
+            continue
+
+        if opcode in STORES and mode == 'absolute' and operand in RAM:
+            earlier = stores.get(operand)
+            if earlier is not None and earlier not in timed:
+                drop(earlier, f'dead store to ${operand:02X}, overwritten on line {number}')
+            stores[operand] = index
+            continue
+
+        if opcode in TRANSFERS:
+            source, target = TRANSFERS[opcode]
+            registers[target] = nz = registers[source]
+            continue
+        if opcode in STEPS:
+            register, step = STEPS[opcode]
+            known = registers[register]
+            registers[register] = nz = None if known is None else (known + step) & 0xFF
+            continue
+
+        # anything else that can read memory ends the dead store tracking
+        # for what it might read
+        if opcode in BRANCHES or opcode in STACK or opcode in FLOW_ENDS:
+            stores = {}
+        elif mode in ('absolute', 'zeropage') and operand is not None:
+            stores.pop(operand, None)
+        elif mode not in (None, 'implied', 'accumulator', 'immediate'):
+            stores = {}
+
+        if opcode == 'JSR' or opcode in FLOW_ENDS:
+            registers = dict.fromkeys(registers)
+            nz = None
+        elif opcode in BRANCHES or opcode in STORES or opcode in KEEPS_NZ:
+            pass
+        elif opcode in LOADS:
+            registers[LOADS[opcode]] = nz = None
+        elif opcode in KEEPS_REGISTERS or (opcode in ('ASL', 'LSR', 'ROL', 'ROR')
+                                           and mode != 'accumulator'):
+            nz = None
+        else:
+            registers = dict.fromkeys(registers)
+            nz = None
+
+    if removed:
+        lines = [line for index, line in enumerate(lines)
+                 if index not in removed or line[1] is not None]
+    return lines, report
+
+
+def format_report(report):
+    """Savings per block, then the total."""
+    blocks = {}
+    for number, block, what, length, cycles in report:
+        blocks.setdefault(block, []).append((number, what, length, cycles))
+
+    out = []
+    total_bytes = total_cycles = 0
+    for block, changes in blocks.items():
+        saved_bytes = sum(change[2] for change in changes)
+        saved_cycles = sum(change[3] for change in changes)
+        total_bytes += saved_bytes
+        total_cycles += saved_cycles
+        out.append(f'{block or "(start)"}: {saved_bytes} bytes, {saved_cycles} cycles')
+        for number, what, _, _ in changes:
+            out.append(f'  line {number}: {what}')
+    out.append(f'peephole: {total_bytes} bytes, {total_cycles} cycles saved')
+    return out
@@ -0,0 +1,198 @@
+"""
+Per-phase profiling for the assemblers: where a build's time and memory go.
+
+    profiler = Profiler(memory=True)
+    with profiler.phase('parse') as phase:
+        ...
+        phase.count(lines=n, instructions=m)
+    json.dump(profiler.report(), f)
+
+Each phase records its wall time, whatever counts the code gives it
+(lines, instructions, references...), the tracemalloc peak while it ran
+when the profiler was made with memory=True, and the process's peak RSS
+so far where the platform reports one.  Phases can nest, depth saying how
+deep; an outer phase's time includes its inner ones.  timed() wraps a
+function called once per line, such as a tokeniser, so its time adds up
+in a phase of its own even though its calls are spread through another
+phase.  report() and format() both finish the profiler first.
+
+Build dashboards collect the numbers with hooks: add_hook(fn) has fn
+called with the dict of every phase any profiler finishes, and
+Profiler(hooks=...) adds hooks for one profiler only.
+
+NULL_PROFILER takes the place of a profiler when there is none, at the
+cost of an empty with block per phase.
+"""
+from contextlib import contextmanager
+
+import sys
+import time
+import tracemalloc
+
+try:
+    import resource
+except ImportError:
+    # not on Windows
+    resource = None
+
+_hooks = []
+
+
+def add_hook(hook):
+    """Call hook(phase_dict) for each phase finished by any profiler."""
+    _hooks.append(hook)
+
+
+def remove_hook(hook):
+    _hooks.remove(hook)
+
+
+def max_rss():
+    """The process's peak resident set size so far in bytes, or None."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+class Phase:
+    __slots__ = ('name', 'depth', 'seconds', 'counts', 'peak_memory', 'max_rss')
+
+    def __init__(self, name, depth=0):
+        self.name = name
+        self.depth = depth
+        self.seconds = 0.0
+        self.counts = {}
+        self.peak_memory = None
+        self.max_rss = None
+
+    def count(self, **counts):
+        """Set counts for the phase, e.g. count(lines=100, instructions=80)."""
+        self.counts.update(counts)
+
+    def as_dict(self):
+        return {'name': self.name, 'depth': self.depth, 'seconds': self.seconds, **self.counts,
+                'peak_memory': self.peak_memory, 'max_rss': self.max_rss}
+
+
+class Profiler:
+    """
+    The phases of one build, in the order they started.  With memory=True
+    tracemalloc runs from the first phase to finish(); it slows Python
+    code down noticeably, so it is off by default.
+    """
+
+    def __init__(self, memory=False, hooks=()):
+        self.memory = memory
+        self.hooks = list(hooks)
+        self.phases = []
+        self.accumulated = []
+        self.open = []
+        self.started = None
+        self.finished = None
+
+    @contextmanager
+    def phase(self, name):
+        if self.started is None:
+            self.started = time.perf_counter()
+            if self.memory and not tracemalloc.is_tracing():
+                tracemalloc.start()
+        phase = Phase(name, len(self.open))
+        self.phases.append(phase)
+        if self.memory:
+            if self.open:
+                outer = self.open[-1]
+                outer.peak_memory = max(outer.peak_memory, tracemalloc.get_traced_memory()[1])
+            phase.peak_memory = 0
+            tracemalloc.reset_peak()
+        self.open.append(phase)
+        start = time.perf_counter()
+        try:
+            yield phase
+        finally:
+            phase.seconds = time.perf_counter() - start
+            self.open.pop()
+            if self.memory:
+                # inner phases reset the peak, so take the larger of what
+                # was seen before that and since, and pass it outwards
+                peak = max(phase.peak_memory, tracemalloc.get_traced_memory()[1])
+                phase.peak_memory = peak
+                if self.open:
+                    outer = self.open[-1]
+                    outer.peak_memory = max(outer.peak_memory, peak)
+            phase.max_rss = max_rss()
+            self.publish(phase)
+
+    def timed(self, name, function):
+        """
+        function wrapped to add up its time and calls (as lines) in a phase
+        called name.  The phase is published when the profiler finishes.
+        """
+        phase = Phase(name, len(self.open))
+        phase.counts['lines'] = 0
+        self.phases.append(phase)
+        self.accumulated.append(phase)
+        counts = phase.counts
+        perf_counter = time.perf_counter
+
+        def wrapper(*args):
+            start = perf_counter()
+            try:
+                return function(*args)
+            finally:
+                phase.seconds += perf_counter() - start
+                counts['lines'] += 1
+
+        wrapper.phase = phase
+        return wrapper
+
+    def publish(self, phase):
+        record = phase.as_dict()
+        for hook in self.hooks + _hooks:
+            hook(record)
+
+    def finish(self):
+        """Stop memory tracing and publish the timed() phases."""
+        if self.finished is not None:
+            return
+        self.finished = time.perf_counter()
+        if self.memory and tracemalloc.is_tracing():
+            tracemalloc.stop()
+        for phase in self.accumulated:
+            phase.max_rss = max_rss()
+            self.publish(phase)
+
+    def report(self):
+        """The phases and totals as a dict, ready for json.dump()."""
+        self.finish()
+        return {
+            'seconds': self.finished - (self.started or self.finished),
+            'max_rss': max_rss(),
+            'phases': [phase.as_dict() for phase in self.phases],
+        }
+
+    def format(self):
+        """A table of the phases, inner ones indented, for the console."""
+        self.finish()
+        lines = []
+        for phase in self.phases:
+            name = '  ' * phase.depth + phase.name
+            memory = '' if phase.peak_memory is None else f'{phase.peak_memory / 1024:,.0f} kB'
+            counts = '  '.join(f'{value:,d} {name}' for name, value in phase.counts.items())
+            lines.append(f'{name:<14} {phase.seconds * 1000:10.1f} ms {memory:>12}  {counts}'.rstrip())
+        return lines
+
+
+class NullProfiler(Profiler):
+    """A profiler that records nothing."""
+
+    @contextmanager
+    def phase(self, name):
+        yield Phase(name)
+
+    def timed(self, name, function):
+        return function
+
+
+NULL_PROFILER = NullProfiler()
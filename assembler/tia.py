@@ -0,0 +1,320 @@
+"""
+Headless TIA video: turns a trace of TIA register writes into frames.
+
+    trace = Trace()
+    cpu.tia_write = trace           # cpu6502.CPU calls it per TIA write
+    cpu.run(cycles=76 * 262 * 60)
+    for frame in render_frames(trace):
+        write_png('frame.png', to_rgb(frame))
+
+A frame is a numpy array of TIA colour values (the byte written to COLUxx),
+262 x 228 colour clocks in full, or the 192 x 160 picture.  Frames start at
+each VSYNC.  Between two register writes nothing on screen changes, so
+rendering builds the 228 clock scanline for each register state once and
+copies it over the whole stretch of the frame that state lasts: a partial
+line slice at each end and one broadcast assignment for the full lines in
+between.  Kernels that change registers every line make many short
+stretches, and those frames are instead gathered from the table of rows in
+one fancy-indexing pass.
+
+Covered: background, playfield (reflection, CTRLPF ball size), ball
+(ENABL, RESBL, HMBL/HMOVE), VBLANK and VSYNC.  Players and missiles are
+not drawn.
+"""
+import zlib
+import struct
+
+import numpy as np
+
+CLOCKS_PER_CYCLE = 3
+CLOCKS_PER_LINE = 228
+HBLANK = 68
+WIDTH = 160
+LINES = 262
+HEIGHT = 192
+# first picture line when the trace never clears VBLANK: 3 lines of vsync
+# plus 37 of vertical blank
+DEFAULT_TOP = 40
+
+VSYNC, VBLANK = 0x00, 0x01
+COLUPF, COLUBK, CTRLPF = 0x08, 0x09, 0x0A
+PF0, PF1, PF2 = 0x0D, 0x0E, 0x0F
+RESBL, ENABL, HMBL = 0x14, 0x1F, 0x24
+HMOVE, HMCLR = 0x2A, 0x2B
+
+# registers that change the picture; writes to anything else are skipped
+VISIBLE_REGISTERS = {VBLANK, COLUPF, COLUBK, CTRLPF, PF0, PF1, PF2, RESBL, ENABL,
+                     HMBL, HMOVE, HMCLR}
+
+
+class Trace(list):
+    """
+    A list of (colour clock, register, value), filled by calling it the way
+    cpu6502.CPU calls tia_write.
+    """
+
+    def __call__(self, register, value, cycles):
+        self.append((cycles * CLOCKS_PER_CYCLE, register, value))
+
+
+def playfield_bits(pf0, pf1, pf2, reflect):
+    """The 40 playfield bits of a line, left to right."""
+    left = ([(pf0 >> bit) & 1 for bit in range(4, 8)]
+            + [(pf1 >> bit) & 1 for bit in range(7, -1, -1)]
+            + [(pf2 >> bit) & 1 for bit in range(8)])
+    return left + (left[::-1] if reflect else left)
+
+
+class LineCache:
+    """
+    Scanline rows keyed by the register state they depend on, stacked in
+    one table so a frame can be gathered from it by row number.
+    """
+
+    def __init__(self):
+        self.ids = {}
+        self.table = np.zeros((64, CLOCKS_PER_LINE), dtype=np.uint8)
+
+    def row_id(self, state):
+        row_id = self.ids.get(state)
+        if row_id is None:
+            row_id = len(self.ids)
+            if row_id == len(self.table):
+                self.table = np.vstack([self.table, np.zeros_like(self.table)])
+            self.build(self.table[row_id], state)
+            self.ids[state] = row_id
+        return row_id
+
+    def build(self, row, state):
+        vblank, colubk, colupf, ctrlpf, pf0, pf1, pf2, enabl, ball_x = state
+        if vblank & 0x02:
+            return
+        picture = row[HBLANK:]
+        picture[:] = colubk
+        if pf0 | pf1 | pf2:
+            mask = np.repeat(np.array(playfield_bits(pf0, pf1, pf2, ctrlpf & 0x01), dtype=bool), 4)
+            picture[mask] = colupf
+        if enabl & 0x02:
+            size = 1 << ((ctrlpf >> 4) & 3)
+            picture[np.arange(ball_x, ball_x + size) % WIDTH] = colupf
+
+
+FRAME_CLOCKS = LINES * CLOCKS_PER_LINE
+
+# colour clock -> position within its line, for gathering whole frames
+COLUMN = np.tile(np.arange(CLOCKS_PER_LINE), LINES)
+
+# up to this many stretches per frame are copied as slices; past it one
+# gather over the whole frame is cheaper
+SLICE_SEGMENTS = 48
+
+
+def fill(frame, start, end, row):
+    """Copy row over colour clocks start..end of frame."""
+    end = min(end, FRAME_CLOCKS)
+    if start >= end:
+        return
+    first, first_clock = divmod(start, CLOCKS_PER_LINE)
+    last, last_clock = divmod(end, CLOCKS_PER_LINE)
+    if first == last:
+        frame[first, first_clock:last_clock] = row[first_clock:last_clock]
+        return
+    frame[first, first_clock:] = row[first_clock:]
+    frame[first + 1:last] = row
+    if last_clock:
+        frame[last, :last_clock] = row[:last_clock]
+
+
+def draw(segments, cache):
+    """
+    A frame from its stretches of constant state: segments is a list of
+    (first colour clock, row id), in order, the last one running to the end
+    of the frame.
+    """
+    frame = np.zeros((LINES, CLOCKS_PER_LINE), dtype=np.uint8)
+    table = cache.table
+    if len(segments) <= SLICE_SEGMENTS:
+        ends = [start for start, _ in segments[1:]] + [FRAME_CLOCKS]
+        for (start, row_id), end in zip(segments, ends):
+            fill(frame, start, end, table[row_id])
+        return frame
+
+    first = min(segments[0][0], FRAME_CLOCKS)
+    starts = np.array([start for start, _ in segments] + [FRAME_CLOCKS])
+    # a trace is in clock order, but don't let a stray write run backwards
+    starts = np.minimum(np.maximum.accumulate(starts), FRAME_CLOCKS)
+    row_ids = np.repeat(np.array([row_id for _, row_id in segments]), np.diff(starts))
+    frame.reshape(-1)[first:] = table[row_ids, COLUMN[first:]]
+    return frame
+
+
+def render_frames(trace, full=False, cache=None):
+    """
+    Yield one frame per VSYNC in trace.  full frames are 262 x 228 colour
+    clocks, otherwise the 192 x 160 picture starting at the first line
+    after VBLANK is cleared.  A trailing frame without its closing VSYNC
+    isn't yielded.
+    """
+    cache = cache or LineCache()
+    vblank = colubk = colupf = ctrlpf = pf0 = pf1 = pf2 = enabl = hmbl = 0
+    ball_x = 0
+    vsync = False
+    segments = None
+    state = None
+    origin = 0
+    top = None
+
+    def finish():
+        frame = draw(segments, cache)
+        if full:
+            return frame
+        first = top if top is not None and top + HEIGHT <= LINES else DEFAULT_TOP
+        return frame[first:first + HEIGHT, HBLANK:]
+
+    for clock, register, value in trace:
+        if register == VSYNC:
+            on = bool(value & 0x02)
+            if on and not vsync:
+                if segments is not None:
+                    yield finish()
+                origin = clock - clock % CLOCKS_PER_LINE
+                state = (vblank, colubk, colupf, ctrlpf, pf0, pf1, pf2, enabl, ball_x)
+                segments = [(clock - origin, cache.row_id(state))]
+                top = None
+            vsync = on
+            continue
+        if register not in VISIBLE_REGISTERS:
+            continue
+
+        if register == VBLANK:
+            if vblank & 0x02 and not value & 0x02 and segments is not None and top is None:
+                top = (clock - origin) // CLOCKS_PER_LINE + 1
+            vblank = value
+        elif register == COLUBK:
+            colubk = value
+        elif register == COLUPF:
+            colupf = value
+        elif register == CTRLPF:
+            ctrlpf = value
+        elif register == PF0:
+            pf0 = value
+        elif register == PF1:
+            pf1 = value
+        elif register == PF2:
+            pf2 = value
+        elif register == ENABL:
+            enabl = value
+        elif register == RESBL:
+            line_clock = (clock - origin) % CLOCKS_PER_LINE
+            ball_x = (line_clock - HBLANK + 4) % WIDTH if line_clock >= HBLANK else 2
+        elif register == HMBL:
+            hmbl = value
+        elif register == HMOVE:
+            # high nibble, signed, positive moves left
+            motion = (hmbl >> 4) - 16 if hmbl & 0x80 else hmbl >> 4
+            ball_x = (ball_x - motion) % WIDTH
+        elif register == HMCLR:
+            hmbl = 0
+
+        if segments is not None:
+            new_state = (vblank, colubk, colupf, ctrlpf, pf0, pf1, pf2, enabl, ball_x)
+            if new_state != state:
+                # the picture from here on is drawn with the new state
+                state = new_state
+                segments.append((clock - origin, cache.row_id(state)))
+
+
+def ntsc_palette():
+    """
+    RGB for the 128 NTSC colours, indexed by colour value >> 1.  Computed
+    from hue and luminance in YIQ rather than measured, so close to but not
+    exactly what a given TV shows.
+    """
+    palette = np.zeros((128, 3), dtype=np.uint8)
+    for hue in range(16):
+        for lum in range(8):
+            y = 0.92 * lum / 7
+            if hue == 0:
+                i = q = 0.0
+            else:
+                angle = np.radians((hue - 1) * 24 - 20)
+                i = 0.25 * np.cos(angle)
+                q = 0.25 * np.sin(angle)
+            r = y + 0.956 * i + 0.621 * q
+            g = y - 0.272 * i - 0.647 * q
+            b = y - 1.106 * i + 1.703 * q
+            palette[hue * 8 + lum] = np.clip(np.array([r, g, b]) * 255, 0, 255)
+    return palette
+
+
+PALETTE = ntsc_palette()
+
+
+def to_rgb(frame):
+    """(height, width, 3) uint8 RGB of a frame of colour values."""
+    return PALETTE[frame >> 1]
+
+
+def write_png(path, rgb):
+    """Write an (height, width, 3) uint8 array as an 8-bit RGB PNG."""
+    height, width, _ = rgb.shape
+    # each row gets filter type 0 in front
+    raw = np.zeros((height, width * 3 + 1), dtype=np.uint8)
+    raw[:, 1:] = rgb.reshape(height, width * 3)
+
+    def chunk(kind, data):
+        body = kind + data
+        return struct.pack('>I', len(data)) + body + struct.pack('>I', zlib.crc32(body))
+
+    with open(path, 'wb') as f:
+        f.write(b'\x89PNG\r\n\x1a\n')
+        f.write(chunk(b'IHDR', struct.pack('>IIBBBBB', width, height, 8, 2, 0, 0, 0)))
+        f.write(chunk(b'IDAT', zlib.compress(raw.tobytes(), 6)))
+        f.write(chunk(b'IEND', b''))
+
+
+def write_raw(path, frames):
+    """Concatenate frames of colour values into one raw file."""
+    with open(path, 'wb') as f:
+        for frame in frames:
+            f.write(np.ascontiguousarray(frame).tobytes())
+
+
+def main():
+    from pathlib import Path
+
+    import argparse
+    import time
+
+    from cpu6502 import CPU, CYCLES_PER_LINE
+
+    parser = argparse.ArgumentParser(description='render frames of a 2600 ROM without a GUI')
+    parser.add_argument('rom', type=Path)
+    parser.add_argument('-n', '--frames', type=int, default=1)
+    parser.add_argument('--full', action='store_true', help='262 x 228 frames, blanking included')
+    parser.add_argument('--png', help='PNG name pattern, e.g. frame%%03d.png')
+    parser.add_argument('--raw', type=Path, help='write all frames to one raw file')
+    args = parser.parse_args()
+
+    cpu = CPU()
+    cpu.load_rom(args.rom.read_bytes())
+    cpu.reset()
+    trace = Trace()
+    cpu.tia_write = trace
+    # one frame of slack for the first VSYNC
+    cpu.run(cycles=CYCLES_PER_LINE * LINES * (args.frames + 1) + 1)
+
+    start = time.perf_counter()
+    frames = list(render_frames(trace, full=args.full))[:args.frames]
+    elapsed = time.perf_counter() - start
+    print(f'{len(frames)} frames rendered in {elapsed * 1000:.2f} ms')
+
+    if args.png:
+        for n, frame in enumerate(frames):
+            write_png(args.png % n, to_rgb(frame))
+    if args.raw:
+        write_raw(args.raw, frames)
+
+
+if __name__ == '__main__':
+    main()
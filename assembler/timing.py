@@ -0,0 +1,142 @@
+"""
+Static cycle counts and scanline budgets for 2600 kernels.
+
+A kernel lines its code up with the beam by writing to WSYNC, which stalls
+the CPU until the start of the next scanline; everything between two WSYNC
+writes has to fit in the 76 cycles of one line.  analyse() walks the
+instructions in program order, the way the code falls through, and
+accumulates cycles from each WSYNC write to the next.
+
+Costs are (min, max) pairs.  Branches cost their base 2 cycles falling
+through and +1 (+2 across a page) taken; indexed reads that might cross a
+page add the extra cycle to max only.  Along a fall-through path branches
+are not taken, so a span's min is the count for straight-line code and max
+is the worst case if any branch on the way was taken instead.
+"""
+from opcodes import BRANCHES, PAGE_PENALTY
+
+CYCLES_PER_LINE = 76
+WSYNC = 0x02
+
+WRITES = {'STA', 'STX', 'STY', 'SAX'}
+
+# control doesn't fall through these, so the next instruction starts a new
+# path with an unknown line position
+FLOW_ENDS = {'JMP', 'RTS', 'RTI', 'BRK'}
+
+
+def instruction_cycles(opcode, mnemonic, mode, cycles, address, operand):
+    """
+    (min, max) cycles for one instruction at address.  operand is the
+    resolved operand value, or None if it isn't known.
+    """
+    if mnemonic in BRANCHES:
+        if operand is None:
+            return cycles, cycles + 2
+        next_pc = address + 2
+        return cycles, cycles + (2 if (operand ^ next_pc) & 0xFF00 else 1)
+
+    if opcode in PAGE_PENALTY:
+        # abs,x / abs,y with a page aligned base can't cross for any index
+        if mode in ('absolute_x', 'absolute_y') and operand is not None and not operand & 0xFF:
+            return cycles, cycles
+        return cycles, cycles + 1
+
+    return cycles, cycles
+
+
+def is_wsync(mnemonic, mode, operand):
+    """True for a write to WSYNC or any of its mirrors."""
+    return (mnemonic in WRITES and mode in ('zeropage', 'absolute')
+            and operand is not None and not operand & 0x1080 and operand & 0x3F == WSYNC)
+
+
+def analyse(instructions, budget=CYCLES_PER_LINE):
+    """
+    instructions is a sequence of (line, address, opcode, mnemonic, mode,
+    cycles, operand) in program order.  Returns a report dict:
+
+        lines  one entry per instruction: line, address, mnemonic, min/max
+               cycles and the running span total after it
+        spans  one entry per run of code between line starts: first and
+               last line and address, min/max total, whether it starts on a WSYNC
+               (aligned) and ends on one, and over when even the minimum
+               misses the budget (warn when only the maximum does)
+    """
+    lines = []
+    spans = []
+    span = None
+
+    def close(ends_on_wsync):
+        nonlocal span
+        if span is not None:
+            span['ends_on_wsync'] = ends_on_wsync
+            span['over'] = span['min'] > budget
+            span['warn'] = span['max'] > budget
+            spans.append(span)
+        span = None
+
+    for line, address, opcode, mnemonic, mode, cycles, operand in instructions:
+        low, high = instruction_cycles(opcode, mnemonic, mode, cycles, address, operand)
+
+        if span is None:
+            span = {'first_line': line, 'first_address': address, 'last_line': line,
+                    'last_address': address, 'min': 0, 'max': 0, 'aligned': bool(spans and spans[-1]['ends_on_wsync'])}
+        span['min'] += low
+        span['max'] += high
+        span['last_line'] = line
+        span['last_address'] = address
+
+        lines.append({'line': line, 'address': address, 'mnemonic': mnemonic,
+                      'min': low, 'max': high,
+                      'span_min': span['min'], 'span_max': span['max']})
+
+        if is_wsync(mnemonic, mode, operand):
+            close(True)
+        elif mnemonic in FLOW_ENDS:
+            close(False)
+
+    close(False)
+    return {'budget': budget, 'lines': lines, 'spans': spans}
+
+
+def format_cycles(low, high):
+    return f'{low}' if low == high else f'{low}-{high}'
+
+
+def format_warnings(report, filename='<source>'):
+    """
+    One message per span that is or may be over budget.  Spans that neither
+    start nor end on a WSYNC aren't tied to a scanline and are left out.
+    """
+    messages = []
+    for span in report['spans']:
+        if not span['warn'] or not (span['aligned'] or span['ends_on_wsync']):
+            continue
+        kind = 'over' if span['over'] else 'may be over'
+        messages.append(
+            f'{filename}:{span["first_line"]}-{span["last_line"]}: scanline {kind} budget, '
+            f'{format_cycles(span["min"], span["max"])} of {report["budget"]} cycles'
+        )
+    return messages
+
+
+def annotate(source_lines, report):
+    """
+    Yield the source lines with address, cycles and the running scanline
+    total in front of each instruction; a span that runs over budget gets
+    a marker after its last line.
+    """
+    by_line = {entry['line']: entry for entry in report['lines']}
+    span_ends = {span['last_line']: span for span in report['spans'] if span['warn']}
+    for line, text in enumerate(source_lines, 1):
+        entry = by_line.get(line)
+        if entry is None:
+            yield f'{"":4} {"":5} {"":7}  {text}'
+            continue
+        cycles = format_cycles(entry['min'], entry['max'])
+        total = format_cycles(entry['span_min'], entry['span_max'])
+        yield f'{entry["address"]:04x} {cycles:>5} {total:>7}  {text}'
+        span = span_ends.get(line)
+        if span is not None:
+            yield f'{"":4} {"":5} {"":7}  ; ^ over {report["budget"]} cycles'
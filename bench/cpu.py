@@ -0,0 +1,91 @@
+"""
+6502 interpreter throughput: emulated instructions per second.
+
+    python bench/cpu.py [rom.bin ...] [--instructions N]
+
+Without ROMs it runs a built in program, assembled with asm.Assembler, that
+mixes loads, stores, arithmetic, shifts, indexed modes and branches over
+zero page RAM.  With ROMs it runs each from its reset vector.
+"""
+from pathlib import Path
+
+import argparse
+import sys
+import time
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / 'assembler'))
+
+from asm import Assembler
+from cpu6502 import CPU
+
+# only relative branches, so it runs wherever it's placed
+MIX = """
+start:
+        LDX #$00
+fill:
+        TXA
+        STA $80,X
+        INX
+        CPX #$40
+        BNE fill
+        LDY #$00
+        CLC
+sum:
+        LDA $80,Y
+        ADC $C0
+        STA $C0
+        LDA $C1
+        ADC #$00
+        STA $C1
+        INY
+        CPY #$40
+        BNE sum
+        LDX #$3F
+shift:
+        LSR $80,X
+        ROL $C2
+        DEX
+        BPL shift
+        CLV
+        BVC start
+"""
+
+
+def build_mix():
+    code = Assembler(predefined={}).assemble(MIX)
+    image = bytearray(0x1000)
+    image[:len(code)] = code
+    image[0xFFC:] = bytes((0x00, 0xF0, 0x00, 0xF0))
+    return bytes(image)
+
+
+def bench(image, instructions, repeat=3):
+    best = None
+    for _ in range(repeat):
+        cpu = CPU()
+        cpu.load_rom(image)
+        cpu.reset()
+        start = time.perf_counter()
+        executed = cpu.run(instructions=instructions)
+        elapsed = time.perf_counter() - start
+        rate = executed / elapsed
+        if best is None or rate > best[0]:
+            best = (rate, executed, cpu.cycles)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description='6502 interpreter benchmark')
+    parser.add_argument('roms', nargs='*', type=Path)
+    parser.add_argument('--instructions', type=int, default=1_000_000)
+    args = parser.parse_args()
+
+    images = [(path.name, path.read_bytes()) for path in args.roms] or [('mix', build_mix())]
+    for name, image in images:
+        rate, executed, cycles = bench(image, args.instructions)
+        print(f'{name:<20} {executed:10,d} instructions  {cycles:12,d} cycles  '
+              f'{rate:12,.0f} instr/s')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,60 @@
+"""
+Disassembler throughput: bytes disassembled per second on 4K, 32K and 512K
+images, read through mmap as disa2600.py does and written to /dev/null.
+
+    python bench/disasm.py [sizes in KB ...]
+
+The images are random bytes, which decode to the full mix of opcodes and
+lengths.
+"""
+from pathlib import Path
+
+import importlib.util
+import os
+import random
+import sys
+import tempfile
+import time
+
+ROOT = Path(__file__).resolve().parents[1]
+DISA_PATH = ROOT / 'programming-games-for-atari-2600' / '02' / 'disa2600.py'
+
+
+def load_disa():
+    spec = importlib.util.spec_from_file_location('disa2600', DISA_PATH)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def bench_size(disa, size, directory, repeat=3):
+    rng = random.Random(size)
+    path = Path(directory) / f'rom_{size}.bin'
+    path.write_bytes(bytes(rng.randrange(256) for _ in range(size)))
+
+    best = None
+    with open(os.devnull, 'wb') as out:
+        for _ in range(repeat):
+            start = time.perf_counter()
+            data, close = disa.map_rom(path)
+            try:
+                disa.disassemble(data, out)
+            finally:
+                close()
+            elapsed = time.perf_counter() - start
+            if best is None or elapsed < best:
+                best = elapsed
+    return best
+
+
+def main():
+    sizes = [int(kb) * 1024 for kb in sys.argv[1:]] or [4096, 32768, 524288]
+    disa = load_disa()
+    with tempfile.TemporaryDirectory() as directory:
+        for size in sizes:
+            elapsed = bench_size(disa, size, directory)
+            print(f'{size // 1024:5d}K  {elapsed * 1000:9.2f} ms  {size / elapsed:14,.0f} bytes/s')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,138 @@
+"""
+Encoder benchmark: Assembler.assemble() before and after the table-driven
+encoder, both taken from git.
+
+    python bench/encode.py [count] [--before REV] [--after REV]
+
+The before side is assembler/asm.py as it stood before opcodes.py was
+added, with its per-mnemonic dicts of modes and its if-chains on the mode
+for the operand bytes.  The after side is the working tree, or --after
+REV.  Each revision is exported with git archive and timed in a process
+of its own, so the two never share modules.
+
+The source is count random instructions drawn from the before side's
+instruction set (LDA, STA, ADC, SBC, CMP, JMP, INX, DEX) with numeric
+operands, since it can't branch to a label.  Absolute operands are $100
+or more, so neither side narrows them.  Both must give the same bytes.
+"""
+from pathlib import Path
+
+import argparse
+import json
+import random
+import subprocess
+import sys
+import tempfile
+
+ROOT = Path(__file__).resolve().parents[1]
+
+# operand syntax of each mode the before side can parse; it takes
+# "($80),Y" for an absolute,Y operand and fails, so indirect_y is left out
+FORMATS = {
+    'implied': '',
+    'immediate': ' #${:02x}',
+    'zeropage': ' ${:02x}',
+    'zeropage_x': ' ${:02x},X',
+    'absolute': ' ${:04x}',
+    'absolute_x': ' ${:04x},X',
+    'absolute_y': ' ${:04x},Y',
+    'indirect_x': ' (${:02x},X)',
+    'indirect': ' (${:04x})',
+}
+
+# run in the child: time Assembler().assemble() from the tree on sys.argv[1]
+CHILD = '''
+import hashlib, json, sys, time
+sys.path.insert(0, sys.argv[1])
+from asm import Assembler
+source = open(sys.argv[2]).read()
+best = None
+for _ in range(int(sys.argv[3])):
+    start = time.perf_counter()
+    binary = Assembler().assemble(source)
+    elapsed = time.perf_counter() - start
+    best = elapsed if best is None else min(best, elapsed)
+print(json.dumps({'seconds': best, 'md5': hashlib.md5(binary).hexdigest()}))
+'''
+
+
+def git(*args):
+    return subprocess.run(['git', *args], cwd=ROOT, capture_output=True, text=True,
+                          check=True).stdout.strip()
+
+
+def before_opcodes():
+    """The revision just before the one that added assembler/opcodes.py."""
+    added = git('log', '--diff-filter=A', '--format=%H', '--', 'assembler/opcodes.py')
+    return added.split()[-1] + '^'
+
+
+def instruction_set(rev):
+    """{mnemonic: modes} of the Assembler at rev, read from its source."""
+    with tempfile.TemporaryDirectory() as directory:
+        export(rev, directory)
+        code = ('import json, sys; sys.path.insert(0, sys.argv[1]); from asm import Assembler; '
+                'print(json.dumps({k: list(v) for k, v in Assembler().instructions.items()}))')
+        output = subprocess.run([sys.executable, '-c', code, str(Path(directory) / 'assembler')],
+                                stdout=subprocess.PIPE, text=True, check=True).stdout
+    return json.loads(output)
+
+
+def export(rev, directory):
+    archive = subprocess.run(['git', 'archive', rev, 'assembler'], cwd=ROOT,
+                             capture_output=True, check=True).stdout
+    subprocess.run(['tar', '-x', '-C', directory], input=archive, check=True)
+
+
+def make_source(count, instructions, seed=2600):
+    rng = random.Random(seed)
+    keys = sorted((mnemonic, mode) for mnemonic, modes in instructions.items()
+                  for mode in modes if mode in FORMATS)
+    lines = []
+    for _ in range(count):
+        mnemonic, mode = rng.choice(keys)
+        wide = mode.startswith('absolute') or mode == 'indirect'
+        value = rng.randrange(0x100, 0x10000) if wide else rng.randrange(0x100)
+        lines.append(f'    {mnemonic}' + FORMATS[mode].format(value))
+    return '\n'.join(lines) + '\n'
+
+
+def run(tree, source_file, repeat):
+    output = subprocess.run([sys.executable, '-c', CHILD, str(tree), str(source_file), str(repeat)],
+                            stdout=subprocess.PIPE, text=True, check=True).stdout
+    return json.loads(output)
+
+
+def timed(rev, source_file, repeat):
+    if rev is None:
+        return run(ROOT / 'assembler', source_file, repeat)
+    with tempfile.TemporaryDirectory() as directory:
+        export(rev, directory)
+        return run(Path(directory) / 'assembler', source_file, repeat)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='encoder benchmark, before and after')
+    parser.add_argument('count', type=int, nargs='?', default=200_000)
+    parser.add_argument('--before', help='revision to compare against '
+                                         '(default: the one before opcodes.py)')
+    parser.add_argument('--after', help='revision to measure (default: the working tree)')
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    before = args.before or before_opcodes()
+    with tempfile.TemporaryDirectory() as directory:
+        source_file = Path(directory) / 'bench.asm'
+        source_file.write_text(make_source(args.count, instruction_set(before)))
+        old = timed(before, source_file, args.repeat)
+        new = timed(args.after, source_file, args.repeat)
+    assert old['md5'] == new['md5'], 'the two revisions assemble different bytes'
+
+    print(f'{args.count} instructions')
+    print(f"before  {args.count / old['seconds']:12,.0f} instr/s  ({git('rev-parse', '--short', before)})")
+    print(f"after   {args.count / new['seconds']:12,.0f} instr/s  ({args.after or 'working tree'})")
+    print(f"speedup {old['seconds'] / new['seconds']:.2f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,223 @@
+"""
+Synthetic Atari 2600 sources for benchmarks: realistic kernels at any size.
+
+    python bench/gen2600.py 100000 -o big.asm
+    python bench/gen2600.py 100000 --dialect 02 -o big/
+
+A source is a run of cartridge sized programs.  Each has a start up and
+clear loop, then sections picked at random until it nears 4K of code:
+
+  kernel      an unrolled scanline loop, sta WSYNC then colour and
+              playfield loads from a data table indexed by y
+  branch      a compare and a forward branch over a few lines
+  call        jsr to a subroutine defined at the end of the program
+  comment     a block of comment and blank lines
+
+then its subroutines and data tables, so most operands name labels further
+on.  Labels carry the program's number and are unique in the whole source.
+
+Two dialects:
+
+  asm   Assembler (assembler/asm.py): one file of every program.  It has
+        no data directives yet, so a table's rows are lda #value lines,
+        two bytes each like a .word row, parsed and encoded the same way.
+  02    02/asm.py: each program starts with processor, include "vcs.h" and
+        org $f000, ends with its vectors, and is a cartridge on its own.
+        Written to a directory as one file per program, ready for
+        assembler/batch.py.
+
+Register names are written in lower case, as they are in vcs.h; give the
+Assembler vcs.h's symbols as predefined (see vcs_symbols()).
+
+The same lines, seed and dialect always give the same source.
+"""
+from pathlib import Path
+
+import argparse
+import random
+import sys
+
+ROOT = Path(__file__).resolve().parents[1]
+VCS_DIR = ROOT / 'programming-games-for-atari-2600' / '02'
+
+# code bytes a program's sections may take before its subroutines, tables
+# and vectors, which are well under the rest of the 4K
+SECTION_BYTES = 3000
+
+COLOUR_REGISTERS = ('colubk', 'colupf', 'colup0', 'colup1')
+GRAPHICS_REGISTERS = ('pf0', 'pf1', 'pf2', 'grp0', 'grp1')
+
+
+def vcs_symbols():
+    """vcs.h's symbols, for Assembler(predefined=...)."""
+    sys.path.insert(0, str(ROOT / 'assembler'))
+    from include import default_cache
+    return default_cache.load('vcs.h', [VCS_DIR])
+
+
+class Program:
+    """One cartridge's worth of source, built up line by line."""
+
+    def __init__(self, number, rng, dialect):
+        self.number = number
+        self.rng = rng
+        self.dialect = dialect
+        self.lines = []
+        self.size = 0
+        self.labels = 0
+        self.subroutines = []
+        self.tables = []
+
+    def label(self, kind):
+        self.labels += 1
+        return f'p{self.number}_{kind}{self.labels}'
+
+    def code(self, text, size, comment=None):
+        self.size += size
+        self.lines.append(f'    {text:<20}; {comment}' if comment else f'    {text}')
+
+    def start(self):
+        if self.dialect == '02':
+            self.lines += ['    processor 6502', '    include "vcs.h"', '', '    org $f000']
+        start = self.label('start')
+        clear = self.label('clear')
+        self.lines.append(f'{start}:')
+        self.code('sei', 1)
+        self.code('cld', 1)
+        self.code('ldx #$ff', 2)
+        self.code('txs', 1)
+        self.code('lda #$00', 2)
+        self.lines.append(f'{clear}:')
+        self.code('sta 0,x', 2)
+        self.code('dex', 1)
+        self.code(f'bne {clear}', 2)
+        return start
+
+    def kernel(self):
+        rng = self.rng
+        loop = self.label('kernel')
+        colours = self.table()
+        graphics = self.table()
+        colour = rng.choice(COLOUR_REGISTERS)
+        graphic = rng.choice(GRAPHICS_REGISTERS)
+        self.code(f'ldy #{rng.randrange(8, 192)}', 2, 'scanlines')
+        self.lines.append(f'{loop}:')
+        for _ in range(rng.randrange(2, 9)):
+            self.code('sta wsync', 2)
+            self.code(f'lda {colours},y', 3)
+            self.code(f'sta {colour}', 2)
+            self.code(f'lda {graphics},y', 3)
+            self.code(f'sta {graphic}', 2)
+        self.code('dey', 1)
+        self.code(f'bne {loop}', 2)
+
+    def branch(self):
+        rng = self.rng
+        skip = self.label('skip')
+        self.code(f'lda ${rng.randrange(0x80, 0x100):02x}', 2)
+        self.code(f'cmp #{rng.randrange(256)}', 2)
+        self.code(f'{rng.choice(("bcc", "bcs", "beq", "bne"))} {skip}', 2, 'forward')
+        for _ in range(rng.randrange(1, 6)):
+            self.code(f'inc ${rng.randrange(0x80, 0x100):02x}', 2)
+        self.lines.append(f'{skip}:')
+
+    def call(self):
+        name = self.label('sub')
+        self.subroutines.append(name)
+        self.code(f'jsr {name}', 3)
+
+    def comment(self):
+        rng = self.rng
+        for _ in range(rng.randrange(1, 5)):
+            self.lines.append(f'; {rng.choice(("frame", "score", "sprite", "sound"))} '
+                              f'{rng.randrange(1000)}')
+        self.lines.append('')
+
+    def table(self):
+        name = self.label('table')
+        self.tables.append((name, self.rng.randrange(8, 33)))
+        # two bytes a row; counted now so the program is sized with them
+        self.size += 2 * self.tables[-1][1]
+        return name
+
+    def length(self):
+        """Lines the program will have once finished."""
+        return (len(self.lines) + 1 + 6 * len(self.subroutines)
+                + sum(rows + 1 for _, rows in self.tables) + 4 * (self.dialect == '02'))
+
+    def finish(self, start):
+        self.code(f'jmp {start}', 3)
+        for name in self.subroutines:
+            self.lines.append(f'{name}:')
+            self.code('lda $80', 2)
+            self.code('clc', 1)
+            self.code('adc #1', 2)
+            self.code('sta $80', 2)
+            self.code('rts', 1)
+        rng = self.rng
+        for name, rows in self.tables:
+            self.lines.append(f'{name}:')
+            for _ in range(rows):
+                value = rng.randrange(0x10000)
+                if self.dialect == '02':
+                    self.lines.append(f'    .word ${value:04x}')
+                else:
+                    self.lines.append(f'    lda #${value & 0xFF:02x}')
+        if self.dialect == '02':
+            self.lines += ['', '    org $fffc', f'    .word {start}', f'    .word {start}']
+
+
+SECTIONS = (
+    (Program.kernel, 3),
+    (Program.branch, 3),
+    (Program.call, 1),
+    (Program.comment, 2),
+)
+
+
+def programs(lines, seed=2600, dialect='asm'):
+    """
+    Yield the source of each program, as a list of lines, until there are
+    about lines lines in all.
+    """
+    rng = random.Random(seed)
+    sections = [section for section, weight in SECTIONS for _ in range(weight)]
+    total = 0
+    number = 0
+    while total < lines:
+        program = Program(number, rng, dialect)
+        start = program.start()
+        while program.size < SECTION_BYTES and total + program.length() < lines:
+            rng.choice(sections)(program)
+        program.finish(start)
+        total += len(program.lines)
+        number += 1
+        yield program.lines
+
+
+def generate(lines, seed=2600, dialect='asm'):
+    """The whole source as one string."""
+    return '\n'.join(line for program in programs(lines, seed, dialect) for line in program) + '\n'
+
+
+def main():
+    parser = argparse.ArgumentParser(description='synthetic 2600 source generator')
+    parser.add_argument('lines', type=int)
+    parser.add_argument('-o', '--output', type=Path,
+                        help='file to write (asm), or directory (02); default stdout')
+    parser.add_argument('--dialect', choices=('asm', '02'), default='asm')
+    parser.add_argument('--seed', type=int, default=2600)
+    args = parser.parse_args()
+
+    if args.dialect == '02' and args.output is not None:
+        args.output.mkdir(parents=True, exist_ok=True)
+        for number, program in enumerate(programs(args.lines, args.seed, '02')):
+            (args.output / f'prog{number:05d}.asm').write_text('\n'.join(program) + '\n')
+    elif args.output is not None:
+        args.output.write_text(generate(args.lines, args.seed, args.dialect))
+    else:
+        sys.stdout.write(generate(args.lines, args.seed, args.dialect))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,76 @@
+"""
+Assembler memory: peak and retained heap under tracemalloc while
+assembling a synthetic source.
+
+    python bench/memory.py [--lines 1000000]
+
+The source is built before tracing starts, so only the assembler's own
+allocations count: peak is the high water mark during assemble(), retained
+what the Assembler still holds afterwards (program, symbols, output).
+Every label is distinct, as is every branch to one, so this is the worst
+case for the sharing of repeated lines in ir.py.
+
+At 1,000,000 lines on CPython 3.11:
+
+    per-line tuples, before ir.py             peak 444.3 MB  retained 184.1 MB
+    ir.py columns                             peak 186.2 MB  retained  83.5 MB
+    with an unbounded expression cache        peak 197.4 MB  retained  95.2 MB
+    with the expression cache bounded         peak 189.2 MB  retained  86.5 MB
+
+Each of the source's 125,000 branch targets is a distinct operand, so
+the bounded cache of compiled expressions misses on them where the
+unbounded one kept them all.
+"""
+from pathlib import Path
+
+import argparse
+import sys
+import time
+import tracemalloc
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT / 'assembler'))
+
+from asm import Assembler
+
+LINES = [
+    'kernel{n}:',
+    '    lda #${b:02x}       ; colour',
+    '    sta $80',
+    '    ldx $81,y',
+    '    dex',
+    '    bne kernel{n}',
+    '; comment line {n}',
+    '',
+]
+
+
+def source(count):
+    return '\n'.join(LINES[n % len(LINES)].format(n=n // len(LINES), b=n & 0xFF)
+                     for n in range(count)) + '\n'
+
+
+def main():
+    parser = argparse.ArgumentParser(description='assembler memory benchmark')
+    parser.add_argument('--lines', type=int, default=1000000)
+    args = parser.parse_args()
+
+    text = source(args.lines)
+    assembler = Assembler()
+    tracemalloc.start()
+    base = tracemalloc.get_traced_memory()[0]
+    start = time.perf_counter()
+    binary = assembler.assemble(text)
+    elapsed = time.perf_counter() - start
+    retained, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    peak -= base
+    retained -= base
+    print(f'{args.lines:,d} lines  {len(binary):,d} bytes  {elapsed:.1f} s (traced)')
+    print(f'peak      {peak / 2**20:8.1f} MB  {peak / args.lines:6.0f} B/line')
+    print(f'retained  {retained / 2**20:8.1f} MB  {retained / args.lines:6.0f} B/line')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,157 @@
+"""
+Benchmark suite: the assemblers and the disassembler on generated sources
+from 1K to 1M lines, with results kept as JSON for comparing runs.
+
+    python bench/suite.py [--sizes 1000 10000 100000 1000000] [-o run.json]
+                          [--baseline before.json] [--threshold 0.1]
+
+Per size, with sources from gen2600.py:
+
+  asm       Assembler.assemble() on the whole source in the asm dialect,
+            vcs.h's symbols predefined
+  02        02/asm.py's Session.assemble() on each program of the 02
+            dialect in turn, each a 4K cartridge, sharing the include cache
+  disasm    disa2600.disassemble() of those cartridges, to /dev/null
+
+Each is run --repeat times and the best time kept.  -o writes the results;
+--baseline compares against an earlier file and flags every benchmark
+more than --threshold slower (0.1 is 10%), exiting with status 1 if there
+are any.  Timings on a busy machine vary by more than that, so compare
+runs made on the same machine, and rerun a flagged size before believing
+it.
+"""
+from pathlib import Path
+
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT / 'assembler'))
+sys.path.insert(0, str(ROOT / 'bench'))
+
+from asm import Assembler
+from frontends import load_asm02
+from disasm import load_disa
+
+import gen2600
+
+
+def best_of(repeat, run):
+    """The shortest time of repeat calls of run(), and its last result."""
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = run()
+        elapsed = time.perf_counter() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return best, result
+
+
+def bench_size(size, repeat, symbols, asm02, disa):
+    results = []
+
+    source = gen2600.generate(size, dialect='asm')
+    lines = source.count('\n')
+    elapsed, binary = best_of(repeat, lambda: Assembler(predefined=symbols).assemble(source))
+    results.append({'bench': 'asm', 'size': size, 'lines': lines,
+                    'bytes': len(binary), 'seconds': elapsed})
+
+    programs = ['\n'.join(program) + '\n' for program in gen2600.programs(size, dialect='02')]
+    lines = sum(program.count('\n') for program in programs)
+
+    def build_02():
+        return [asm02.Session(include_dirs=[gen2600.VCS_DIR]).assemble(program)
+                for program in programs]
+
+    elapsed, roms = best_of(repeat, build_02)
+    results.append({'bench': '02', 'size': size, 'lines': lines,
+                    'bytes': sum(len(rom) for rom in roms), 'seconds': elapsed})
+
+    image = b''.join(roms)
+    with open(os.devnull, 'wb') as out:
+        elapsed, _ = best_of(repeat, lambda: disa.disassemble(image, out))
+    results.append({'bench': 'disasm', 'size': size, 'lines': lines,
+                    'bytes': len(image), 'seconds': elapsed})
+    return results
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results, baseline, threshold):
+    """
+    (result, old seconds, ratio) for each benchmark in both runs, and
+    whether it is a regression: slower than the baseline by more than
+    threshold.
+    """
+    old = {(result['bench'], result['size']): result['seconds'] for result in baseline['results']}
+    for result in results:
+        before = old.get((result['bench'], result['size']))
+        if before:
+            ratio = result['seconds'] / before
+            yield result, before, ratio, ratio > 1 + threshold
+
+
+def main():
+    parser = argparse.ArgumentParser(description='assembler and disassembler benchmark suite')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 100000, 1000000])
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('-o', '--output', type=Path, help='write the results as JSON')
+    parser.add_argument('--baseline', type=Path, help='results of an earlier run to compare with')
+    parser.add_argument('--threshold', type=float, default=0.1,
+                        help='slowdown flagged as a regression (default 0.1, 10%%)')
+    args = parser.parse_args()
+
+    symbols = gen2600.vcs_symbols()
+    asm02 = load_asm02()
+    disa = load_disa()
+
+    results = []
+    for size in args.sizes:
+        for result in bench_size(size, args.repeat, symbols, asm02, disa):
+            results.append(result)
+            # the disassembler's work is the bytes, the assemblers' the lines
+            unit = 'bytes' if result['bench'] == 'disasm' else 'lines'
+            print(f"{result['bench']:<7} {result['lines']:9,d} lines  {result['seconds'] * 1000:10.1f} ms  "
+                  f"{result[unit] / result['seconds']:12,.0f} {unit}/s  {result['bytes']:9,d} bytes")
+
+    run = {
+        'date': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'commit': git_commit(),
+        'python': platform.python_version(),
+        'machine': platform.platform(),
+        'repeat': args.repeat,
+        'results': results,
+    }
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(run, f, indent=1)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        print(f"\ncompared with {args.baseline} ({baseline.get('commit')}, {baseline.get('date')}):")
+        regressions = 0
+        for result, before, ratio, regression in compare(results, baseline, args.threshold):
+            regressions += regression
+            print(f"{result['bench']:<7} {result['size']:9,d}  {before * 1000:10.1f} -> "
+                  f"{result['seconds'] * 1000:10.1f} ms  {ratio:6.2f}x"
+                  f"{'  REGRESSION' if regression else ''}")
+        if regressions:
+            print(f'{regressions} regression(s) over {args.threshold:.0%}')
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
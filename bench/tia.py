@@ -0,0 +1,95 @@
+"""
+TIA rasteriser throughput: frames rendered per second from a write trace.
+
+    python bench/tia.py [frames]
+
+Two synthetic traces, each a stream of NTSC frames:
+
+  sparse  ball.asm style: VSYNC, VBLANK, a couple of background changes
+          and the ball switched on for two lines
+  busy    a kernel that rewrites COLUBK and PF0-PF2 on every visible line
+
+Needs numpy, like tia.py itself.
+"""
+from pathlib import Path
+
+import sys
+import time
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / 'assembler'))
+
+from tia import (CLOCKS_PER_LINE, COLUBK, COLUPF, ENABL, LINES, PF0, PF1, PF2,
+                 RESBL, VBLANK, VSYNC, render_frames)
+
+
+def line_clock(line, cycle):
+    return line * CLOCKS_PER_LINE + cycle * 3
+
+
+def sparse_trace(frames):
+    trace = []
+    for n in range(frames):
+        base = n * LINES
+        trace += [
+            (line_clock(base, 3), VSYNC, 2),
+            (line_clock(base + 3, 3), VSYNC, 0),
+            (line_clock(base + 3, 10), COLUBK, 0x88),
+            (line_clock(base + 3, 14), COLUPF, 0x0F),
+            (line_clock(base + 4, 49), RESBL, 0),
+            (line_clock(base + 40, 5), VBLANK, 0),
+            (line_clock(base + 135, 5), ENABL, 2),
+            (line_clock(base + 137, 5), ENABL, 0),
+            (line_clock(base + 137, 10), COLUBK, 0xF8),
+            (line_clock(base + 232, 5), VBLANK, 2),
+        ]
+    trace.append((line_clock(frames * LINES, 3), VSYNC, 2))
+    return trace
+
+
+def busy_trace(frames):
+    trace = []
+    for n in range(frames):
+        base = n * LINES
+        trace += [
+            (line_clock(base, 3), VSYNC, 2),
+            (line_clock(base + 3, 3), VSYNC, 0),
+            (line_clock(base + 39, 70), VBLANK, 0),
+        ]
+        for line in range(192):
+            at = base + 40 + line
+            trace += [
+                (line_clock(at, 3), COLUBK, (line * 2) & 0xFF),
+                (line_clock(at, 8), PF0, line & 0xF0),
+                (line_clock(at, 13), PF1, line & 0xFF),
+                (line_clock(at, 18), PF2, (line * 3) & 0xFF),
+            ]
+        trace.append((line_clock(base + 232, 5), VBLANK, 2))
+    # close the last frame
+    trace.append((line_clock(frames * LINES, 3), VSYNC, 2))
+    return trace
+
+
+def bench(trace, full, repeat=3):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        count = sum(1 for _ in render_frames(trace, full=full))
+        elapsed = time.perf_counter() - start
+        if best is None or elapsed < best[0]:
+            best = (elapsed, count)
+    return best
+
+
+def main():
+    frames = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    for name, make in (('sparse', sparse_trace), ('busy', busy_trace)):
+        trace = make(frames)
+        for full in (False, True):
+            elapsed, count = bench(trace, full)
+            size = 'full' if full else 'picture'
+            print(f'{name:<7} {size:<8} {count:6d} frames  {elapsed * 1000:9.2f} ms  '
+                  f'{count / elapsed:10,.0f} frames/s')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,128 @@
+"""
+Lexer throughput: source lines per second on synthetic sources.
+
+    python bench/tokenise.py [--sizes 1000 10000 100000 1000000]
+
+Each source is written to a temporary file and read back through the file
+object, the way the assemblers see it.  Per size:
+
+  lexer    lexer.tokenise() over the file, every token
+  02       02/asm.py tokenise_lines(), words per line
+  asm      Assembler.parse_line() on each line
+  split    the old 02 tokeniser, re.split on the rest of the line over and
+           over, for comparison
+
+The mix has kernel lines, labels, comments and every 50th line a long
+.byte-style list of operands, where re.split on the tail goes quadratic.
+"""
+from pathlib import Path
+
+import argparse
+import re
+import sys
+import tempfile
+import time
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT / 'assembler'))
+
+from asm import Assembler
+from lexer import tokenise
+
+import importlib.util
+
+# 02/asm.py is also called asm, so load it under another name
+spec = importlib.util.spec_from_file_location(
+    'asm02', ROOT / 'programming-games-for-atari-2600' / '02' / 'asm.py')
+asm02 = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(asm02)
+
+LINES = [
+    'kernel{n}:',
+    '    lda #${n:02x}       ; colour',
+    '    sta WSYNC',
+    '    sta COLUBK',
+    '    ldx ${n:02x},y',
+    '    lda ($80),y',
+    '    dex',
+    '    bne kernel{n}',
+    '; comment line {n}',
+    '',
+]
+LONG = '    lda ' + ', '.join(f'${n:02x}' for n in range(40))
+
+
+def source_lines(count):
+    lines = []
+    for n in range(count):
+        if n % 50 == 49:
+            lines.append(LONG)
+        else:
+            lines.append(LINES[n % len(LINES)].format(n=n & 0xFF))
+    return lines
+
+
+def split_tokenise(lines):
+    """The tokeniser 02/asm.py had before lexer.py."""
+    for line in lines:
+        tokens = []
+        tail = line.lstrip(' ')
+        while True:
+            elems = re.split(r'([ ]+|[,;])', tail, maxsplit=1)
+            if len(elems) == 3:
+                token, sep, tail = elems
+                if token.startswith(';'):
+                    tokens.extend(('comment', token[1:] + sep + tail))
+                    break
+                if token:
+                    tokens.append(token)
+                if sep == ';':
+                    tokens.extend(('comment', tail))
+                    break
+            else:
+                if elems[0]:
+                    tokens.append(elems[0])
+                break
+        yield tokens
+
+
+def parse_lines(lines):
+    parse_line = Assembler().parse_line
+    for line in lines:
+        try:
+            yield parse_line(line)
+        except ValueError:
+            # the long operand lists aren't valid instructions
+            yield None
+
+
+def bench(path, run):
+    start = time.perf_counter()
+    with open(path) as f:
+        count = sum(1 for _ in run(f))
+    return count, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description='lexer benchmark')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 100000, 1000000])
+    args = parser.parse_args()
+
+    runs = [
+        ('lexer', tokenise),
+        ('02', asm02.tokenise_lines),
+        ('asm', parse_lines),
+        ('split', split_tokenise),
+    ]
+    with tempfile.TemporaryDirectory() as tmp:
+        for size in args.sizes:
+            path = Path(tmp) / f'{size}.asm'
+            path.write_text('\n'.join(source_lines(size)) + '\n')
+            for name, run in runs:
+                count, elapsed = bench(path, run)
+                print(f'{size:9,d} lines  {name:<6} {elapsed * 1000:10.1f} ms  '
+                      f'{size / elapsed:12,.0f} lines/s  ({count:,d} items)')
+
+
+if __name__ == '__main__':
+    main()
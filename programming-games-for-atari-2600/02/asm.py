@@ -1,12 +1,26 @@
-from rich.traceback import install
-install(show_locals=True)
-
+from collections import ChainMap
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
 
+import argparse
+import io
+import json
 import sys
-import re
 import struct
 
+sys.path.insert(0, str(Path(__file__).resolve().parents[2] / 'assembler'))
+
+from cart import (BANK_SCHEMES, Image, hotspots, reset_trampoline, scheme_for_banks, trampoline,
+                  window_address)
+from expr import Expression, compile_expression, symbolic, value_of
+from include import default_cache
+from lexer import words
+from listing import hex_dump_lines, write_chunks
+from macros import Macros
+from phases import NULL_PROFILER, Profiler
+from opcodes import ENCODE, INSTRUCTIONS, ZEROPAGE_MODE
+from timing import analyse, annotate, format_warnings
+
 def split_comments(lst):
     try:
         index = lst.index('comment')
@@ -14,327 +28,553 @@ def split_comments(lst):
     except ValueError:
         return lst, ''
 
-def hex_dump(data: bytes, bytes_per_line: int = 16, skip_zeros: bool = True) -> None:
+def hex_dump(data: bytes, bytes_per_line: int = 16, skip_zeros: bool = True, out=None) -> None:
     """
     Create a hex dump of a byte array, showing hex values and ASCII representation.
     Skips lines containing only zero bytes by default.
-    
+
     Args:
         data: Bytes to dump
         bytes_per_line: Number of bytes to show per line (default 16)
         skip_zeros: If True, skip lines containing only zeros (default True)
+        out: Binary stream to write to (default stdout)
     """
-    prev_zeros = False  # Track if previous line was zeros
-    
-    for i in range(0, len(data), bytes_per_line):
-        # Get the bytes for this line
-        chunk = data[i:i + bytes_per_line]
-        
-        # Check if line is all zeros
-        if skip_zeros and all(b == 0 for b in chunk):
-            if not prev_zeros:
-                print("*")  # Print marker for first zero line
-                prev_zeros = True
-            continue
-        prev_zeros = False
-        
-        # Create hex representation
-        hex_values = ' '.join(f'{b:02x}' for b in chunk)
-        
-        # Pad hex values to align ASCII representation
-        hex_padding = ' ' * (3 * (bytes_per_line - len(chunk)))
-        
-        # Create ASCII representation
-        ascii_values = ''.join(chr(b) if 32 <= b <= 126 else '.' for b in chunk)
-        
-        # Print the line with offset, hex values, and ASCII representation
-        print(f'{i:08x}  {hex_values}{hex_padding}  |{ascii_values}|')
+    if out is None:
+        out = sys.stdout.buffer
+    write_chunks(out, hex_dump_lines(data, bytes_per_line, skip_zeros))
+    out.flush()
 
 def parse_arg(arg):
-    c = arg[0]
-    if c == '$':
-        n = int(arg[1:], 16)
-    else:
-        try:
-            n = int(arg, 10)
-        except ValueError:
-            n = None
-
-    if n is None:
-        return arg
-    else:
-        return n
-
-def tokenise_lines(data):
-    lines = data.split('\n')
-    i = 0
-    while True:
-        line_tokens = [i]
-
-        try:
-            line = lines[i]
-        except IndexError:
-            break
-
-        line = line.lstrip(' ')
-        #print(f'{i} {line}')
-
-        j = 0
-        tail = line
-        while True:
-            elems = re.split(r'([ ]+|[,;])', tail, maxsplit=1)
-            #print(f'{elems=}')
-            match elems:
-                case token, sep, tail:
-                    if token == '':
-                        pass
-                    elif token[0] == ';':
-                        line_tokens.extend(('comment', ''.join((token[1:], sep, tail)).strip()))
-                        break
-                    else:
-                        line_tokens.append(token)
-
-                    if sep == ';':
-                        line_tokens.extend(('comment', tail))
-                        break
-                case [token]:
-                    if token == '':
-                        break
-                    elif token[0] == ';':
-                        line_tokens.extend(('comment', token[1:]))
-                        break
-                    line_tokens.append(token)
-                    break
-                case _:
-                    assert False
-                    break
-
-
-        #print(f'{line_tokens=}')
-        yield line_tokens
-
-        i += 1
-
-
-
-def emit(byte_array, offset=None):
-    global pc
-
-    size = len(byte_array)
-
-    if offset is None:
-        offset = pc
-        pc += size
-
-    program[offset:offset+size] = byte_array
-
-def set_origin(*args, comment):
-    global pc
-    arg = parse_arg(args[0])
-    assert isinstance(arg, int)
-    pc = arg
-    #print(f'set origin 0x{arg:04x}')
+    """
+    An operand as an int, a lower case label name or an expr.Expression,
+    e.g. "<table" or "[lines/2]-1".  The tokeniser splits on spaces, so an
+    expression is written without them.
+    """
+    return compile_expression(arg, fold_case=True)
 
-def create_label(name):
-    #print(f'create label {name=} at ${pc:04x}')
-    assert name not in labels
-    labels[name] = pc
+def tokenise_line(line):
+    """
+    The words of a line, split on spaces and commas, then 'comment' and
+    the comment text if there is one.
+    """
+    line_tokens, comment = words(line)
+    if comment is not None:
+        line_tokens += ['comment', comment]
+    return line_tokens
 
-def emit_sei(*args, comment):
-    assert args == ()
-    #print('sei')
-    emit(b'\x78')
+def tokenise_lines(lines):
+    """[line index, words...] for each line of an iterable, e.g. a file."""
+    for i, line in enumerate(lines):
+        yield [i, *tokenise_line(line)]
 
-def emit_cld(*args, comment):
-    assert args == ()
-    #print('cld')
-    emit(b'\xd8')
+def source_lines(data):
+    """
+    The lines of data, which is source text or an open file, without their
+    newlines.  A file is read a line at a time rather than all at once.
+    """
+    if isinstance(data, str):
+        data = io.StringIO(data)
+    for line in data:
+        yield line.rstrip('\n')
 
-def emit_ldx(*args, comment):
-    match args:
-        case [lhs, rhs]:
-            lhs = parse_arg(lhs)
-            rhs = parse_arg(rhs)
-            assert False
-        case [arg]:
-            arg = parse_arg(arg)
-            if isinstance(arg, str):
-                if arg[0] == '#': # immediate value
-                    arg = parse_arg(arg[1:])
-                    assert isinstance(arg, int)
-                    emit(struct.pack('<BB', 0xa2, arg))
-                else:
-                    assert False
-    #print(f'ldx {args=}')
-
-def emit_lda(*args, comment):
-    match args:
-        case [lhs, rhs]:
-            lhs = parse_arg(lhs)
-            rhs = parse_arg(rhs)
-            assert False
-        case [arg]:
-            arg = parse_arg(arg)
-            if isinstance(arg, str):
-                if arg[0] == '#': # immediate value
-                    arg = parse_arg(arg[1:])
-                    assert isinstance(arg, int)
-                    emit(struct.pack('<BB', 0xa9, arg))
-                else:
-                    assert False
-
-def emit_txs(*args, comment):
-    assert args == ()
-    #print('txs')
-    emit(b'\x9a')
-
-def emit_sta(*args, comment):
+def parse_operand(args):
+    """
+    Work out the addressing mode from the tokenised operand.  The tokeniser
+    drops commas, so "sta 0,x" arrives as ['0', 'x'] and "lda ($80),y" as
+    ['($80)', 'y'].  Absolute modes are narrowed to zero page later on, once
+    we know whether the value fits in a byte.
+    """
     match args:
-        case [lhs, rhs]:
-            lhs = parse_arg(lhs)
-            rhs = parse_arg(rhs)
-            if rhs == 'x':
-                assert isinstance(lhs, int)
-                if lhs > 255:
-                    assert False
-                else:
-                    emit(struct.pack('<BB', 0x95, lhs))
+        case []:
+            return 'implied', None
+        case [arg] if arg.lower() == 'a':
+            return 'accumulator', None
+        case [arg] if arg[0] == '#':
+            return 'immediate', parse_arg(arg[1:])
+        case [arg, reg] if arg[0] == '(' and reg.lower() == 'x)':
+            return 'indirect_x', parse_arg(arg[1:])
+        case [arg, reg] if arg[0] == '(' and arg[-1] == ')' and reg.lower() == 'y':
+            return 'indirect_y', parse_arg(arg[1:-1])
+        case [arg] if arg[0] == '(' and arg[-1] == ')':
+            return 'indirect', parse_arg(arg[1:-1])
+        case [arg, reg] if reg.lower() == 'x':
+            return 'absolute_x', parse_arg(arg)
+        case [arg, reg] if reg.lower() == 'y':
+            return 'absolute_y', parse_arg(arg)
         case [arg]:
-            arg = parse_arg(arg)
-            if isinstance(arg, str):
-                if arg[0] == '#': # immediate value
-                    assert False
-                    arg = parse_arg(arg[1:])
-                    assert isinstance(arg, int)
-                    emit(struct.pack('<BB', 0xa9, arg))
-                else:
-                    emit(struct.pack('<BH', 0x8d, 0xcafe))
-                    references.append((arg, 'u16', pc+1))
-    #print(f'sta {args=}')
-
-def emit_dex(*args, comment):
-    assert args == ()
-    #print('dex')
-    emit(b'\xca')
-
-def emit_bne(*args, comment): # 0xd0
-    assert len(args) == 1
-    arg = parse_arg(args[0])
-    if isinstance(arg, str):
-        references.append((arg, 'r8', pc+1))
-        rel_offset = 0xff
-    else:
-        rel_offset = arg
-        assert False
-    emit(struct.pack('<BB', 0xd0, rel_offset))
-    #print(f'bne {args=}')
-
-def emit_nop(*args, comment):
-    assert args == ()
-    #print(f'nop {args=}, {comment=}')
-    emit(b'\xea')
-
-def emit_jmp(*args, comment):
-    assert len(args) == 1
-    arg = parse_arg(args[0])
-    if isinstance(arg, str):
-        references.append((arg, 'u16', pc+1))
-        dst = 0xcafe
-    else:
-        assert False
-    emit(struct.pack('<BH', 0x4c, dst))
-
-def emit_word(*args, comment):
-    #print(f'.word {args=}')
-    assert len(args) == 1
-    arg = parse_arg(args[0])
-    if isinstance(arg, str):
-        references.append((arg, 'u16', pc))
-        n = 0xcafe
-    else:
-        n = arg
+            return 'absolute', parse_arg(arg)
+    assert False, f'bad operand {args=}'
 
-    packed = struct.pack('<H', n)
-    emit(packed)
+class BankedSource(ValueError):
+    """A source with bank lines, which Session.assemble() can't take."""
+
+class Session:
+    """
+    One assembly: the program image, labels, pending references and pc.
+    Sessions share nothing but the include cache, so several can run side
+    by side in threads or one worker can assemble file after file.
+
+    Labels are case-insensitive, as in dasm, so "sta wsync" finds the WSYNC
+    defined in vcs.h.  include looks in include_dirs, then the current
+    directory; includes lists every header read, nested ones too, for
+    tools that rebuild when one changes.
+
+    Every instruction is also recorded in instructions, with its source
+    line and operand, for timing_report().  MAC/ENDM and REPT/REPEND are
+    expanded as the lines are read, see macros.py.
+
+    A profiler (phases.py) times pass one, with tokenising inside it,
+    reference fixups and building the image.
+
+    Sources split into 4K banks with "bank n" lines go through
+    assemble_banks() instead, a Session per bank.  defined and jumps keep
+    what the bank linker needs: the labels this session defined itself,
+    and which references are JMP or JSR operands.
+    """
 
-def do_nothing(*args, comment):
-    pass
+    def __init__(self, labels=None, include_dirs=(), include_cache=None, profiler=None):
+        self.image = Image()
+        self.references = []
+        self.labels = {name.lower(): value for name, value in (labels or {}).items()}
+        self.include_dirs = list(include_dirs)
+        self.include_cache = include_cache or default_cache
+        self.includes = []
+        self.pc = 0
+        self.line_num = 0
+        self.instructions = []
+        self.defined = []
+        self.jumps = {}
+        self.profiler = profiler or NULL_PROFILER
+
+    def __getstate__(self):
+        # bank sessions come back from worker processes; the include cache
+        # holds a lock and the profiler belongs to the parent, so both stay
+        state = self.__dict__.copy()
+        del state['include_cache'], state['profiler']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.include_cache = default_cache
+        self.profiler = NULL_PROFILER
+
+    def emit(self, byte_array, offset=None):
+        if offset is None:
+            self.image.emit(self.pc, byte_array)
+            self.pc += len(byte_array)
+        else:
+            self.image.patch(offset, byte_array)
+
+    def set_origin(self, *args, comment):
+        arg = parse_arg(args[0])
+        assert isinstance(arg, int)
+        self.pc = arg
+        #print(f'set origin 0x{arg:04x}')
+
+    def create_label(self, name):
+        #print(f'create label {name=} at ${self.pc:04x}')
+        name = name.lower()
+        assert name not in self.labels
+        self.labels[name] = self.pc
+        self.defined.append(name)
+
+    def emit_instruction(self, mnemonic, *args, comment):
+        mode, arg = parse_operand(args)
+
+        if mode == 'implied' and (mnemonic, 'implied') not in ENCODE:
+            mode = 'accumulator'
+        elif (mnemonic, 'relative') in ENCODE:
+            mode = 'relative'
+        elif mode in ZEROPAGE_MODE:
+            value = value_of(arg, self.labels)
+            zp_mode = ZEROPAGE_MODE[mode]
+            if value is not None and value < 0x100 and (mnemonic, zp_mode) in ENCODE:
+                mode = zp_mode
+                arg = value
+
+        opcode, length, cycles = ENCODE[mnemonic, mode]
+        self.instructions.append(
+            (self.line_num + 1, self.pc, opcode, mnemonic, mode, cycles,
+             arg))
+
+        if length == 1:
+            self.emit(bytes((opcode,)))
+            return
+
+        if mode == 'relative' and isinstance(arg, int):
+            # a numeric branch target, as a disassembly prints it
+            arg = arg - (self.pc + 2)
+            assert -128 <= arg <= 127, f'branch out of range {arg=}'
+
+        if symbolic(arg):
+            if mode == 'relative':
+                self.references.append((arg, 'r8', self.pc+1))
+            elif length == 3:
+                self.references.append((arg, 'u16', self.pc+1))
+                if mnemonic in ('JMP', 'JSR') and mode == 'absolute':
+                    self.jumps[self.pc+1] = mnemonic
+            else:
+                self.references.append((arg, 'u8', self.pc+1))
+            arg = 0
+
+        if length == 2:
+            self.emit(bytes((opcode, arg & 0xff)))
+        else:
+            self.emit(bytes((opcode, arg & 0xff, arg >> 8)))
+
+    def emit_word(self, *args, comment):
+        #print(f'.word {args=}')
+        assert len(args) == 1
+        arg = parse_arg(args[0])
+        if symbolic(arg):
+            self.references.append((arg, 'u16', self.pc))
+            n = 0xcafe
+        else:
+            n = arg
+
+        packed = struct.pack('<H', n)
+        self.emit(packed)
+
+    def include(self, *args, comment):
+        assert len(args) == 1
+        name = args[0].strip('"\'')
+        self.labels.update(self.include_cache.load(name, self.include_dirs))
+        self.includes.extend(self.include_cache.files(name, self.include_dirs))
+
+    def do_nothing(self, *args, comment):
+        pass
+
+    def bank(self, *args, comment):
+        raise BankedSource(f'line {self.line_num + 1}: bank needs assemble_banks(), not Session.assemble()')
+
+    def pass_one(self, lines):
+        """
+        Read (line number, text) pairs, emitting code with placeholders for
+        the references resolve_references() fills in.
+        """
+        profiler = self.profiler
+        with profiler.phase('pass one') as phase:
+            macros = Macros(profiler.timed('tokenise', tokenise_line))
+            count = 0
+            for line_num, tokens in macros.expand(lines):
+                #print(line_num, tokens)
+                count += 1
+                match tokens:
+                    case cmd_name, *args:
+                        args, comment = split_comments(args)
+                        self.line_num = line_num
+                        #print(f'{line_num=} {cmd_name=} {args=} {comment=}')
+                        if cmd_name[-1] == ':':
+                            assert args == []
+                            self.create_label(name=cmd_name[:-1])
+                        else:
+                            fn = commands.get(cmd_name, None)
+                            if fn is not None:
+                                fn(self, *args, comment=comment)
+                            else:
+                                mnemonic = cmd_name.upper()
+                                assert mnemonic in INSTRUCTIONS, f'missing {cmd_name=}'
+                                self.emit_instruction(mnemonic, *args, comment=comment)
+                    case []:
+                        pass
+            phase.count(lines=count, instructions=len(self.instructions))
+
+    def assemble(self, data):
+        """
+        Assemble source text or an open file, returning the 4K cartridge
+        image.  A "bank n" line raises BankedSource.
+        """
+        profiler = self.profiler
+        self.pass_one(enumerate(source_lines(data)))
+        with profiler.phase('fixups') as phase:
+            self.resolve_references()
+            phase.count(references=len(self.references))
+        with profiler.phase('image') as phase:
+            rom = self.image.rom()
+            phase.count(bytes=len(rom))
+        return rom
+
+    def resolve_references(self, lookup=None):
+        """
+        Patch in the value of each label or expression referred to.  Those
+        this session can't work out are passed to lookup(name, size,
+        offset), if given, which the bank linker uses for labels in other
+        banks.
+        """
+        for label_name, var_size, offset in self.references:
+            n = value_of(label_name, self.labels)
+            if n is None:
+                if lookup is None:
+                    raise KeyError(label_name)
+                n = lookup(label_name, var_size, offset)
+            if var_size == 'u16':
+                packed = struct.pack('<H', n)
+                self.emit(packed, offset)
+            elif var_size == 'u8':
+                packed = struct.pack('<B', n)
+                self.emit(packed, offset)
+            elif var_size == 'r8':
+                # offset is the operand byte; the branch counts from the
+                # next instruction
+                rel_offset = n - (offset + 1)
+                packed = struct.pack('<b', rel_offset)
+                self.emit(packed, offset)
+            else:
+                assert False
+
+    def timing_report(self):
+        """Cycle counts and scanline spans, see timing.analyse()."""
+        resolved = [
+            (*fields, value_of(arg, self.labels))
+            for *fields, arg in self.instructions
+        ]
+        return analyse(resolved)
 
 commands = {
-        'org': set_origin,
-        'comment': do_nothing,
-        'processor': do_nothing,
-        'include': do_nothing,
-        'sei': emit_sei,
-        'cld': emit_cld,
-        'lda': emit_lda,
-        'ldx': emit_ldx,
-        'txs': emit_txs,
-        'sta': emit_sta,
-        'dex': emit_dex,
-        'bne': emit_bne,
-        'nop': emit_nop,
-        'jmp': emit_jmp,
-        '.word': emit_word,
+        'org': Session.set_origin,
+        'comment': Session.do_nothing,
+        'processor': Session.do_nothing,
+        'include': Session.include,
+        '.word': Session.emit_word,
+        'bank': Session.bank,
 }
 
-program = bytearray(4096)
-references = []
-labels = {
-        'colubk': 0x8008,
-        'colupf': 0x8008,
-        'wsync':  0x8008,
-        'vsync':  0x8008,
-        'resbl':  0x8008,
-        'vblank': 0x8008,
-        'enabl':  0x8008,
-        }
-pc = 0
+def split_banks(data):
+    """
+    Split source at its "bank n" lines.  Returns (header, banks): the
+    (line number, text) pairs before the first bank line, which every bank
+    reads first, and {bank number: its (line number, text) pairs}.  A
+    source without bank lines is all header.
+    """
+    header = []
+    banks = {}
+    current = header
+    for line_num, line in enumerate(source_lines(data)):
+        found, _ = words(line)
+        if len(found) == 2 and found[0].lower() == 'bank':
+            number = parse_arg(found[1])
+            assert isinstance(number, int), f'line {line_num + 1}: bad bank {found[1]!r}'
+            current = banks.setdefault(number, [])
+        else:
+            current.append((line_num, line))
+    return header, banks
 
-def main(filename):
+def assemble_bank(job):
+    """
+    Pass one of a single bank, in a worker process.  Code starts at $F000,
+    the window the bank is switched into, unless the bank sets an org.
+    """
+    number, lines, labels, include_dirs = job
+    session = Session(labels=labels, include_dirs=include_dirs)
+    session.pc = 0xf000
+    session.pass_one(lines)
+    return number, session
 
-    global pc
+# the 6502's reset and BRK/IRQ vectors, as seen in the cartridge window
+VECTORS = (0xfffc, 0xfffe)
 
-    with open(filename, 'r', encoding='utf8') as f:
-        data = f.read()
-
-    lines = list(tokenise_lines(data))
-
-    for line in lines:
-        #print(line)
-        match line:
-            case line_num, cmd_name, *args:
-                args, comment = split_comments(args)
-                #print(f'{line_num=} {cmd_name=} {args=} {comment=}')
-                if cmd_name[-1] == ':':
-                    assert args == []
-                    create_label(name=cmd_name[:-1])
-                else:
-                    fn = commands.get(cmd_name, None)
-                    assert fn is not None, f'missing {cmd_name=}'
-                    fn(*args, comment=comment)
-            case [line_num]:
-                pass
-
-
-    for label_name, var_size, offset in references:
-        n = labels[label_name]
-        if var_size == 'u16':
-            packed = struct.pack('<H', n)
-            emit(packed, offset)
-        elif var_size == 'r8':
-            rel_offset = n - offset
-            packed = struct.pack('<b', rel_offset)
-            emit(packed, offset)
-        else:
-            assert False
+def vector(session, address):
+    """
+    The word session emitted at address, in any mirror, or None.  A word
+    still waiting on a fixup reads as its placeholder.
+    """
+    for segment in session.image.segments:
+        offset = (address & 0xfff) - (segment.start & 0xfff)
+        if segment.start & 0x1000 and 0 <= offset <= len(segment.data) - 2:
+            return segment.data[offset] | segment.data[offset + 1] << 8
+    return None
 
-    hex_dump(program)
+def link_banks(sessions, scheme=None):
+    """
+    Resolve references across banks and lay the banks out as one image, 4K
+    each in bank order.  sessions maps bank numbers to Sessions that have
+    been through pass one; scheme defaults to the smallest that has room.
+
+    A JMP or JSR to a label in another bank goes through a trampoline (see
+    cart.trampoline()), one for each target, and for JSR for each calling
+    bank too.  Every bank gets the same trampolines, packed in just below
+    the scheme's hotspots.  Any other reference to another bank's label
+    gets the label's address as it stands, and so does a label in an
+    expression, which is worked out against every bank's labels.
+
+    The console can start up in any bank.  A bank that doesn't set the
+    reset or BRK vector, or isn't in sessions at all, has it pointed at
+    one more trampoline (see cart.reset_trampoline()), which switches to
+    bank 0 and jumps through bank 0's reset vector; bank 0 must then set
+    one.
+    """
+    count = max(sessions) + 1
+    scheme = scheme or scheme_for_banks(count)
+    _, first_hotspot, bank_count = BANK_SCHEMES[scheme]
+    if count > bank_count:
+        raise ValueError(f'{count} banks do not fit in {scheme}, which has {bank_count}')
+    hotspot = hotspots(scheme)
+
+    owner = {}
+    for number, session in sorted(sessions.items()):
+        for name in session.defined:
+            if name in owner:
+                raise ValueError(f'{name} is defined in bank {owner[name]} and bank {number}')
+            owner[name] = number
+    everywhere = {name: sessions[number].labels[name] for name, number in owner.items()}
+
+    # (label, calling bank for JSR or None for JMP) -> trampoline address,
+    # in the order first met so the layout is the same every build
+    stubs = {}
+    for number, session in sorted(sessions.items()):
+        for label_name, var_size, offset in session.references:
+            if isinstance(label_name, Expression) or label_name in session.labels:
+                continue
+            if label_name not in owner:
+                raise KeyError(label_name)
+            if var_size == 'r8':
+                raise ValueError(f'branch to {label_name} in bank {owner[label_name]} from bank {number}')
+            mnemonic = session.jumps.get(offset)
+            if mnemonic is not None:
+                stubs.setdefault((label_name, number if mnemonic == 'JSR' else None), None)
+
+    code = bytearray()
+    for key in stubs:
+        label_name, caller = key
+        target = owner[label_name]
+        stubs[key] = len(code)
+        code += trampoline(hotspot[target], sessions[target].labels[label_name],
+                           None if caller is None else hotspot[caller])
+
+    unset = [(number, address) for number in range(bank_count) for address in VECTORS
+             if number not in sessions or vector(sessions[number], address) is None]
+    reset_stub = None
+    if any(number != 0 for number, _ in unset):
+        if 0 not in sessions or vector(sessions[0], VECTORS[0]) is None:
+            raise ValueError('bank 0 must set the reset vector at $FFFC, '
+                             'which banks without their own vectors start through')
+        reset_stub = len(code)
+        code += reset_trampoline(hotspot[0], VECTORS[0])
+
+    start = window_address(first_hotspot) - len(code) if first_hotspot else 0
+    for key in stubs:
+        stubs[key] += start
+    if reset_stub is not None:
+        reset_stub += start
+
+    rom = bytearray()
+    for number in range(bank_count):
+        session = sessions.get(number) or Session()
+
+        def lookup(label_name, var_size, offset):
+            if isinstance(label_name, Expression):
+                n = label_name.evaluate(ChainMap(session.labels, everywhere))
+                if n is None:
+                    raise KeyError(str(label_name))
+                return n
+            mnemonic = session.jumps.get(offset)
+            if mnemonic == 'JSR':
+                return stubs[label_name, number]
+            if mnemonic == 'JMP':
+                return stubs[label_name, None]
+            return sessions[owner[label_name]].labels[label_name]
+
+        session.resolve_references(lookup)
+        if code:
+            session.image.emit(start, code)
+        if reset_stub is not None:
+            for address in VECTORS:
+                if (number, address) in unset:
+                    session.image.emit(address, struct.pack('<H', reset_stub))
+        rom += session.image.rom()
+    return rom
+
+def assemble_banks(data, labels=None, include_dirs=(), jobs=None, scheme=None, profiler=None):
+    """
+    Assemble a source split into banks by "bank n" lines, returning the 8K,
+    16K or 32K image (see link_banks()).  The banks go through pass one
+    side by side in a process pool of jobs workers, which is worth it once
+    each bank is a few thousand lines; jobs=1 keeps them in this process.
+    """
+    profiler = profiler or NULL_PROFILER
+    header, banks = split_banks(data)
+    work = [(number, header + lines, labels, include_dirs) for number, lines in sorted(banks.items())]
+    with profiler.phase('banks') as phase:
+        if jobs == 1 or len(work) < 2:
+            results = [assemble_bank(job) for job in work]
+        else:
+            with ProcessPoolExecutor(max_workers=jobs) as pool:
+                results = list(pool.map(assemble_bank, work))
+        phase.count(banks=len(work))
+    with profiler.phase('link') as phase:
+        rom = link_banks(dict(results), scheme)
+        phase.count(bytes=len(rom))
+    return rom
+
+def main(filename, timing=False, dump=False, profile=None, jobs=None, scheme=None):
+    profiler = NULL_PROFILER if profile is None else Profiler(memory=True)
+
+    # the source is streamed from the file; a banked one is only found out
+    # at its first bank line, and is then read again from the start
+    session = Session(include_dirs=[filename.parent], profiler=profiler)
+    with open(filename, 'r', encoding='utf8') as f:
+        try:
+            with profiler.phase('assemble'):
+                program = session.assemble(f)
+        except BankedSource:
+            session = None
+            f.seek(0)
+            with profiler.phase('assemble banks'):
+                program = assemble_banks(f, include_dirs=[filename.parent], jobs=jobs,
+                                         scheme=scheme, profiler=profiler)
+
+    if session is None:
+        report = None
+        if timing:
+            print('--timing only covers sources without banks', file=sys.stderr)
+    else:
+        with profiler.phase('timing') as phase:
+            report = session.timing_report()
+            phase.count(instructions=len(session.instructions))
+        for message in format_warnings(report, filename.name):
+            print(message, file=sys.stderr)
+
+    with profiler.phase('listing'):
+        if timing and report is not None:
+            with open(filename, 'r', encoding='utf8') as f:
+                for line in annotate(source_lines(f), report):
+                    print(line)
+            with open(filename.with_suffix('.timing.json'), 'w') as f:
+                json.dump(report, f, indent=1)
+        if dump:
+            hex_dump(program)
     #print(dir(filename))
-    with open(filename.with_suffix('.bin'), 'wb') as f:
-        f.write(program)
+    with profiler.phase('write') as phase:
+        with open(filename.with_suffix('.bin'), 'wb') as f:
+            f.write(program)
+        phase.count(bytes=len(program))
+
+    if profile == '':
+        for line in profiler.format():
+            print(line, file=sys.stderr)
+    elif profile == '-':
+        json.dump(profiler.report(), sys.stdout, indent=1)
+        print()
+    elif profile is not None:
+        with open(profile, 'w') as f:
+            json.dump(profiler.report(), f, indent=1)
 
 
 if __name__ == '__main__':
-    main(filename=Path(sys.argv[1]))
-
+    from rich.traceback import install
+    install(show_locals=True)
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('filename', type=Path)
+    parser.add_argument('--timing', action='store_true',
+                        help='print a listing with cycle counts and write <file>.timing.json')
+    parser.add_argument('--dump', action='store_true', help='print a hex dump of the image')
+    parser.add_argument('--profile', nargs='?', const='', metavar='JSON',
+                        help='time each phase and print a table to stderr, or write JSON to the file given (- for stdout)')
+    parser.add_argument('-j', '--jobs', type=int, help='worker processes for the banks of a banked source')
+    parser.add_argument('--scheme', choices=('F8', 'F6', 'F4'),
+                        help='bank switching scheme (default: the smallest the banks fit)')
+    args = parser.parse_args()
+
+    main(filename=args.filename, timing=args.timing, dump=args.dump, profile=args.profile,
+         jobs=args.jobs, scheme=args.scheme)
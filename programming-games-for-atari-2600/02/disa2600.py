@@ -1,65 +1,364 @@
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
 
+import argparse
+import hashlib
+import json
+import mmap
+import os
 import struct
 import sys
 
-filename = Path(sys.argv[1])
-
-print(filename)
-
-with open(filename, 'rb') as f:
-    data = f.read()
-
-i = 0
-while i < len(data):
-    n = data[i]
-    if n != 0: break
-    i += 1
-
-while i < len(data):
-    opcode = struct.unpack_from('<B', data, i)[0]
-    opcode_size = 1
-    if opcode == 0x00:
-        asm = 'brk'
-    elif opcode == 0x4c:
-        n = struct.unpack_from('<H', data, i+1)[0]
-        opcode_size = 3
-        asm = f'jmp ${n:04x}'
-    elif opcode == 0x78:
-        asm = 'sei'
-    elif opcode == 0x8d:
-        n = struct.unpack_from('<H', data, i+1)[0]
-        opcode_size = 3
-        asm = f'sta ${n:04x}'
-    elif opcode == 0x95:
-        n = struct.unpack_from('<B', data, i+1)[0]
-        opcode_size = 2
-        asm = f'sta ${n:02x},x'
-    elif opcode == 0x9a:
-        asm = 'txs'
-    elif opcode == 0xa2:
-        n = struct.unpack_from('<B', data, i+1)[0]
-        opcode_size = 2
-        asm = f'ldx #${n:02x}'
-    elif opcode == 0xa9:
-        n = struct.unpack_from('<B', data, i+1)[0]
-        opcode_size = 2
-        asm = f'lda #${n:02x}'
-    elif opcode == 0xca:
-        asm = 'dex'
-    elif opcode == 0xd0:
-        n = struct.unpack_from('<B', data, i+1)[0]
-        opcode_size = 2
-        asm = f'bne ${n:02x}'
-    elif opcode == 0xd8:
-        asm = 'cld'
-    elif opcode == 0xea:
-        asm = 'nop'
+sys.path.insert(0, str(Path(__file__).resolve().parents[2] / 'assembler'))
+
+from cart import bank_base, banks, detect_bank_scheme
+from opcodes import DECODE
+
+HEX = [f'{b:02x}' for b in range(256)]
+
+# How each addressing mode prints, given the operand as $xx or $xxxx
+OPERAND_FORMATS = {
+    'implied': '',
+    'accumulator': ' a',
+    'immediate': ' #{}',
+    'zeropage': ' {}',
+    'zeropage_x': ' {},x',
+    'zeropage_y': ' {},y',
+    'absolute': ' {}',
+    'absolute_x': ' {},x',
+    'absolute_y': ' {},y',
+    'indirect': ' ({})',
+    'indirect_x': ' ({},x)',
+    'indirect_y': ' ({}),y',
+    'relative': ' {}',
+}
+
+def build_line_table():
+    """
+    For every opcode byte: (length, format string, is_branch).  The format
+    string already holds the mnemonic so decoding an instruction is one
+    list index plus one str.format.
+    """
+    table = []
+    for opcode, entry in enumerate(DECODE):
+        if entry is None:
+            table.append((1, f'.byte ${opcode:02x}', False))
+            continue
+        mnemonic, mode, length, _ = entry
+        fmt = mnemonic.lower() + OPERAND_FORMATS[mode]
+        if length == 1:
+            # nothing to substitute, keep the braces out of it
+            fmt = fmt.replace('{}', '')
+        table.append((length, fmt, mode == 'relative'))
+    return table
+
+LINE_TABLE = build_line_table()
+
+def decode(data, start=0, end=None, base=0):
+    """
+    Linear sweep over data[start:end], yielding (offset, length, text) per
+    instruction.  base is the address of data[0], used for branch targets.
+    A truncated instruction at the end comes out as .byte lines.
+    """
+    table = LINE_TABLE
+    if end is None:
+        end = len(data)
+
+    i = start
+    while i < end:
+        length, fmt, is_branch = table[data[i]]
+        if i + length > end:
+            yield i, 1, f'.byte ${data[i]:02x}'
+            i += 1
+            continue
+
+        if length == 1:
+            text = fmt
+        elif is_branch:
+            rel = data[i+1]
+            target = base + i + 2 + (rel - 256 if rel > 127 else rel)
+            text = fmt.format(f'${target & 0xffff:04x}')
+        elif length == 2:
+            text = fmt.format('$' + HEX[data[i+1]])
+        else:
+            text = fmt.format('$' + HEX[data[i+2]] + HEX[data[i+1]])
+
+        yield i, length, text
+        i += length
+
+# code map flags, one byte per ROM byte; anything left at 0 is data
+CODE = 1        # first byte of an instruction
+OPERAND = 2     # operand byte of an instruction
+
+VECTORS = (0xfffc, 0xfffe)      # reset, irq/brk
+
+# instructions after which execution never falls through
+STOPS = {'JMP', 'RTS', 'RTI', 'BRK'}
+
+def trace(data, start=0, end=None):
+    """
+    Recursive descent from the reset and irq vectors over one cartridge
+    window data[start:end].  Follows branches, JSR and absolute JMP targets
+    that land in the window and returns a code map (bytearray of CODE /
+    OPERAND flags) for data[start:end].  Targets outside cartridge space,
+    JMP (indirect) and undefined opcodes end a path.
+    """
+    if end is None:
+        end = len(data)
+    size = end - start
+    codemap = bytearray(size)
+    if size < 4:
+        return codemap
+
+    def to_offset(address):
+        if not address & 0x1000:
+            return None     # RAM, TIA or RIOT
+        return (address & 0xfff) % size
+
+    work = []
+    for vector in VECTORS:
+        i = start + to_offset(vector)
+        if i + 1 < end:
+            work.append(to_offset(data[i] | data[i+1] << 8))
+
+    while work:
+        i = work.pop()
+        while i is not None and i < size and not codemap[i]:
+            entry = DECODE[data[start + i]]
+            if entry is None:
+                break
+            mnemonic, mode, length, _ = entry
+            if i + length > size or any(codemap[i+1:i+length]):
+                break
+            codemap[i] = CODE
+            codemap[i+1:i+length] = bytes([OPERAND]) * (length - 1)
+
+            if mode == 'relative':
+                rel = data[start + i + 1]
+                work.append((i + 2 + (rel - 256 if rel > 127 else rel)) % size)
+            elif mnemonic in ('JMP', 'JSR') and mode == 'absolute':
+                work.append(to_offset(data[start + i + 1] | data[start + i + 2] << 8))
+
+            if mnemonic in STOPS:
+                break
+            i += length
+
+    return codemap
+
+def load_codemap(filename, data):
+    """
+    Code map for the whole image, traced bank by bank.  The map is saved
+    next to the ROM as <rom>.map, headed by the image's sha1, and read back
+    instead of retracing while the image is unchanged.
+    """
+    digest = hashlib.sha1(data).digest()
+    map_path = Path(f'{filename}.map')
+    try:
+        saved = map_path.read_bytes()
+        if saved[:20] == digest and len(saved) == 20 + len(data):
+            return bytearray(saved[20:])
+    except OSError:
+        pass
+
+    codemap = bytearray()
+    for bank, start, end in banks(data):
+        codemap += trace(data, start, end)
+    try:
+        map_path.write_bytes(digest + codemap)
+    except OSError:
+        pass    # read-only directory, just don't cache
+    return codemap
+
+def decode_traced(data, codemap, start=0, end=None, base=0, data_width=8):
+    """
+    Like decode() but only instructions marked in codemap (which covers
+    data[start:end]) are decoded; runs of data come out as .byte lines of up
+    to data_width bytes.
+    """
+    if end is None:
+        end = len(data)
+
+    i = start
+    while i < end:
+        if codemap[i - start] == CODE:
+            line = next(decode(data, i, end, base))
+            yield line
+            i += line[1]
+            continue
+        j = i + 1
+        while j < end and j - i < data_width and codemap[j - start] != CODE:
+            j += 1
+        yield i, j - i, '.byte ' + ','.join(['$' + HEX[b] for b in data[i:j]])
+        i = j
+
+def disassemble(data, out, start=0, end=None, base=0, chunk_lines=4096, codemap=None):
+    """
+    Write a listing of data[start:end] to the binary stream out, in chunks
+    of chunk_lines lines rather than one write per instruction.  Given a
+    codemap for data[start:end] only traced code is disassembled.
+    """
+    hex_table = HEX
+    lines = []
+    if codemap is None:
+        decoded = decode(data, start, end, base)
     else:
-        asm = 'unknown opcode'
-    
-    chunk = struct.unpack_from(f'<{opcode_size}B', data, i)
-    hex_values = (' '.join(f'{b:02x}' for b in chunk)).ljust(8, ' ')
+        decoded = decode_traced(data, codemap, start, end, base)
+    for i, length, text in decoded:
+        # .byte runs already spell out their bytes
+        hex_values = ' '.join([hex_table[b] for b in data[i:i+min(length, 3)]])
+        lines.append(f'{i:04x} {hex_values:<8} {text}\n')
+        if len(lines) >= chunk_lines:
+            out.write(''.join(lines).encode())
+            lines.clear()
+    if lines:
+        out.write(''.join(lines).encode())
+
+def map_rom(filename):
+    """
+    Memory map a ROM image read-only.  Returns (memoryview, close) so the
+    caller can release the mapping once done; empty files come back as an
+    empty view.
+    """
+    f = open(filename, 'rb')
+    try:
+        m = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    except ValueError:
+        f.close()
+        return memoryview(b''), lambda: None
+    view = memoryview(m)
+
+    def close():
+        view.release()
+        m.close()
+        f.close()
+
+    return view, close
+
+def skip_leading_zeros(data):
+    i = 0
+    while i < len(data) and data[i] == 0:
+        i += 1
+    return i
+
+ROM_SUFFIXES = {'.a26', '.bin', '.rom'}
+
+# Binary corpus records: rom id, bank, address, length, instruction bytes
+# (zero padded).  Mnemonic, mode and operand follow from the opcode byte.
+RECORD = struct.Struct('<IBHB3s')
+
+def find_roms(directory):
+    roms = []
+    for root, dirs, files in os.walk(directory):
+        dirs.sort()
+        for name in sorted(files):
+            if Path(name).suffix.lower() in ROM_SUFFIXES:
+                roms.append(Path(root) / name)
+    return roms
+
+def rom_records(job):
+    """
+    Disassemble one ROM for the corpus.  Runs in a worker process and hands
+    back the encoded records as one bytes blob, plus (scheme, hotspot hits,
+    instruction count) for the summary.
+    """
+    rom_id, path, name, fmt = job
+    data, close = map_rom(path)
+    try:
+        scheme, hits = detect_bank_scheme(data)
+        chunks = []
+        count = 0
+        quoted_name = json.dumps(name)
+        quoted_scheme = json.dumps(scheme)
+        for bank, start, end in banks(data):
+            base = bank_base(start, end)
+            for i, length, text in decode(data, start, end, base - start):
+                raw = bytes(data[i:i+length])
+                address = base + i - start
+                count += 1
+                if fmt == 'bin':
+                    chunks.append(RECORD.pack(rom_id, bank, address, length, raw))
+                    continue
+                mnemonic, _, operand = text.partition(' ')
+                entry = DECODE[raw[0]]
+                mode = 'data' if entry is None or length == 1 and entry[2] != 1 else entry[1]
+                chunks.append(
+                    f'{{"rom": {quoted_name}, "scheme": {quoted_scheme}, "bank": {bank}, '
+                    f'"offset": {i}, "address": {address}, "bytes": "{raw.hex()}", '
+                    f'"mnemonic": "{mnemonic}", "operand": "{operand}", "mode": "{mode}"}}\n'
+                )
+        blob = b''.join(chunks) if fmt == 'bin' else ''.join(chunks).encode()
+        return rom_id, blob, scheme, hits, count
+    finally:
+        close()
+
+def disassemble_corpus(directory, out_path, fmt='jsonl', jobs=None):
+    """
+    Disassemble every ROM under directory across a process pool, writing
+    records to out_path as JSONL or the binary RECORD format.  Binary output
+    also gets a <out_path>.roms JSONL index of rom id, path and scheme.
+    Returns the number of ROMs and instructions written.
+    """
+    roms = find_roms(directory)
+    jobs_list = [(rom_id, path, str(path.relative_to(directory)), fmt)
+                 for rom_id, path in enumerate(roms)]
+    index = []
+    total = 0
+    with open(out_path, 'wb') as out, ProcessPoolExecutor(max_workers=jobs) as pool:
+        chunksize = max(1, len(jobs_list) // ((jobs or os.cpu_count() or 1) * 8))
+        for rom_id, blob, scheme, hits, count in pool.map(rom_records, jobs_list,
+                                                          chunksize=chunksize):
+            out.write(blob)
+            total += count
+            index.append({'id': rom_id, 'rom': jobs_list[rom_id][2],
+                          'scheme': scheme, 'hotspot_hits': hits})
+
+    if fmt == 'bin':
+        with open(f'{out_path}.roms', 'w') as f:
+            for entry in index:
+                f.write(json.dumps(entry) + '\n')
+    return len(roms), total
+
+def main():
+    parser = argparse.ArgumentParser(description='Atari 2600 disassembler')
+    parser.add_argument('filename', type=Path, nargs='?')
+    parser.add_argument('--base', type=lambda s: int(s, 0), default=0,
+                        help='address of the first byte, for branch targets')
+    parser.add_argument('--trace', action='store_true',
+                        help='only disassemble code reachable from the vectors')
+    parser.add_argument('--corpus', type=Path, metavar='DIR',
+                        help='disassemble every ROM under DIR')
+    parser.add_argument('--out', type=Path, help='corpus output file')
+    parser.add_argument('--format', choices=('jsonl', 'bin'), default='jsonl')
+    parser.add_argument('-j', '--jobs', type=int, default=None)
+    args = parser.parse_args()
+
+    if args.corpus:
+        if args.out is None:
+            parser.error('--corpus needs --out')
+        roms, instructions = disassemble_corpus(args.corpus, args.out, args.format, args.jobs)
+        print(f'{roms} roms, {instructions} instructions written to {args.out}')
+        return
+
+    if args.filename is None:
+        parser.error('need a ROM file or --corpus')
+
+    out = sys.stdout.buffer
+    out.write(f'{args.filename}\n'.encode())
+
+    data, close = map_rom(args.filename)
+    try:
+        if args.trace:
+            codemap = load_codemap(args.filename, data)
+            for bank, start, end in banks(data):
+                if len(data) > end - start:
+                    out.write(f'; bank {bank}\n'.encode())
+                disassemble(data, out, start, end, bank_base(start, end) - start,
+                            codemap=codemap[start:end])
+        else:
+            disassemble(data, out, start=skip_leading_zeros(data), base=args.base)
+    finally:
+        close()
+    out.flush()
 
-    print(f'{i:04x} {hex_values} {asm}')
-    i += opcode_size
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,115 @@
+; vcs.h
+;
+; Atari 2600 (VCS) hardware registers, dasm syntax.
+;
+; TIA_BASE_ADDRESS and TIA_BASE_READ_ADDRESS can be set before including
+; this file to move the TIA registers to one of their mirrors.
+
+VERSION_VCS = 105
+
+        IFNCONST TIA_BASE_ADDRESS
+TIA_BASE_ADDRESS = 0
+        ENDIF
+
+        IFNCONST TIA_BASE_READ_ADDRESS
+TIA_BASE_READ_ADDRESS = TIA_BASE_ADDRESS
+        ENDIF
+
+        IFNCONST TIA_BASE_WRITE_ADDRESS
+TIA_BASE_WRITE_ADDRESS = TIA_BASE_ADDRESS
+        ENDIF
+
+;-------------------------------------------------------------------------------
+; TIA write registers
+
+        SEG.U TIA_REGISTERS_WRITE
+        ORG TIA_BASE_WRITE_ADDRESS
+
+VSYNC   ds 1    ; $00   0000 00x0   vertical sync set-clear
+VBLANK  ds 1    ; $01   xx00 00x0   vertical blank set-clear
+WSYNC   ds 1    ; $02   ---- ----   wait for leading edge of horizontal blank
+RSYNC   ds 1    ; $03   ---- ----   reset horizontal sync counter
+NUSIZ0  ds 1    ; $04   00xx 0xxx   number-size player-missile 0
+NUSIZ1  ds 1    ; $05   00xx 0xxx   number-size player-missile 1
+COLUP0  ds 1    ; $06   xxxx xxx0   color-luminance player 0
+COLUP1  ds 1    ; $07   xxxx xxx0   color-luminance player 1
+COLUPF  ds 1    ; $08   xxxx xxx0   color-luminance playfield
+COLUBK  ds 1    ; $09   xxxx xxx0   color-luminance background
+CTRLPF  ds 1    ; $0A   00xx 0xxx   control playfield, ball size & collisions
+REFP0   ds 1    ; $0B   0000 x000   reflect player 0
+REFP1   ds 1    ; $0C   0000 x000   reflect player 1
+PF0     ds 1    ; $0D   xxxx 0000   playfield register byte 0
+PF1     ds 1    ; $0E   xxxx xxxx   playfield register byte 1
+PF2     ds 1    ; $0F   xxxx xxxx   playfield register byte 2
+RESP0   ds 1    ; $10   ---- ----   reset player 0
+RESP1   ds 1    ; $11   ---- ----   reset player 1
+RESM0   ds 1    ; $12   ---- ----   reset missile 0
+RESM1   ds 1    ; $13   ---- ----   reset missile 1
+RESBL   ds 1    ; $14   ---- ----   reset ball
+AUDC0   ds 1    ; $15   0000 xxxx   audio control 0
+AUDC1   ds 1    ; $16   0000 xxxx   audio control 1
+AUDF0   ds 1    ; $17   000x xxxx   audio frequency 0
+AUDF1   ds 1    ; $18   000x xxxx   audio frequency 1
+AUDV0   ds 1    ; $19   0000 xxxx   audio volume 0
+AUDV1   ds 1    ; $1A   0000 xxxx   audio volume 1
+GRP0    ds 1    ; $1B   xxxx xxxx   graphics player 0
+GRP1    ds 1    ; $1C   xxxx xxxx   graphics player 1
+ENAM0   ds 1    ; $1D   0000 00x0   graphics (enable) missile 0
+ENAM1   ds 1    ; $1E   0000 00x0   graphics (enable) missile 1
+ENABL   ds 1    ; $1F   0000 00x0   graphics (enable) ball
+HMP0    ds 1    ; $20   xxxx 0000   horizontal motion player 0
+HMP1    ds 1    ; $21   xxxx 0000   horizontal motion player 1
+HMM0    ds 1    ; $22   xxxx 0000   horizontal motion missile 0
+HMM1    ds 1    ; $23   xxxx 0000   horizontal motion missile 1
+HMBL    ds 1    ; $24   xxxx 0000   horizontal motion ball
+VDELP0  ds 1    ; $25   0000 000x   vertical delay player 0
+VDELP1  ds 1    ; $26   0000 000x   vertical delay player 1
+VDELBL  ds 1    ; $27   0000 000x   vertical delay ball
+RESMP0  ds 1    ; $28   0000 00x0   reset missile 0 to player 0
+RESMP1  ds 1    ; $29   0000 00x0   reset missile 1 to player 1
+HMOVE   ds 1    ; $2A   ---- ----   apply horizontal motion
+HMCLR   ds 1    ; $2B   ---- ----   clear horizontal motion registers
+CXCLR   ds 1    ; $2C   ---- ----   clear collision latches
+
+;-------------------------------------------------------------------------------
+; TIA read registers
+
+        SEG.U TIA_REGISTERS_READ
+        ORG TIA_BASE_READ_ADDRESS
+
+CXM0P   ds 1    ; $00   xx00 0000   read collision M0-P1 M0-P0
+CXM1P   ds 1    ; $01   xx00 0000   read collision M1-P0 M1-P1
+CXP0FB  ds 1    ; $02   xx00 0000   read collision P0-PF P0-BL
+CXP1FB  ds 1    ; $03   xx00 0000   read collision P1-PF P1-BL
+CXM0FB  ds 1    ; $04   xx00 0000   read collision M0-PF M0-BL
+CXM1FB  ds 1    ; $05   xx00 0000   read collision M1-PF M1-BL
+CXBLPF  ds 1    ; $06   x000 0000   read collision BL-PF
+CXPPMM  ds 1    ; $07   xx00 0000   read collision P0-P1 M0-M1
+INPT0   ds 1    ; $08   x000 0000   read pot port
+INPT1   ds 1    ; $09   x000 0000   read pot port
+INPT2   ds 1    ; $0A   x000 0000   read pot port
+INPT3   ds 1    ; $0B   x000 0000   read pot port
+INPT4   ds 1    ; $0C   x000 0000   read input
+INPT5   ds 1    ; $0D   x000 0000   read input
+
+;-------------------------------------------------------------------------------
+; RIOT (6532) I/O and timer
+
+        SEG.U RIOT
+        ORG $280
+
+SWCHA   ds 1    ; $280  port A data register for joysticks
+SWACNT  ds 1    ; $281  port A data direction register
+SWCHB   ds 1    ; $282  port B data (console switches)
+SWBCNT  ds 1    ; $283  port B data direction register
+INTIM   ds 1    ; $284  timer output
+TIMINT  ds 1    ; $285  timer interrupt flag
+
+        ds 14   ; $286-$293 not used
+
+TIM1T   ds 1    ; $294  set 1 clock interval
+TIM8T   ds 1    ; $295  set 8 clock interval
+TIM64T  ds 1    ; $296  set 64 clock interval
+T1024T  ds 1    ; $297  set 1024 clock interval
+
+        SEG
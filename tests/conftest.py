@@ -0,0 +1,10 @@
+"""
+The assembler modules import each other by bare name, as the scripts in
+assembler/ do, so that directory goes on sys.path for the tests.
+"""
+from pathlib import Path
+
+import sys
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT / 'assembler'))
@@ -0,0 +1,76 @@
+from asm import Assembler
+from asmd import Daemon, format_listing
+from listing import listing_lines
+
+MACROS = '''\
+WSYNC = $02
+    MAC sleep
+    REPT {1}
+    nop
+    REPEND
+    ENDM
+start:
+    sleep 3
+    sta WSYNC
+    lda #1
+    lda #1
+    jmp start
+'''
+
+
+def build(daemon, path, **request):
+    return daemon.handle({'cmd': 'build', 'path': str(path), **request})
+
+
+def test_macro_source_builds_in_full(tmp_path):
+    path = tmp_path / 'macros.asm'
+    path.write_text(MACROS)
+    daemon = Daemon()
+    result = build(daemon, path, listing=True)
+    assert result['ok'], result
+    expected = Assembler().assemble(MACROS)
+    assert (tmp_path / 'macros.bin').read_bytes() == expected
+    assert result['changed'] == [(0, len(expected))]
+    listing = result['listing'].splitlines()
+    assert listing[7:10] == [
+        '    8  0000  EA            2       2                    sleep 3',
+        '       0001  EA            2       4  ',
+        '       0002  EA            2       6  ',
+    ]
+
+    # an edit that drops the macros goes back to the incremental path
+    path.write_text('start:\n    nop\n    jmp start\n')
+    result = build(daemon, path)
+    assert result['ok'], result
+    assert (tmp_path / 'macros.bin').read_bytes() == bytes.fromhex('ea4c0000')
+
+
+def test_optimise(tmp_path):
+    path = tmp_path / 'opt.asm'
+    path.write_text(MACROS)
+    daemon = Daemon()
+    assert build(daemon, path, optimise=True)['ok']
+    assert (tmp_path / 'opt.bin').read_bytes() == Assembler(optimise=True).assemble(MACROS)
+    project = daemon.project(path, optimise=True)
+    assert format_listing(project).startswith('    1')
+
+
+def test_broken_macro_reports_the_error(tmp_path):
+    path = tmp_path / 'broken.asm'
+    path.write_text('    MAC sleep\n    nop\n')
+    result = build(Daemon(), path)
+    assert not result['ok']
+    assert 'no ENDM before the end of the file' in result['errors'][0]
+
+
+def test_incremental_listing_matches_the_command_line(tmp_path):
+    source = MACROS.replace('    sleep 3\n', '    nop\n    nop\n    nop\n')
+    path = tmp_path / 'plain.asm'
+    path.write_text(source)
+    result = build(Daemon(), path, listing=True)
+    assembler = Assembler()
+    image = assembler.assemble(source)
+    symbols = {name: value for name, value in assembler.symbols.items()}
+    expected = ''.join(listing_lines(source.splitlines(), assembler.records, image, symbols,
+                                     timing=assembler.timing_report()))
+    assert result['listing'] == expected
@@ -0,0 +1,84 @@
+from frontends import load_asm02
+
+import pytest
+
+VECTORS = '''\
+    org $fffc
+    .word {0}
+    .word {0}
+'''
+
+SOURCE = '''\
+    processor 6502
+bank 0
+    org $f000
+start:
+    jsr far
+    jmp away
+''' + VECTORS.format('start') + '''\
+bank 1
+    org $f000
+far:
+    lda #1
+    rts
+away:
+    jmp start
+''' + VECTORS.format('far')
+
+
+def assemble(source):
+    return bytes(load_asm02().assemble_banks(source, jobs=1))
+
+
+def bank(image, number):
+    return image[number * 0x1000:(number + 1) * 0x1000]
+
+
+def test_f8_trampolines():
+    image = assemble(SOURCE)
+    assert len(image) == 0x2000
+    # packed in below the hotspots at $FFF8, in the order first met
+    jsr_far = bytes.fromhex('8df91f' '2000f0' '8df81f' '60')   # sta $1ff9 / jsr far / sta $1ff8 / rts
+    jmp_away = bytes.fromhex('8df91f' '4c03f0')                 # sta $1ff9 / jmp away
+    jmp_start = bytes.fromhex('8df81f' '4c00f0')                # sta $1ff8 / jmp start
+    stubs = jsr_far + jmp_away + jmp_start
+    start = 0x1000 - 8 - len(stubs)
+    for number in (0, 1):
+        assert bank(image, number)[start:0xFF8] == stubs
+    address = 0xF000 + start
+    assert bank(image, 0)[:6] == bytes((0x20, address & 0xFF, address >> 8,
+                                        0x4C, (address + 10) & 0xFF, (address + 10) >> 8))
+    assert bank(image, 1)[3:6] == bytes((0x4C, (address + 16) & 0xFF, (address + 16) >> 8))
+    assert bank(image, 0)[0xFFC:] == bytes.fromhex('00f000f0')
+    assert bank(image, 1)[0xFFC:] == bytes.fromhex('00f000f0')
+
+
+def test_bank_without_vectors_starts_through_bank_0():
+    source = SOURCE.rsplit('    org $fffc', 1)[0]
+    image = assemble(source)
+    reset_stub = bytes.fromhex('8df81f' '6cfcff')   # sta $1ff8 / jmp ($fffc)
+    assert bank(image, 1)[0xFF8 - len(reset_stub):0xFF8] == reset_stub
+    assert bank(image, 0)[0xFFC:] == bytes.fromhex('00f000f0')
+    assert bank(image, 1)[0xFFC:] == bytes.fromhex('f2fff2ff')
+
+
+def test_missing_banks_start_through_bank_0():
+    image = assemble(SOURCE.replace('bank 1', 'bank 3'))
+    assert len(image) == 0x4000
+    assert bank(image, 3)[0xFFC:] == bytes.fromhex('00f000f0')
+    for number in (1, 2):
+        vector = bank(image, number)[0xFFC:0xFFE]
+        offset = int.from_bytes(vector, 'little') - 0xF000
+        assert bank(image, number)[offset:offset + 6] == bytes.fromhex('8df61f' '6cfcff')
+
+
+def test_bank_0_needs_a_reset_vector():
+    source = SOURCE.replace(VECTORS.format('start'), '')
+    source = source.rsplit('    org $fffc', 1)[0]
+    with pytest.raises(ValueError, match='bank 0 must set the reset vector'):
+        assemble(source)
+
+
+def test_no_branches_between_banks():
+    with pytest.raises(ValueError, match='branch to far in bank 1 from bank 0'):
+        assemble(SOURCE.replace('jsr far', 'beq far'))
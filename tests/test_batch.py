@@ -0,0 +1,48 @@
+from batch import parse_defines, preload_headers, run
+
+import os
+import pickle
+
+import pytest
+
+SOURCE = '''\
+    processor 6502
+    include "game.h"
+    org $f000
+    lda #speed
+'''
+
+
+def write(path, text, mtime_ns):
+    path.write_text(text)
+    os.utime(path, ns=(mtime_ns, mtime_ns))
+
+
+@pytest.fixture
+def game(tmp_path):
+    write(tmp_path / 'game.h', '    include "vcs.h"\nSPEED = VSYNC + 1\n', 10**9)
+    write(tmp_path / 'vcs.h', 'VSYNC = $00\n', 10**9)
+    (tmp_path / 'game.asm').write_text(SOURCE)
+    return tmp_path
+
+
+def test_preloaded_cache_keeps_nested_headers(game):
+    cache = pickle.loads(pickle.dumps(preload_headers([str(game / 'game.h')], None)))
+    assert [path.name for path in cache.files(str(game / 'game.h'))] == ['game.h', 'vcs.h']
+
+
+def test_workers_see_nested_header_edits(game):
+    cache = preload_headers([str(game / 'game.h')], None)
+    path = str(game / 'game.asm')
+    assert run([path], '02', {}, 1, cache)[0][1] is None
+    assert (game / 'game.bin').read_bytes()[:2] == bytes.fromhex('a901')
+
+    write(game / 'vcs.h', 'VSYNC = $10\n', 2 * 10**9)
+    assert run([path], '02', {}, 1, cache)[0][1] is None
+    assert (game / 'game.bin').read_bytes()[:2] == bytes.fromhex('a911')
+
+
+def test_parse_defines():
+    assert parse_defines(['A=$10', 'B=0x20', 'C']) == {'A': 0x10, 'B': 0x20, 'C': 1}
+    with pytest.raises(ValueError, match="'zz' is not a number"):
+        parse_defines(['X=zz'])
@@ -0,0 +1,78 @@
+from cart import Image, window_address
+from frontends import load_asm02
+
+import pytest
+
+
+def test_mirrors_land_in_the_window():
+    image = Image()
+    image.emit(0x1000, b'\xa9\x01')
+    image.emit(0xFFFC, b'\x00\xf0')
+    rom = image.rom()
+    assert len(rom) == 0x1000
+    assert rom[:2] == b'\xa9\x01'
+    assert rom[0xFFC:0xFFE] == b'\x00\xf0'
+    assert window_address(0x1234) == 0xF234
+
+
+def test_emit_carries_on_a_segment():
+    image = Image()
+    image.emit(0xF000, b'\x01\x02')
+    image.emit(0xF800, b'\x03')
+    # back to where the first one ends
+    image.emit(0xF002, b'\x04')
+    assert [(segment.start, bytes(segment.data)) for segment in image.segments] == [
+        (0xF000, b'\x01\x02\x04'), (0xF800, b'\x03')]
+
+
+def test_patch_and_read():
+    image = Image()
+    image.emit(0xF000, b'\x4c\x00\x00')
+    image.patch(0xF001, b'\x34\x12')
+    assert image.read(0xF000, 3) == b'\x4c\x34\x12'
+    assert image.read(0xF002, 2) == b''
+    with pytest.raises(ValueError, match=r'\$F002 is outside everything emitted'):
+        image.patch(0xF002, b'\x00\x00')
+
+
+def test_2k_rom():
+    image = Image()
+    image.emit(0xF800, b'\xea')
+    assert image.rom(0x800) == b'\xea' + bytes(0x7FF)
+
+
+@pytest.mark.parametrize('segments, message', [
+    ([(0x0080, b'\x00')], r'segment at \$0080 is outside cartridge space'),
+    ([(0xFFFE, b'\x00\x00\x00')], r'segment at \$FFFE runs \$1 bytes past the end of the 4K cartridge'),
+    ([(0xF000, b'\x00' * 4), (0x1002, b'\x00')],
+     r'segments at \$F000 and \$1002 overlap at ROM offset \$002'),
+    ([(0xF010, b'\x00'), (0xF000, b'\x00' * 0x11)],
+     r'segments at \$F000 and \$F010 overlap at ROM offset \$010'),
+])
+def test_rom_errors(segments, message):
+    image = Image()
+    for address, data in segments:
+        image.emit(address, data)
+    with pytest.raises(ValueError, match=message):
+        image.rom()
+
+
+def test_touching_segments_are_not_an_overlap():
+    image = Image()
+    image.emit(0xF004, b'\x02')
+    image.emit(0x1000, b'\x01' * 4)
+    assert image.rom()[:5] == b'\x01\x01\x01\x01\x02'
+
+
+def test_assembler_reports_overlapping_orgs():
+    source = '''\
+    processor 6502
+    org $f000
+    nop
+    nop
+    org $1001
+    nop
+'''
+    session = load_asm02().Session()
+    with pytest.raises(ValueError, match=r'segments at \$F000 and \$1001 overlap'):
+        session.assemble(source)
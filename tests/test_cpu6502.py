@@ -0,0 +1,92 @@
+from asm import Assembler
+from cpu6502 import CPU, CYCLES_PER_LINE
+
+import pytest
+
+N, V, D, Z, C = 0x80, 0x40, 0x08, 0x02, 0x01
+
+
+def load(source):
+    """A CPU with source, assembled at $F000, in its cartridge slot."""
+    code = Assembler(predefined={}).assemble(source)
+    cpu = CPU()
+    cpu.load_rom(code)
+    cpu.pc = 0xF000
+    return cpu, len(code)
+
+
+def run(source):
+    """A CPU that has run source to its end."""
+    cpu, size = load(source)
+    while cpu.pc < 0xF000 + size:
+        cpu.step()
+    return cpu
+
+
+def step_cycles(cpu):
+    before = cpu.cycles
+    cpu.step()
+    return cpu.cycles - before
+
+
+@pytest.mark.parametrize('source, a, set_flags, clear_flags', [
+    ('lda #0', 0x00, Z, N),
+    ('lda #$80', 0x80, N, Z),
+    ('lda #$50\n    clc\n    adc #$50', 0xA0, N | V, C | Z),
+    ('lda #$ff\n    clc\n    adc #1', 0x00, Z | C, N | V),
+    ('lda #$80\n    sec\n    sbc #1', 0x7F, C | V, N | Z),
+    ('lda #5\n    cmp #6', 0x05, N, Z | C),
+    ('lda #6\n    cmp #6', 0x06, Z | C, N),
+])
+def test_flags(source, a, set_flags, clear_flags):
+    cpu = run('    ' + source + '\n')
+    assert cpu.a == a
+    assert cpu.status() & set_flags == set_flags
+    assert not cpu.status() & clear_flags
+
+
+@pytest.mark.parametrize('source, a, carry', [
+    ('clc\n    lda #$09\n    adc #$01', 0x10, 0),
+    ('clc\n    lda #$58\n    adc #$46', 0x04, 1),
+    ('sec\n    lda #$99\n    adc #$00', 0x00, 1),
+    ('sec\n    lda #$10\n    sbc #$01', 0x09, 1),
+    ('sec\n    lda #$00\n    sbc #$01', 0x99, 0),
+])
+def test_decimal_mode(source, a, carry):
+    cpu = run('    sed\n    ' + source + '\n')
+    assert cpu.status() & D
+    assert (cpu.a, cpu.status() & C) == (a, carry)
+
+
+def test_branch_cycles():
+    # ldx at $F000 and nops up to the first branch at $F0FC
+    cpu, _ = load('    ldx #1\n    REPT 250\n    nop\n    REPEND\n'
+                  '    bne far\n    nop\n    nop\n    nop\n'
+                  'far:\n    beq far\n    bne near\n    nop\nnear:\n')
+    cpu.run(instructions=251)
+    assert cpu.pc == 0xF0FC
+    assert step_cycles(cpu) == 4            # taken from $F0FE to $F101, across a page
+    assert cpu.pc == 0xF101
+    assert step_cycles(cpu) == 2            # not taken
+    assert step_cycles(cpu) == 3            # taken within the page
+    assert cpu.pc == 0xF106
+
+
+@pytest.mark.parametrize('x, cycles', [(0, 4), (1, 5)])
+def test_page_cross_cycles(x, cycles):
+    cpu, _ = load(f'    ldx #{x}\n    lda $f0ff,x\n')
+    cpu.step()
+    assert step_cycles(cpu) == cycles
+
+
+def test_wsync_waits_for_the_next_line():
+    cpu = run('    nop\n    nop\n    sta $02\n    nop\n')
+    # 2 + 2 + 3, then the stall to 76, then 2
+    assert cpu.cycles == CYCLES_PER_LINE + 2
+
+
+def test_ram_and_stack_mirrors():
+    cpu = run('    lda #$42\n    sta $80\n    pha\n    ldx $180\n    tsx\n')
+    assert cpu.read(0x80) == 0x42
+    assert cpu.x == 0xFC
+    assert cpu.read(0x1FD) == 0x42
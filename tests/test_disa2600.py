@@ -0,0 +1,140 @@
+import json
+
+from fuzz import load_disa
+
+import pytest
+
+disa = load_disa()
+
+
+def rom(size=0x1000, reset=0xF000, irq=0xF020):
+    """A 4K window of code, data and the vectors, as offsets into it."""
+    data = bytearray(size)
+    data[0x00:0x0C] = bytes.fromhex(
+        'a901'      # 00 lda #1
+        'd004'      # 02 bne $f008
+        '4c10f0'    # 04 jmp $f010
+        'ff'        # 07 data, skipped by the branch
+        '2020f0'    # 08 jsr $f020
+        '60')       # 0b rts
+    data[0x0C:0x10] = b'\x12' * 4
+    data[0x10:0x14] = bytes.fromhex('ea4c00f0')     # nop, jmp $f000
+    data[0x20] = 0x60
+    data[size - 4:] = bytes((reset & 0xFF, reset >> 8, irq & 0xFF, irq >> 8))
+    return data
+
+
+CODE = [0x00, 0x02, 0x04, 0x08, 0x0B, 0x10, 0x11, 0x20]
+OPERANDS = [0x01, 0x03, 0x05, 0x06, 0x09, 0x0A, 0x12, 0x13]
+
+
+def flagged(codemap, flag):
+    return [i for i, value in enumerate(codemap) if value == flag]
+
+
+def test_trace_follows_branches_calls_and_jumps():
+    codemap = disa.trace(rom())
+    assert flagged(codemap, disa.CODE) == CODE
+    assert flagged(codemap, disa.OPERAND) == OPERANDS
+
+
+def test_trace_stops_outside_cartridge_space():
+    # a reset vector into RAM finds nothing, the irq vector still does
+    codemap = disa.trace(rom(reset=0x0080))
+    assert flagged(codemap, disa.CODE) == [0x20]
+
+
+def test_decode_traced():
+    data = rom()
+    lines = list(disa.decode_traced(data, disa.trace(data), end=0x21, base=0xF000))
+    assert [text for _, _, text in lines] == [
+        'lda #$01', 'bne $f008', 'jmp $f010', '.byte $ff', 'jsr $f020', 'rts',
+        '.byte $12,$12,$12,$12', 'nop', 'jmp $f000',
+        '.byte $00,$00,$00,$00,$00,$00,$00,$00', '.byte $00,$00,$00,$00', 'rts']
+    assert [offset for offset, _, _ in lines][-3:] == [0x14, 0x1C, 0x20]
+
+
+def test_codemap_is_cached_next_to_the_rom(tmp_path, monkeypatch):
+    path = tmp_path / 'game.bin'
+    data = bytes(rom())
+    path.write_bytes(data)
+    codemap = disa.load_codemap(path, data)
+    assert flagged(codemap, disa.CODE) == CODE
+    assert (tmp_path / 'game.bin.map').stat().st_size == 20 + len(data)
+
+    def retrace(*args):
+        raise AssertionError('traced again')
+    monkeypatch.setattr(disa, 'trace', retrace)
+    assert disa.load_codemap(path, data) == codemap
+
+    # a changed image is traced again
+    with pytest.raises(AssertionError, match='traced again'):
+        disa.load_codemap(path, data[:-1] + b'\x00')
+
+
+def test_banks_are_traced_separately(tmp_path):
+    # bank 1 starts at $F010 rather than $F000
+    data = bytes(rom()) + bytes(rom(reset=0xF010, irq=0xF010))
+    path = tmp_path / 'banked.bin'
+    codemap = disa.load_codemap(path, data)
+    assert flagged(codemap[:0x1000], disa.CODE) == CODE
+    assert flagged(codemap[0x1000:], disa.CODE) == CODE
+
+
+def f8_rom():
+    """Two banks, each switching to the other through its hotspot."""
+    data = bytearray()
+    for hotspot in (0x1FF9, 0x1FF8):
+        bank = rom()
+        bank[0x14:0x17] = bytes((0x8D, hotspot & 0xFF, hotspot >> 8))
+        data += bank
+    return bytes(data)
+
+
+def test_corpus_jsonl(tmp_path):
+    roms = tmp_path / 'roms'
+    (roms / 'sub').mkdir(parents=True)
+    (roms / 'plain.bin').write_bytes(bytes(rom()))
+    (roms / 'sub' / 'banked.A26').write_bytes(f8_rom())
+    (roms / 'notes.txt').write_text('not a rom')
+    out = tmp_path / 'corpus.jsonl'
+
+    count, instructions = disa.disassemble_corpus(roms, out, jobs=1)
+    records = [json.loads(line) for line in out.read_text().splitlines()]
+    assert count == 2
+    assert instructions == len(records)
+    assert {record['rom'] for record in records} == {'plain.bin', 'sub/banked.A26'}
+
+    plain = [record for record in records if record['rom'] == 'plain.bin']
+    assert plain[0] == {'rom': 'plain.bin', 'scheme': '4K', 'bank': 0, 'offset': 0,
+                        'address': 0xF000, 'bytes': 'a901', 'mnemonic': 'lda',
+                        'operand': '#$01', 'mode': 'immediate'}
+    assert plain[1]['operand'] == '$f008' and plain[1]['mode'] == 'relative'
+
+    banked = [record for record in records if record['rom'] == 'sub/banked.A26']
+    assert {record['scheme'] for record in banked} == {'F8'}
+    second = [record for record in banked if record['bank'] == 1]
+    assert second[0]['offset'] == 0x1000 and second[0]['address'] == 0xF000
+    # the linear sweep runs into the table, where $12 decodes to nothing
+    by_offset = {record['offset']: record for record in banked}
+    assert by_offset[0x0C]['bytes'] == '12' and by_offset[0x0C]['mode'] == 'data'
+    assert by_offset[0x14]['mnemonic'] == 'sta' and by_offset[0x14]['operand'] == '$1ff9'
+
+
+def test_corpus_binary(tmp_path):
+    roms = tmp_path / 'roms'
+    roms.mkdir()
+    (roms / 'a.bin').write_bytes(bytes(rom()))
+    (roms / 'b.bin').write_bytes(f8_rom())
+    out = tmp_path / 'corpus.bin'
+
+    count, instructions = disa.disassemble_corpus(roms, out, fmt='bin', jobs=1)
+    blob = out.read_bytes()
+    assert count == 2
+    assert len(blob) == instructions * disa.RECORD.size
+    records = list(disa.RECORD.iter_unpack(blob))
+    assert records[0] == (0, 0, 0xF000, 2, b'\xa9\x01\x00')
+    assert records[-1][:2] == (1, 1)
+    index = [json.loads(line) for line in (tmp_path / 'corpus.bin.roms').read_text().splitlines()]
+    assert index == [{'id': 0, 'rom': 'a.bin', 'scheme': '4K', 'hotspot_hits': 0},
+                     {'id': 1, 'rom': 'b.bin', 'scheme': 'F8', 'hotspot_hits': 2}]
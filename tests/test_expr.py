@@ -0,0 +1,38 @@
+from expr import COMPILED_CACHE_SIZE, Expression, _compile, compile_expression, value_of
+
+import pytest
+
+
+@pytest.mark.parametrize('text, value', [
+    ('$ff', 255),
+    ('%0101 << 4', 80),
+    ('[1 + 2] * 3', 9),
+    ('-1 & $ff', 255),
+    ('>$1234', 0x12),
+    ('<$1234', 0x34),
+    ('~0 & $0f', 15),
+])
+def test_constants_fold(text, value):
+    assert compile_expression(text) == value
+
+
+def test_names():
+    assert compile_expression(' table ') == 'table'
+    assert compile_expression('Table', fold_case=True) == 'table'
+    expression = compile_expression('<table+1')
+    assert isinstance(expression, Expression)
+    assert expression.names == ('table',)
+    assert value_of(expression, {'table': 0xF0FF}) == 0x00
+    assert value_of(expression, {}) is None
+
+
+@pytest.mark.parametrize('text', ['1 +', '[1', '1 ]', '"a"', '1 ; no', '#1'])
+def test_malformed(text):
+    with pytest.raises(ValueError):
+        compile_expression(text)
+
+
+def test_cache_is_bounded():
+    for n in range(COMPILED_CACHE_SIZE + 10):
+        compile_expression(f'label{n} + 1')
+    assert _compile.cache_info().currsize == COMPILED_CACHE_SIZE
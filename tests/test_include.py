@@ -0,0 +1,58 @@
+from include import IncludeCache
+
+import os
+
+import pytest
+
+
+def write(path, text, mtime_ns):
+    path.write_text(text)
+    os.utime(path, ns=(mtime_ns, mtime_ns))
+
+
+def test_header_is_parsed_once(tmp_path):
+    write(tmp_path / 'vcs.h', 'VSYNC = $00\nWSYNC equ $02\n', 10**9)
+    cache = IncludeCache()
+    assert cache.load('vcs.h', [tmp_path]) == {'vsync': 0, 'wsync': 2}
+    cache.load('vcs.h', [tmp_path])
+    assert cache.parses == 1
+
+
+def test_touched_header_is_not_parsed_again(tmp_path):
+    write(tmp_path / 'vcs.h', 'VSYNC = $00\n', 10**9)
+    cache = IncludeCache()
+    cache.load('vcs.h', [tmp_path])
+    os.utime(tmp_path / 'vcs.h', ns=(2 * 10**9, 2 * 10**9))
+    cache.load('vcs.h', [tmp_path])
+    assert cache.parses == 1
+
+
+def test_nested_header_change_is_seen(tmp_path):
+    write(tmp_path / 'game.h', '    include "vcs.h"\nSPEED = VSYNC + 1\n', 10**9)
+    write(tmp_path / 'vcs.h', 'VSYNC = $00\n', 10**9)
+    cache = IncludeCache()
+    assert cache.load('game.h', [tmp_path])['speed'] == 1
+    assert [path.name for path in cache.files('game.h', [tmp_path])] == ['game.h', 'vcs.h']
+    write(tmp_path / 'vcs.h', 'VSYNC = $10\n', 2 * 10**9)
+    assert cache.load('game.h', [tmp_path])['speed'] == 0x11
+
+
+def test_disk_cache_is_shared(tmp_path):
+    write(tmp_path / 'vcs.h', 'VSYNC = $00\n', 10**9)
+    IncludeCache(tmp_path / 'cache').load('vcs.h', [tmp_path])
+    other = IncludeCache(tmp_path / 'cache')
+    assert other.load('vcs.h', [tmp_path]) == {'vsync': 0}
+    assert other.parses == 0
+
+
+def test_header_expressions_use_the_operand_grammar(tmp_path):
+    write(tmp_path / 'defs.h', 'BASE = $10\nHIGH = >[BASE << 8] + 1\nMASK equ ~base & $ff\n', 10**9)
+    symbols = IncludeCache().load('defs.h', [tmp_path])
+    # < and > apply to the whole expression, as in dasm
+    assert symbols == {'base': 0x10, 'high': 0x10, 'mask': 0xEF}
+
+
+def test_undefined_header_symbol(tmp_path):
+    write(tmp_path / 'bad.h', 'A = B + 1\n', 10**9)
+    with pytest.raises(ValueError, match="undefined symbol 'b' in header"):
+        IncludeCache().load('bad.h', [tmp_path])
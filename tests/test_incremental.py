@@ -0,0 +1,78 @@
+from asm import Assembler
+from incremental import IncrementalAssembler
+
+import pytest
+
+SOURCE = '''\
+ptr = $80
+start:
+    lda #$10
+    sta ptr
+loop:
+    ldx table,y
+    lda later
+    dex
+    bne loop
+    jmp start
+table:
+    brk
+later = $90
+'''
+
+EDITS = [
+    # a line inserted before everything else moves every label
+    ('start:\n', 'start:\n    nop\n'),
+    # an equate changes, so does every line that uses it
+    ('ptr = $80', 'ptr = $1234'),
+    # a forward reference no longer fits in zero page
+    ('later = $90', 'later = $0300'),
+    # a branch grows further from its target
+    ('    dex\n', '    dex\n    nop\n    nop\n'),
+    # lines go away again
+    ('    jmp start\n', ''),
+]
+
+
+def full_build(source):
+    return bytes(Assembler().assemble(source))
+
+
+def test_first_update_matches_full_build():
+    image, changed = IncrementalAssembler().update(SOURCE)
+    assert image == full_build(SOURCE)
+    assert changed == [(0, len(image))]
+
+
+def test_updates_match_full_builds():
+    inc = IncrementalAssembler()
+    old, _ = inc.update(SOURCE)
+    source = SOURCE
+    for before, after in EDITS:
+        source = source.replace(before, after)
+        image, changed = inc.update(source)
+        assert image == full_build(source)
+        # the changed ranges cover every byte that differs
+        covered = {index for start, end in changed for index in range(start, end)}
+        for index in range(max(len(old), len(image))):
+            if old[index:index + 1] != image[index:index + 1]:
+                assert index in covered
+        old = image
+
+
+def test_unchanged_source_changes_nothing():
+    inc = IncrementalAssembler()
+    inc.update(SOURCE)
+    assert inc.update(SOURCE)[1] == []
+
+
+def test_failed_update_starts_again():
+    inc = IncrementalAssembler()
+    inc.update(SOURCE)
+    with pytest.raises(ValueError):
+        inc.update(SOURCE.replace('lda later', 'lda nowhere'))
+    assert inc.update(SOURCE)[0] == full_build(SOURCE)
+
+
+def test_macros_are_refused():
+    with pytest.raises(ValueError, match="doesn't expand MAC or REPT"):
+        IncrementalAssembler().update('    REPT 2\n    nop\n    REPEND\n')
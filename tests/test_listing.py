@@ -0,0 +1,114 @@
+import io
+
+from asm import Assembler
+from listing import hex_dump_lines, listing_lines, nonzero_lines, write_chunks, write_listing
+
+import pytest
+
+SOURCE = '''\
+COLUBK = $09
+; set the background
+start:
+    lda #$84
+    sta COLUBK
+    jmp start
+'''
+
+
+def naive_hex_dump(data, width=16):
+    """The per-byte dump listing.py replaced, for comparison."""
+    lines = []
+    skipped = False
+    for offset in range(0, len(data), width):
+        chunk = data[offset:offset + width]
+        if all(b == 0 for b in chunk):
+            if not skipped:
+                lines.append('*\n')
+            skipped = True
+            continue
+        skipped = False
+        hex_values = ' '.join(f'{b:02x}' for b in chunk)
+        ascii_values = ''.join(chr(b) if 32 <= b <= 126 else '.' for b in chunk)
+        lines.append(f'{offset:08x}  {hex_values:<{width * 3 - 1}}  |{ascii_values}|\n')
+    return lines
+
+
+def test_listing():
+    assembler = Assembler()
+    image = assembler.assemble(SOURCE)
+    symbols = {'start': assembler.symbols['start']}
+    listing = list(listing_lines(SOURCE.splitlines(), assembler.records, image, symbols))
+    assert listing == [
+        '    1  0009            COLUBK        COLUBK = $09\n',
+        '    2                                ; set the background\n',
+        '    3  0000            start         start:\n',
+        '    4  0000  A9 84                       lda #$84\n',
+        '    5  0002  85 09                       sta COLUBK\n',
+        '    6  0004  4C 00 00                    jmp start\n',
+        '\nSymbols:\n',
+        '  start                    $0000\n',
+    ]
+
+
+def test_long_data_continues_on_following_lines():
+    image = bytes(range(1, 8))
+    listing = list(listing_lines(['table: .byte 1,2,3,4,5,6,7'], [(1, 0xF000, 7, 'table')],
+                                 image, base=0xF000))
+    assert listing == [
+        '    1  F000  01 02 03  table         table: .byte 1,2,3,4,5,6,7\n',
+        '       F003  04 05 06\n',
+        '       F006  07      \n',
+    ]
+
+
+@pytest.mark.parametrize('data', [
+    bytes(64),
+    b'A' + bytes(63),
+    bytes(63) + b'z',
+    bytes(16) + b'hello, world\x01\x02' + bytes(40) + b'\xff',
+    bytes(range(256)) * 2,
+    b'short',
+])
+def test_hex_dump_matches_the_per_byte_dump(data):
+    assert list(hex_dump_lines(data)) == naive_hex_dump(data)
+
+
+def test_hex_dump_without_skipping():
+    lines = list(hex_dump_lines(bytes(40), skip_zeros=False))
+    assert len(lines) == 3
+    assert lines[2] == '00000020  ' + ' '.join(['00'] * 8) + ' ' * 24 + '  |........|\n'
+
+
+def test_nonzero_lines():
+    data = bytearray(100)
+    data[5] = data[17] = data[31] = data[32] = data[99] = 1
+    assert nonzero_lines(bytes(data)) == [0, 1, 2, 6]
+    # a run spanning several lines
+    assert nonzero_lines(b'\x00' * 10 + b'\x01' * 40) == [0, 1, 2, 3]
+
+
+class CountingStream(io.BytesIO):
+
+    def __init__(self):
+        super().__init__()
+        self.writes = 0
+
+    def write(self, data):
+        self.writes += 1
+        return super().write(data)
+
+
+def test_write_chunks():
+    out = CountingStream()
+    write_chunks(out, (f'{n}\n' for n in range(10000)), chunk_lines=4096)
+    assert out.writes == 3
+    assert out.getvalue().decode().splitlines() == [str(n) for n in range(10000)]
+
+
+def test_write_listing():
+    assembler = Assembler()
+    image = assembler.assemble(SOURCE)
+    out = io.BytesIO()
+    write_listing(out, SOURCE.splitlines(), assembler.records, image)
+    assert out.getvalue().decode() == ''.join(
+        listing_lines(SOURCE.splitlines(), assembler.records, image))
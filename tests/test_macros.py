@@ -0,0 +1,92 @@
+from asm import Assembler
+from frontends import load_asm02
+from macros import Macros, uses_expansion
+
+import pytest
+
+SLEEP = '''\
+    MAC sleep
+    REPT {1}
+    nop
+    REPEND
+    ENDM
+'''
+
+
+class CountingParse:
+    """A parse function that keeps the text, counting its calls."""
+
+    def __init__(self):
+        self.calls = 0
+
+    def __call__(self, text):
+        self.calls += 1
+        return text.strip()
+
+
+def expand(source):
+    parse = CountingParse()
+    lines = list(Macros(parse).expand(enumerate(source.splitlines(), 1)))
+    return lines, parse.calls
+
+
+def test_macro_arguments():
+    source = '''\
+    MACRO store
+    lda #{1}
+    sta {2}
+    ENDM
+    store 1, $80
+    store 2,$81
+'''
+    lines, _ = expand(source)
+    assert lines == [(5, 'lda #1'), (5, 'sta $80'), (6, 'lda #2'), (6, 'sta $81')]
+
+
+def test_nested_rept_in_a_macro():
+    lines, _ = expand(SLEEP + '    sleep 3\n    REPEAT $2\n    sleep 2\n    REPEND\n')
+    assert lines == [(6, 'nop')] * 3 + [(7, 'nop')] * 4
+
+
+def test_expansions_are_parsed_once():
+    lines, calls = expand(SLEEP + '    sleep 100\n    sleep 100\n    REPT 500\n    dex\n    REPEND\n')
+    assert len(lines) == 700
+    # one nop for the cached sleep 100, one dex for the REPT body
+    assert calls == 2
+
+
+@pytest.mark.parametrize('source, message', [
+    ('    REPT 2\nloop:\n    nop\n    REPEND\n', 'line 1: label loop in a REPT body would be defined 2 times'),
+    ('    MAC wait\nwait_loop: dex\n    ENDM\n    wait\n    wait\n',
+     'line 5: macro wait defines label wait_loop, so it can only be called once'),
+    ('    REPT 3\n    nop\n', 'line 1: no REPEND before the end of the file'),
+    ('    MAC\n', 'line 1: MAC needs a name'),
+    ('    nop\n    ENDM\n', 'line 2: ENDM without a matching start'),
+    ('    REPT lots\n    nop\n    REPEND\n', "line 1: REPT needs a number, not 'lots'"),
+])
+def test_errors(source, message):
+    with pytest.raises(ValueError, match=message):
+        expand(source)
+
+
+def test_labels_defined_once_are_allowed():
+    lines, _ = expand('    REPT 1\nonce:\n    nop\n    REPEND\n'
+                      '    MAC wait\nwait_loop: dex\n    ENDM\n    wait\n')
+    assert [text for _, text in lines] == ['once:', 'nop', 'wait_loop: dex']
+
+
+def test_uses_expansion():
+    assert uses_expansion(['    nop', '  rept 4 ; unrolled'])
+    assert uses_expansion(['  mac sleep'])
+    assert not uses_expansion(['    nop', '; rept 4', 'repeat_count = 3'])
+
+
+def test_assembler_expands_blocks():
+    source = SLEEP + 'start:\n    sleep 3\n    REPT 2\n    inx\n    REPEND\n    jmp start\n'
+    assert Assembler().assemble(source) == b'\xea\xea\xea\xe8\xe8\x4c\x00\x00'
+
+
+def test_02_expands_blocks():
+    source = '    processor 6502\n    org $f000\n' + SLEEP + '    sleep 2\n    REPT 2\n    inx\n    REPEND\n'
+    rom = load_asm02().Session().assemble(source)
+    assert rom[:4] == b'\xea\xea\xe8\xe8'
@@ -0,0 +1,25 @@
+from asm import Assembler
+from fuzz import load_disa
+from opcodes import DECODE, ENCODE, ENCODE_ILLEGAL, MODE_LENGTH
+
+
+def test_documented_opcodes_round_trip():
+    for (mnemonic, mode), (opcode, length, cycles) in ENCODE.items():
+        assert DECODE[opcode] == (mnemonic, mode, length, cycles)
+        assert length == MODE_LENGTH[mode]
+
+
+def test_documented_opcodes_are_distinct():
+    opcodes = [opcode for opcode, _, _ in ENCODE.values()]
+    assert len(opcodes) == len(set(opcodes)) == 151
+
+
+def test_illegal_opcodes_never_replace_documented_ones():
+    for key, entry in ENCODE.items():
+        assert ENCODE_ILLEGAL[key] == entry
+
+
+def test_assembled_bytes_decode_to_the_source():
+    lines = ['lda #$01', 'sta $80', 'ldx $1234,y', 'jmp ($fffc)', 'lda ($80),y', 'asl a']
+    binary = Assembler().assemble(''.join(f'    {line}\n' for line in lines))
+    assert [text for _, _, text in load_disa().decode(binary)] == lines
@@ -0,0 +1,51 @@
+from asm import Assembler
+
+SOURCE = '''\
+tmp = $80
+WSYNC = $02
+start:
+    lda #1
+    sta tmp+1
+    sta tmp+1
+    lda #1
+    ldx #1
+    sta WSYNC
+    lda #1
+    lda #1
+    sta $90
+    jmp start
+'''
+
+
+def assemble(source, optimise):
+    assembler = Assembler(optimise=optimise)
+    return bytes(assembler.assemble(source)), assembler.peephole
+
+
+def test_savings_are_reported_and_real():
+    plain, _ = assemble(SOURCE, False)
+    optimised, report = assemble(SOURCE, True)
+    assert [(number, what) for number, _, what, _, _ in report] == [
+        (5, 'dead store to $81, overwritten on line 6'),
+        (7, 'LDA #$01: A already holds it'),
+        (8, 'LDX #$01 -> TAX'),
+    ]
+    # the dead store is costed in zero page, through the expression
+    assert [(saved, cycles) for *_, saved, cycles in report] == [(2, 3), (2, 2), (1, 0)]
+    assert len(plain) - len(optimised) == sum(saved for *_, saved, _ in report)
+
+
+def test_code_after_wsync_is_left_as_written():
+    optimised, _ = assemble(SOURCE, True)
+    assert optimised.endswith(bytes.fromhex('8502' 'a901' 'a901' '8590' '4c0000'))
+
+
+def test_timed_comment_keeps_a_line():
+    source = SOURCE.replace('    sta tmp+1\n', '    sta tmp+1 ; @timed\n', 1)
+    _, report = assemble(source, True)
+    assert all(number != 5 for number, *_ in report)
+
+
+def test_nothing_to_do():
+    source = 'start:\n    lda #1\n    sta $80\n    jmp start\n'
+    assert assemble(source, True) == (assemble(source, False)[0], [])
@@ -0,0 +1,30 @@
+from phases import Profiler
+
+import tracemalloc
+
+
+def test_format_publishes_timed_phases_and_stops_tracing():
+    published = []
+    profiler = Profiler(memory=True, hooks=[published.append])
+    tokenise = profiler.timed('tokenise', str.split)
+    with profiler.phase('parse') as phase:
+        for line in ('lda #1', 'sta $80'):
+            tokenise(line)
+        phase.count(lines=2)
+    lines = profiler.format()
+    assert not tracemalloc.is_tracing()
+    assert [record['name'] for record in published] == ['parse', 'tokenise']
+    assert published[1]['lines'] == 2
+    # phases are listed in the order they started, timed() ones included
+    assert [line.split()[0] for line in lines] == ['tokenise', 'parse']
+    assert all(line.endswith('2 lines') for line in lines)
+
+
+def test_report_after_format_publishes_once():
+    published = []
+    profiler = Profiler(hooks=[published.append])
+    profiler.timed('tokenise', str.split)('nop')
+    profiler.format()
+    report = profiler.report()
+    assert len(published) == 1
+    assert [phase['name'] for phase in report['phases']] == ['tokenise']
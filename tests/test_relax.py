@@ -0,0 +1,63 @@
+from asm import Assembler
+from incremental import IncrementalAssembler
+
+import pytest
+
+
+def both(source):
+    """Assembler's and IncrementalAssembler's bytes, which must agree."""
+    binary = bytes(Assembler().assemble(source))
+    assert IncrementalAssembler().update(source)[0] == binary
+    return binary
+
+
+@pytest.mark.parametrize('source, expected', [
+    ('v: nop\n    stx v,y\n', 'ea9600'),
+    ('var = $80\n    stx var,y\n    sty var,x\n', '96809480'),
+    ('    stx var,y\nvar = $80\n', '9680'),
+    ('    sty later,x\n    nop\nlater:\n', '9403ea'),
+])
+def test_zero_page_only_modes_take_symbols(source, expected):
+    assert both(source) == bytes.fromhex(expected)
+
+
+@pytest.mark.parametrize('assemble', [
+    lambda source: Assembler().assemble(source),
+    lambda source: IncrementalAssembler().update(source),
+])
+def test_zero_page_only_modes_reject_wide_symbols(assemble):
+    with pytest.raises(ValueError, match=r'STX: var is \$0180, outside zero page'):
+        assemble('var = $180\n    stx var,y\n')
+
+
+@pytest.mark.parametrize('source, expected, savings', [
+    # backward references were always zero page, so nothing is saved
+    ('var = $80\n    lda var\n', 'a580', (0, 0, 0)),
+    # lda 1 byte 1 cycle, sta zp,x 1 and 1, inc 1 and 1
+    ('    lda var\n    sta var,x\n    inc var\nvar = $80\n', 'a5809580e680', (3, 3, 3)),
+    ('    jmp next\nnext:\n    lda var\nvar = $80\n', '4c0300a580', (1, 1, 1)),
+    # STX has no absolute,Y form to have saved anything over
+    ('    stx var,y\nvar = $80\n', '9680', (0, 0, 0)),
+])
+def test_forward_references_get_zero_page(source, expected, savings):
+    assembler = Assembler()
+    assert assembler.assemble(source) == bytes.fromhex(expected)
+    report = assembler.savings
+    assert (report['narrowed'], report['bytes'], report['cycles']) == savings
+
+
+@pytest.mark.parametrize('nops, narrow', [(251, True), (253, False)])
+def test_narrowing_moves_labels_into_zero_page(nops, narrow):
+    # two wide loads put p and q past $FF; narrowing both brings them back
+    source = '    lda p\n    lda q\n' + '    nop\n' * nops + 'p:\nq:\n'
+    assembler = Assembler()
+    binary = assembler.assemble(source)
+    if narrow:
+        address = 4 + nops
+        assert binary[:4] == bytes((0xA5, address, 0xA5, address))
+        assert assembler.savings['narrowed'] == 2
+    else:
+        address = 6 + nops
+        assert binary[:6] == bytes((0xAD, address & 0xFF, address >> 8) * 2)
+        assert assembler.savings['narrowed'] == 0
+    assert IncrementalAssembler().update(source)[0] == binary
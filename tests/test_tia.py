@@ -0,0 +1,113 @@
+import numpy as np
+
+import tia
+from tia import (CLOCKS_PER_LINE, COLUBK, COLUPF, CTRLPF, DEFAULT_TOP, ENABL, HBLANK,
+                 HEIGHT, LINES, PF1, RESBL, VBLANK, VSYNC, WIDTH, Trace, render_frames)
+
+import pytest
+
+FRAME = LINES * CLOCKS_PER_LINE
+
+
+def clock(line, position=0):
+    return line * CLOCKS_PER_LINE + position
+
+
+def frames(writes, full=False, count=1):
+    """Render count frames, each opened by VSYNC and given writes."""
+    trace = []
+    for n in range(count + 1):
+        origin = n * FRAME
+        trace += [(origin, VSYNC, 0x02), (origin + clock(3), VSYNC, 0x00)]
+        if n < count:
+            trace += [(origin + at, register, value) for at, register, value in writes]
+    return list(render_frames(trace, full=full))
+
+
+def test_background_fills_the_picture():
+    [frame] = frames([(clock(10), COLUBK, 0x84)])
+    assert frame.shape == (HEIGHT, WIDTH)
+    assert (frame == 0x84).all()
+
+
+def test_full_frames_keep_the_blanking():
+    [frame] = frames([(clock(10, HBLANK), COLUBK, 0x84)], full=True)
+    assert frame.shape == (LINES, CLOCKS_PER_LINE)
+    assert (frame[:10] == 0).all()
+    assert (frame[10, :HBLANK] == 0).all()
+    assert (frame[10, HBLANK:] == 0x84).all()
+    assert (frame[11:, HBLANK:] == 0x84).all()
+    # horizontal blank stays black on the lines after it
+    assert (frame[11:, :HBLANK] == 0).all()
+
+
+def test_trailing_frame_without_vsync_is_dropped():
+    trace = [(0, VSYNC, 0x02), (clock(3), VSYNC, 0), (clock(10), COLUBK, 0x84)]
+    assert list(render_frames(trace)) == []
+
+
+def test_picture_starts_after_vblank():
+    writes = [(clock(0), VBLANK, 0x02), (clock(0), COLUBK, 0x84),
+              (clock(29), VBLANK, 0x00), (clock(100), COLUBK, 0x1E)]
+    [frame] = frames(writes, full=True)
+    [picture] = frames(writes)
+    # drawn from where VBLANK clears, shown from the next whole line
+    top = 30
+    assert (frame[:29] == 0).all()
+    assert (frame[29, HBLANK:] == 0x84).all()
+    assert (picture == frame[top:top + HEIGHT, HBLANK:]).all()
+    assert picture[0, 0] == 0x84
+    assert picture[100 - top, 0] == 0x1E
+
+
+def test_picture_defaults_to_line_40():
+    [frame] = frames([(clock(DEFAULT_TOP), COLUBK, 0x84)])
+    assert (frame == 0x84).all()
+
+
+@pytest.mark.parametrize('ctrlpf, right', [(0x00, range(96, 100)), (0x01, range(140, 144))])
+def test_playfield(ctrlpf, right):
+    writes = [(clock(0), COLUPF, 0x46), (clock(0), CTRLPF, ctrlpf), (clock(0), PF1, 0x80)]
+    [frame] = frames(writes)
+    # PF1 bit 7 is the fifth playfield bit, four clocks wide
+    lit = np.flatnonzero(frame[0] == 0x46)
+    assert list(lit) == list(range(16, 20)) + list(right)
+    assert (frame == frame[0]).all()
+
+
+def test_ball():
+    writes = [(clock(0), COLUPF, 0x46), (clock(0), CTRLPF, 0x20),
+              (clock(50, HBLANK + 20), RESBL, 0), (clock(60), ENABL, 0x02),
+              (clock(70), ENABL, 0x00)]
+    [frame] = frames(writes, full=True)
+    assert (frame[60, HBLANK:] == 0x46).sum() == 4
+    assert list(np.flatnonzero(frame[65, HBLANK:] == 0x46)) == [24, 25, 26, 27]
+    assert not (frame[70:] == 0x46).any()
+
+
+def test_slices_and_gather_agree(monkeypatch):
+    # a colour change per line, partway along it
+    writes = [(clock(line, 100 + line % 50), COLUBK, line & 0xFE) for line in range(3, LINES)]
+    [gathered] = frames(writes, full=True)
+    monkeypatch.setattr(tia, 'SLICE_SEGMENTS', LINES)
+    [sliced] = frames(writes, full=True)
+    assert (gathered == sliced).all()
+    assert gathered[50, 99] == 48 and gathered[50, 100] == 50
+
+
+def test_frames_share_the_line_cache():
+    cache = tia.LineCache()
+    trace = []
+    for n in range(3):
+        trace += [(n * FRAME, VSYNC, 0x02), (n * FRAME + clock(3), VSYNC, 0),
+                  (n * FRAME + clock(10), COLUBK, 0x84)]
+    rendered = list(render_frames(trace, cache=cache))
+    assert len(rendered) == 2
+    assert (rendered[0] == rendered[1]).all()
+    assert len(cache.ids) == 2
+
+
+def test_trace_records_colour_clocks():
+    trace = Trace()
+    trace(COLUBK, 0x84, 76)
+    assert trace == [(clock(1), COLUBK, 0x84)]
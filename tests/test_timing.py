@@ -0,0 +1,99 @@
+from asm import Assembler
+from listing import listing_lines
+from timing import CYCLES_PER_LINE, analyse, annotate, format_warnings, instruction_cycles
+
+import pytest
+
+KERNEL = '''\
+WSYNC = $02
+start:
+    sta WSYNC
+    ldx #10
+loop:
+    lda table,x
+    dex
+    bne loop
+    sta WSYNC
+    REPT {nops}
+    nop
+    REPEND
+    sta WSYNC
+    jmp start
+table:
+    brk
+'''
+
+
+def report(nops):
+    assembler = Assembler()
+    assembler.assemble(KERNEL.format(nops=nops))
+    return assembler, assembler.timing_report()
+
+
+def test_span_totals():
+    _, timing = report(30)
+    spans = [(span['first_line'], span['last_line'], span['min'], span['max'])
+             for span in timing['spans']]
+    # a span runs up to and including the WSYNC write that ends it
+    assert spans[0] == (3, 3, 3, 3)
+    # ldx 2, lda zp,x 4, dex 2, bne 2 falling through or 3 taken, sta 3
+    assert spans[1] == (4, 9, 13, 14)
+    # the REPT's copies all carry the line of the REPT
+    assert spans[2] == (10, 13, 30 * 2 + 3, 30 * 2 + 3)
+    assert not any(span['warn'] for span in timing['spans'])
+    assert format_warnings(timing) == []
+
+
+@pytest.mark.parametrize('nops, over', [(36, False), (37, True)])
+def test_budget(nops, over):
+    _, timing = report(nops)
+    span = timing['spans'][2]
+    assert span['aligned'] and span['ends_on_wsync']
+    assert span['over'] == over == (nops * 2 + 3 > CYCLES_PER_LINE)
+    messages = format_warnings(timing, 'kernel.asm')
+    assert messages == ([f'kernel.asm:10-13: scanline over budget, {nops * 2 + 3} of 76 cycles']
+                        if over else [])
+
+
+def test_branch_and_page_cross_cycles():
+    # a branch taken across a page costs 2 more, within it 1
+    assert instruction_cycles(0xD0, 'BNE', 'relative', 2, 0x10F0, 0x1100) == (2, 4)
+    assert instruction_cycles(0xD0, 'BNE', 'relative', 2, 0x1000, 0x1010) == (2, 3)
+    # lda abs,x may cross a page, unless the base is page aligned
+    assert instruction_cycles(0xBD, 'LDA', 'absolute_x', 4, 0, 0x1234) == (4, 5)
+    assert instruction_cycles(0xBD, 'LDA', 'absolute_x', 4, 0, 0x1200) == (4, 4)
+
+
+def test_wsync_mirrors_end_a_span():
+    instructions = [(1, 0, 0xEA, 'NOP', 'implied', 2, None),
+                    (2, 1, 0x8D, 'STA', 'absolute', 4, 0x0042),
+                    (3, 4, 0xEA, 'NOP', 'implied', 2, None)]
+    assert [span['max'] for span in analyse(instructions)['spans']] == [6, 2]
+
+
+def test_annotate():
+    lines = list(annotate(['    nop', '    sta $02'], analyse([
+        (1, 0, 0xEA, 'NOP', 'implied', 2, None),
+        (2, 1, 0x85, 'STA', 'zeropage', 3, 2)])))
+    assert lines == ['0000     2       2      nop', '0001     3       5      sta $02']
+
+
+def test_listing_has_cycle_columns():
+    assembler, timing = report(37)
+    source = KERNEL.format(nops=37).splitlines()
+    listing = list(listing_lines(source, assembler.records, assembler.output, timing=timing))
+    assert listing[5] == '    6  0004  B5 35         4       6                    lda table,x\n'
+    assert listing[7] == '    8  0007  D0 FB       2-3   10-11                    bne loop\n'
+    # the REPT's copies follow its line, then the WSYNC closing the span
+    # and the marker
+    assert listing[9] == '   10  000B  EA            2       2                    REPT 37\n'
+    assert listing[45] == '       002F  EA            2      74  \n'
+    assert listing[48] == '   13  0030  85 02         3      77                    sta WSYNC\n'
+    assert listing[49].strip() == '; ^ over 76 cycles'
+
+
+def test_listing_without_timing_is_unchanged():
+    assembler, _ = report(1)
+    source = KERNEL.format(nops=1).splitlines()
+    listing = list(listing_lines(source, assembler.records, assembler.output))
+    assert listing[2] == '    3  0000  85 02                       sta WSYNC\n'